@@ -0,0 +1 @@
+# DNS service bot; run it with main.py
@@ -0,0 +1,1130 @@
+# Admin panel
+# The admin panel buttons, the admin text inputs and the broadcast commands.
+# Imported on the first admin interaction (see lazy.py), not at startup.
+import logging
+import secrets
+from datetime import datetime
+from telegram import (
+    Update,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+)
+from telegram.ext import ContextTypes
+
+from dnsbot import config, data
+from dnsbot.states import (
+    ADMIN_AMOUNT_INPUT,
+    ADMIN_BROADCAST_MESSAGE,
+    ADMIN_GIFT_AMOUNT_INPUT,
+    ADMIN_PANEL,
+    ADMIN_USER_ID_INPUT,
+    MAIN_MENU,
+)
+from dnsbot.data import (
+    adjust_balance,
+    aggregates,
+    bot_config,
+    count_expiring_services,
+    deliverable_users,
+    get_expiring_services,
+    gregorian_to_persian,
+    is_unreachable_error,
+    mark_user_unreachable,
+    refresh_pending_payments,
+    remove_users,
+    report_cache,
+    save_user_data,
+    server_data,
+    user_data,
+    user_snapshots,
+    warm_up,
+)
+from dnsbot.config import is_admin, save_bot_config, save_server_data
+from dnsbot.outbound import LANE_BULK, LANE_TRANSACTIONAL, outbound
+from dnsbot.flood import flood_limiter
+from dnsbot.keyboards import keyboards
+from dnsbot.broadcast import (
+    BroadcastJob,
+    broadcast_jobs,
+    broadcast_recipients,
+    broadcast_task_running,
+    format_expiry_notice,
+    save_broadcast_jobs,
+    start_broadcast_job,
+)
+from dnsbot.reports import (
+    build_cohort_report,
+    build_income_report,
+    build_ltv_report,
+    build_sales_report,
+    build_users_report,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# Callback router
+# Callback data is looked up in a registry of exact keys and prefixes instead
+# of walking an if/elif chain. The admin panel state sends every press to
+# admin_callback, which answers presses without a route itself.
+class CallbackRouter:
+    def __init__(self):
+        self._exact = {}
+        self._prefixes = {}
+        self._prefix_lengths = []  # distinct prefix lengths, longest first
+
+    def _register(self, table, keys, handler):
+        for key in keys:
+            if key in table:
+                raise ValueError(f"Duplicate callback route: {key}")
+            table[key] = handler
+
+    def exact(self, *keys):
+        def register(handler):
+            self._register(self._exact, keys, handler)
+            return handler
+
+        return register
+
+    def prefix(self, *prefixes):
+        def register(handler):
+            self._register(self._prefixes, prefixes, handler)
+            self._prefix_lengths = sorted(
+                {len(prefix) for prefix in self._prefixes}, reverse=True
+            )
+            return handler
+
+        return register
+
+    def resolve(self, data):
+        """Return the handler for `data`; exact keys win, then the longest prefix"""
+        handler = self._exact.get(data)
+        if handler is not None:
+            return handler
+        for length in self._prefix_lengths:
+            handler = self._prefixes.get(data[:length])
+            if handler is not None:
+                return handler
+        return None
+
+
+admin_router = CallbackRouter()
+
+
+async def unknown_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Tell the user a button has no handler instead of ignoring the press"""
+    query = update.callback_query
+    logger.warning(
+        f"Unhandled callback {query.data!r} from user {query.from_user.id}"
+    )
+    await query.answer("⚠️ این گزینه در حال حاضر در دسترس نیست.", show_alert=True)
+
+
+async def admin_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    handler = admin_router.resolve(query.data)
+    if handler is None:
+        return await unknown_callback(update, context)
+    await query.answer()
+
+    if not is_admin(query.from_user.id):
+        await query.edit_message_text(
+            "❌ شما دسترسی به پنل مدیریت را ندارید.",
+            reply_markup=keyboards.back("back_to_main"),
+        )
+        return MAIN_MENU
+
+    # Admin screens read the indexes that are built during warm-up
+    warm_up.ensure()
+    return await handler(update, context, query)
+
+
+@admin_router.exact("manage_users")
+async def admin_manage_users(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    # Improved layout for user management
+    keyboard = [
+        [
+            InlineKeyboardButton(
+                "➕ افزایش موجودی", callback_data="add_user_balance"
+            ),
+            InlineKeyboardButton("👤 اطلاعات کاربر", callback_data="view_user_info"),
+        ],
+        [
+            InlineKeyboardButton("🎁 اعطای هدیه", callback_data="gift_all_users"),
+            InlineKeyboardButton(
+                "📣 پیام همگانی", callback_data="broadcast_message"
+            ),
+        ],
+        [
+            InlineKeyboardButton(
+                "👛 درخواست‌های پرداخت", callback_data="payment_requests"
+            ),
+            InlineKeyboardButton(
+                "🗑️ پاکسازی کاربران", callback_data="clean_inactive_users"
+            ),
+        ],
+        [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_admin")],
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+
+    await query.edit_message_text("👥 مدیریت کاربران", reply_markup=reply_markup)
+    return ADMIN_PANEL
+
+
+@admin_router.exact("add_user_balance")
+async def admin_add_user_balance(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    await query.edit_message_text(
+        "لطفا شناسه (ID) کاربر مورد نظر را وارد کنید:",
+        reply_markup=keyboards.back("back_to_admin"),
+    )
+    return ADMIN_USER_ID_INPUT
+
+
+@admin_router.exact("gift_all_users")
+async def admin_gift_all_users(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    await query.edit_message_text(
+        "لطفا مبلغ هدیه (به تومان) برای همه کاربران را وارد کنید:",
+        reply_markup=keyboards.back("back_to_admin"),
+    )
+    return ADMIN_GIFT_AMOUNT_INPUT
+
+
+@admin_router.exact("view_user_info")
+async def admin_view_user_info(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    await query.edit_message_text(
+        "لطفا شناسه (ID) کاربر مورد نظر را وارد کنید:",
+        reply_markup=keyboards.back("back_to_admin"),
+    )
+    return ADMIN_USER_ID_INPUT
+
+
+@admin_router.exact("manage_servers")
+async def admin_manage_servers(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    reply_markup = keyboards.get("manage_servers")
+
+    await query.edit_message_text(
+        "🌐 مدیریت سرورها\n" "برای فعال/غیرفعال کردن یک لوکیشن، روی آن کلیک کنید:",
+        reply_markup=reply_markup,
+    )
+    return ADMIN_PANEL
+
+
+@admin_router.exact("bot_settings")
+async def admin_bot_settings(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    status = "فعال ✅" if bot_config.get("is_active", True) else "غیرفعال ❌"
+    keyboard = [
+        [
+            InlineKeyboardButton(
+                f"وضعیت ربات: {status}", callback_data="toggle_bot_status"
+            )
+        ],
+        [
+            InlineKeyboardButton("➕ افزودن ادمین", callback_data="add_admin"),
+            InlineKeyboardButton("➖ حذف ادمین", callback_data="remove_admin"),
+            InlineKeyboardButton("🔄 بروزرسانی", callback_data="update_prices"),
+        ],
+        [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_admin")],
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+
+    await query.edit_message_text("⚙️ تنظیمات ربات", reply_markup=reply_markup)
+    return ADMIN_PANEL
+
+
+@admin_router.prefix("toggle_location_")
+async def admin_toggle_location(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    location = query.data.split("_")[2]
+    server_data["locations"][location]["active"] = not server_data["locations"][
+        location
+    ]["active"]
+    save_server_data()
+
+    reply_markup = keyboards.get("manage_servers")
+
+    await query.edit_message_text(
+        "🌐 مدیریت سرورها\n" "برای فعال/غیرفعال کردن یک لوکیشن، روی آن کلیک کنید:",
+        reply_markup=reply_markup,
+    )
+    return ADMIN_PANEL
+
+
+@admin_router.exact("toggle_bot_status")
+async def admin_toggle_bot_status(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    bot_config["is_active"] = not bot_config.get("is_active", True)
+    save_bot_config()
+
+    # Refresh the bot settings menu
+    status = "فعال ✅" if bot_config.get("is_active", True) else "غیرفعال ❌"
+    keyboard = [
+        [
+            InlineKeyboardButton(
+                f"وضعیت ربات: {status}", callback_data="toggle_bot_status"
+            )
+        ],
+        [InlineKeyboardButton("➕ افزودن ادمین", callback_data="add_admin")],
+        [InlineKeyboardButton("➖ حذف ادمین", callback_data="remove_admin")],
+        [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_admin")],
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+
+    await query.edit_message_text("⚙️ تنظیمات ربات", reply_markup=reply_markup)
+    return ADMIN_PANEL
+
+
+@admin_router.exact("stats")
+async def admin_stats(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    await query.edit_message_text(
+        f"📊 آمار ربات:\n\n"
+        f"👥 تعداد کاربران: {aggregates.users}\n"
+        f"🌐 تعداد سرویس‌های فروخته شده: {aggregates.total_services}\n"
+        f"💰 مجموع موجودی کاربران: {aggregates.total_balance} تومان\n\n"
+        f"{outbound.format_stats()}\n"
+        f"{flood_limiter.format_stats()}\n"
+        f"{report_cache.format_stats()}",
+        reply_markup=InlineKeyboardMarkup(
+            [
+                [
+                    InlineKeyboardButton(
+                        "🔁 بازسازی آمار", callback_data="rebuild_stats"
+                    )
+                ],
+                [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_admin")],
+            ]
+        ),
+    )
+    return ADMIN_PANEL
+
+
+@admin_router.exact("rebuild_stats")
+async def admin_rebuild_stats(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    # Recompute the counters from scratch and report any drift
+    before = aggregates.to_dict()
+    aggregates.rebuild()
+    after = aggregates.to_dict()
+    report_cache.clear()
+    save_user_data()
+
+    drifted = [key for key in after if before.get(key) != after[key]]
+    if drifted:
+        logger.warning(f"Aggregates drifted and were rebuilt: {drifted}")
+        result = "⚠️ مغایرت در آمار پیدا و اصلاح شد:\n" + "\n".join(
+            f"🔸 {key}" for key in drifted
+        )
+    else:
+        result = "✅ آمار با داده‌ها مطابقت دارد."
+
+    await query.edit_message_text(
+        result,
+        reply_markup=keyboards.back("stats"),
+    )
+    return ADMIN_PANEL
+
+
+@admin_router.exact("broadcast_message")
+async def admin_broadcast_message(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    await query.edit_message_text(
+        "📣 لطفا پیام خود را برای ارسال به تمامی کاربران وارد کنید:",
+        reply_markup=InlineKeyboardMarkup(
+            [[InlineKeyboardButton("🔙 انصراف", callback_data="back_to_admin")]]
+        ),
+    )
+    return ADMIN_BROADCAST_MESSAGE
+
+
+@admin_router.exact("payment_requests")
+async def admin_payment_requests(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    # Get pending payment requests
+    pending_payments = refresh_pending_payments()
+
+    if not pending_payments:
+        await query.edit_message_text(
+            "📭 در حال حاضر هیچ درخواست پرداختی در انتظار تایید وجود ندارد.",
+            reply_markup=keyboards.back("back_to_admin"),
+        )
+        return ADMIN_PANEL
+
+    # Count pending payments
+    pending_count = report_cache.get_or_build(
+        "pending_payments_count",
+        lambda: sum(
+            1 for p in pending_payments.values() if p.get("status") == "pending"
+        ),
+        depends_on=("payments",),
+    )
+
+    await query.edit_message_text(
+        f"👛 *درخواست‌های پرداخت*\n\n"
+        f"تعداد درخواست‌های در انتظار: {pending_count}\n\n"
+        f"برای مشاهده و مدیریت درخواست‌ها، از منوی زیر استفاده کنید:",
+        reply_markup=InlineKeyboardMarkup(
+            [
+                [
+                    InlineKeyboardButton(
+                        "👁️ مشاهده درخواست‌ها",
+                        callback_data="view_pending_payments",
+                    )
+                ],
+                [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_admin")],
+            ]
+        ),
+        parse_mode="Markdown",
+    )
+    return ADMIN_PANEL
+
+
+@admin_router.exact("view_pending_payments")
+async def admin_view_pending_payments(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    # Get pending payment requests
+    pending_payments = refresh_pending_payments()
+
+    # Filter only pending payments
+    pending = {
+        k: v for k, v in pending_payments.items() if v.get("status") == "pending"
+    }
+
+    if not pending:
+        await query.edit_message_text(
+            "📭 در حال حاضر هیچ درخواست پرداختی در انتظار تایید وجود ندارد.",
+            reply_markup=InlineKeyboardMarkup(
+                [
+                    [
+                        InlineKeyboardButton(
+                            "🔙 بازگشت", callback_data="payment_requests"
+                        )
+                    ]
+                ]
+            ),
+        )
+        return ADMIN_PANEL
+
+    # Show the most recent pending payment
+    payment_id, payment_info = next(iter(pending.items()))
+
+    user_id = payment_info.get("user_id")
+    username = payment_info.get("username", "بدون نام کاربری")
+    amount = payment_info.get("amount", 0)
+    timestamp = datetime.fromisoformat(payment_info.get("timestamp")).strftime(
+        "%Y-%m-%d %H:%M:%S"
+    )
+    receipt_type = (
+        "تصویر" if payment_info.get("receipt_type") == "photo" else "شماره پیگیری"
+    )
+
+    # Create keyboard with approve/reject buttons
+    keyboard = [
+        [
+            InlineKeyboardButton(
+                "✅ تایید", callback_data=f"approve_payment_{payment_id}"
+            ),
+            InlineKeyboardButton(
+                "❌ رد", callback_data=f"reject_payment_{payment_id}"
+            ),
+        ],
+        [InlineKeyboardButton("🔙 بازگشت", callback_data="payment_requests")],
+    ]
+
+    # If there are more pending payments, add next button
+    if len(pending) > 1:
+        keyboard.insert(
+            1,
+            [InlineKeyboardButton("⏩ بعدی", callback_data="next_pending_payment")],
+        )
+
+    reply_markup = InlineKeyboardMarkup(keyboard)
+
+    message = (
+        f"🧾 *درخواست پرداخت #{payment_id[-6:]}*\n\n"
+        f"👤 کاربر: @{username}\n"
+        f"🆔 شناسه: `{user_id}`\n"
+        f"💰 مبلغ: {amount:,} تومان\n"
+        f"🕒 زمان: {timestamp}\n"
+        f"📝 نوع رسید: {receipt_type}\n\n"
+    )
+
+    if payment_info.get("receipt_type") == "text":
+        message += f"📄 متن رسید: `{payment_info.get('receipt_data')}`"
+
+    await query.edit_message_text(
+        message, reply_markup=reply_markup, parse_mode="Markdown"
+    )
+
+    # If it's a photo receipt, send the photo
+    if payment_info.get("receipt_type") == "photo":
+        try:
+            await outbound.submit(
+                LANE_TRANSACTIONAL,
+                query.message.chat_id,
+                context.bot.send_photo,
+                chat_id=query.message.chat_id,
+                photo=payment_info.get("receipt_data"),
+                caption=f"🧾 تصویر رسید پرداخت #{payment_id[-6:]}",
+            )
+        except Exception as e:
+            logger.error(f"Error sending receipt photo: {e}")
+            await outbound.send_message(
+                context.bot,
+                chat_id=query.message.chat_id, text="❌ خطا در نمایش تصویر رسید"
+            )
+
+    return ADMIN_PANEL
+
+
+@admin_router.prefix("approve_payment_", "reject_payment_")
+async def admin_review_payment(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    is_approved = query.data.startswith("approve_payment_")
+    # Payment ids contain underscores themselves (pay_<time>_<user>)
+    payment_id = query.data.split("_", 2)[2]
+    admin_id = str(query.from_user.id)
+
+    # Get payment info
+    pending_payments = refresh_pending_payments()
+    if payment_id not in pending_payments:
+        await query.edit_message_text(
+            "❌ درخواست پرداخت یافت نشد یا قبلاً پردازش شده است.",
+            reply_markup=InlineKeyboardMarkup(
+                [
+                    [
+                        InlineKeyboardButton(
+                            "🔙 بازگشت", callback_data="payment_requests"
+                        )
+                    ]
+                ]
+            ),
+        )
+        return ADMIN_PANEL
+
+    payment_info = pending_payments[payment_id]
+
+    # Check if payment is already processed
+    if payment_info.get("status") != "pending":
+        await query.edit_message_text(
+            f"⚠️ این درخواست قبلاً {payment_info.get('status')} شده است.",
+            reply_markup=InlineKeyboardMarkup(
+                [
+                    [
+                        InlineKeyboardButton(
+                            "🔙 بازگشت", callback_data="payment_requests"
+                        )
+                    ]
+                ]
+            ),
+        )
+        return ADMIN_PANEL
+
+    user_id = payment_info.get("user_id")
+    amount = payment_info.get("amount", 0)
+
+    # Update payment status
+    payment_info["status"] = "approved" if is_approved else "rejected"
+    payment_info["processed_by"] = admin_id
+    payment_info["processed_at"] = datetime.now().isoformat()
+    data.storage.save_payment(payment_id, payment_info)
+    report_cache.invalidate("payments")
+
+    # If approved, add balance to user
+    if is_approved and user_id in user_data:
+        # Ensure we're updating the correct user
+        adjust_balance(user_id, amount)
+        logger.info(
+            f"Updated balance for user {user_id}: +{amount} toman, new balance: {user_data[user_id]['balance']}"
+        )
+
+    # Save changes to user_data
+    save_success = save_user_data()
+
+    if not save_success:
+        await query.edit_message_text(
+            "❌ خطا در ذخیره تغییرات. لطفاً دوباره تلاش کنید.",
+            reply_markup=InlineKeyboardMarkup(
+                [
+                    [
+                        InlineKeyboardButton(
+                            "🔙 بازگشت", callback_data="payment_requests"
+                        )
+                    ]
+                ]
+            ),
+        )
+        return ADMIN_PANEL
+
+    # Notify user
+    try:
+        if is_approved:
+            await outbound.send_message(
+                context.bot,
+                chat_id=int(user_id),
+                text=f"✅ *افزایش موجودی تایید شد*\n\n"
+                f"درخواست افزایش موجودی شما به مبلغ {amount:,} تومان تایید و به کیف پول شما اضافه شد.\n"
+                f"موجودی فعلی: {user_data[user_id]['balance']:,} تومان",
+                parse_mode="Markdown",
+            )
+        else:
+            await outbound.send_message(
+                context.bot,
+                chat_id=int(user_id),
+                text=f"❌ *افزایش موجودی تایید نشد*\n\n"
+                f"متأسفانه درخواست افزایش موجودی شما به مبلغ {amount:,} تومان تایید نشد.\n"
+                f"لطفاً با پشتیبانی تماس بگیرید یا مجدداً تلاش کنید.",
+                parse_mode="Markdown",
+            )
+    except Exception as e:
+        logger.error(f"Error notifying user {user_id}: {e}")
+        # Continue even if notification fails
+
+    # Return to payment requests menu
+    action = "تایید" if is_approved else "رد"
+    await query.edit_message_text(
+        f"✅ درخواست پرداخت با موفقیت {action} شد.\n\n"
+        f"👤 کاربر: {payment_info.get('username')}\n"
+        f"💰 مبلغ: {amount:,} تومان\n"
+        f"🕒 زمان پردازش: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+        reply_markup=keyboards.back("payment_requests"),
+    )
+    return ADMIN_PANEL
+
+
+@admin_router.exact("manage_services")
+async def admin_manage_services(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    # Calculate expiring services (services that expire in less than 7 days)
+    expiring_count = count_expiring_services(7)
+
+    keyboard = [
+        [
+            InlineKeyboardButton(
+                "سرویس‌های رو به انقضا", callback_data="view_expiring_services"
+            ),
+            InlineKeyboardButton(
+                "تمدید سرویس کاربر", callback_data="extend_user_service"
+            ),
+        ],
+        [
+            InlineKeyboardButton("حذف سرویس", callback_data="remove_service"),
+            InlineKeyboardButton(
+                "افزودن سرویس رایگان", callback_data="add_free_service"
+            ),
+        ],
+        [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_admin")],
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+
+    await query.edit_message_text(
+        f"🔄 *مدیریت سرویس‌ها*\n\n"
+        f"تعداد سرویس‌های در حال انقضا (۷ روز آینده): {expiring_count}\n\n"
+        f"از منوی زیر گزینه مورد نظر را انتخاب کنید:",
+        reply_markup=reply_markup,
+        parse_mode="Markdown",
+    )
+    return ADMIN_PANEL
+
+
+@admin_router.exact("view_expiring_services")
+async def admin_view_expiring_services(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    # Show list of services that expire in less than 7 days
+    expiring_count = count_expiring_services(7)
+    expiring_services = get_expiring_services(7, limit=10)
+
+    if not expiring_services:
+        await query.edit_message_text(
+            "✅ در حال حاضر هیچ سرویسی در آستانه انقضا نیست.",
+            reply_markup=InlineKeyboardMarkup(
+                [
+                    [
+                        InlineKeyboardButton(
+                            "🔙 بازگشت", callback_data="manage_services"
+                        )
+                    ]
+                ]
+            ),
+        )
+        return ADMIN_PANEL
+
+    # Format message with expiring services (already sorted by days left)
+    message = "📊 *سرویس‌های در حال انقضا:*\n\n"
+
+    for idx, service in enumerate(
+        expiring_services[:10], 1
+    ):  # Show max 10 services
+        loc_name = server_data["locations"][service["location"]]["name"]
+        loc_flag = server_data["locations"][service["location"]]["flag"]
+
+        message += (
+            f"*{idx}. کاربر:* @{service['username']} (ID: `{service['user_id']}`)\n"
+        )
+        message += f"   📍 لوکیشن: {loc_flag} {loc_name}\n"
+        message += f"   ⏱️ زمان باقی‌مانده: {service['days_left']} روز\n\n"
+
+    if expiring_count > 10:
+        message += f"و {expiring_count - 10} سرویس دیگر...\n"
+
+    # Add notification option
+    keyboard = [
+        [
+            InlineKeyboardButton(
+                "📣 اطلاع‌رسانی به کاربران", callback_data="notify_expiring_users"
+            )
+        ],
+        [InlineKeyboardButton("🔙 بازگشت", callback_data="manage_services")],
+    ]
+
+    await query.edit_message_text(
+        message, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode="Markdown"
+    )
+    return ADMIN_PANEL
+
+
+@admin_router.exact("notify_expiring_users")
+async def admin_notify_expiring_users(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    # Notify users with expiring services (one notice per user, about the
+    # service that expires first)
+    notified_users = set()
+    unreachable_found = False
+
+    for expiring in get_expiring_services(7):
+        user_id = expiring["user_id"]
+        if user_id in notified_users or user_id not in deliverable_users:
+            continue
+        try:
+            notification_text = format_expiry_notice(
+                expiring["service"], expiring["days_left"]
+            )
+
+            await outbound.send_message(
+                context.bot,
+                lane=LANE_BULK,
+                chat_id=int(user_id),
+                text=notification_text,
+                parse_mode="Markdown",
+            )
+
+            notified_users.add(user_id)
+
+        except Exception as e:
+            if is_unreachable_error(e):
+                mark_user_unreachable(user_id, e)
+                unreachable_found = True
+            logger.error(
+                f"Error notifying user {user_id} about expiring service: {e}"
+            )
+
+    if unreachable_found:
+        save_user_data()
+
+    await query.edit_message_text(
+        f"✅ اطلاع‌رسانی با موفقیت به {len(notified_users)} کاربر انجام شد.",
+        reply_markup=keyboards.back("manage_services"),
+    )
+    return ADMIN_PANEL
+
+
+@admin_router.exact("generate_reports")
+async def admin_generate_reports(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    # Reporting options
+    keyboard = [
+        [
+            InlineKeyboardButton("گزارش فروش", callback_data="sales_report"),
+            InlineKeyboardButton("گزارش کاربران", callback_data="users_report"),
+            InlineKeyboardButton("گزارش درآمد", callback_data="income_report"),
+        ],
+        [
+            InlineKeyboardButton("گزارش ماندگاری", callback_data="cohort_report"),
+            InlineKeyboardButton("ارزش طول عمر", callback_data="ltv_report"),
+        ],
+        [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_admin")],
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+
+    await query.edit_message_text(
+        "📊 *سیستم گزارش‌گیری*\n\n" "لطفاً نوع گزارش مورد نظر خود را انتخاب کنید:",
+        reply_markup=reply_markup,
+        parse_mode="Markdown",
+    )
+    return ADMIN_PANEL
+
+
+@admin_router.exact("sales_report")
+async def admin_sales_report(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    await query.edit_message_text(
+        report_cache.get_or_build("sales_report", build_sales_report, depends_on=("purchases",)),
+        reply_markup=keyboards.back("generate_reports"),
+        parse_mode="Markdown",
+    )
+    return ADMIN_PANEL
+
+
+@admin_router.exact("users_report")
+async def admin_users_report(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    await query.edit_message_text(
+        report_cache.get_or_build("users_report", build_users_report, depends_on=("users", "balances")),
+        reply_markup=keyboards.back("generate_reports"),
+        parse_mode="Markdown",
+    )
+    return ADMIN_PANEL
+
+
+@admin_router.exact("income_report")
+async def admin_income_report(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    await query.edit_message_text(
+        report_cache.get_or_build("income_report", build_income_report, depends_on=("purchases",)),
+        reply_markup=keyboards.back("generate_reports"),
+        parse_mode="Markdown",
+    )
+    return ADMIN_PANEL
+
+
+@admin_router.exact("cohort_report")
+async def admin_cohort_report(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    await query.edit_message_text(
+        report_cache.get_or_build("cohort_report", build_cohort_report, depends_on=("users", "purchases")),
+        reply_markup=keyboards.back("generate_reports"),
+        parse_mode="Markdown",
+    )
+    return ADMIN_PANEL
+
+
+@admin_router.exact("ltv_report")
+async def admin_ltv_report(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    await query.edit_message_text(
+        report_cache.get_or_build("ltv_report", build_ltv_report, depends_on=("users", "purchases")),
+        reply_markup=keyboards.back("generate_reports"),
+        parse_mode="Markdown",
+    )
+    return ADMIN_PANEL
+
+
+@admin_router.exact("clean_inactive_users")
+async def admin_clean_inactive_users(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    # Count users with no services
+    inactive_count = sum(
+        1
+        for u_id, u_data in user_snapshots.snapshot().items()
+        if not is_admin(u_id) and not u_data.get("services")
+    )
+
+    keyboard = [
+        [
+            InlineKeyboardButton(
+                "✅ تایید پاکسازی", callback_data="confirm_clean_users"
+            ),
+            InlineKeyboardButton("❌ انصراف", callback_data="back_to_admin"),
+        ]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+
+    await query.edit_message_text(
+        f"🗑️ *پاکسازی کاربران غیرفعال*\n\n"
+        f"تعداد کاربران بدون سرویس: {inactive_count}\n\n"
+        f"آیا از پاکسازی کاربران بدون سرویس اطمینان دارید؟",
+        reply_markup=reply_markup,
+        parse_mode="Markdown",
+    )
+    return ADMIN_PANEL
+
+
+@admin_router.exact("confirm_clean_users")
+async def admin_confirm_clean_users(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    # Remove users with no services
+    admin_ids = config.snapshot.admins
+
+    # Only real users are removed; "pending_payments" is kept
+    inactive_user_ids = [
+        u_id
+        for u_id, u_data in user_snapshots.snapshot().items()
+        if u_id not in admin_ids and not u_data.get("services")
+    ]
+    removed_count = len(inactive_user_ids)
+
+    # Update user_data
+    remove_users(inactive_user_ids)
+    save_user_data()
+
+    await query.edit_message_text(
+        f"✅ پاکسازی با موفقیت انجام شد.\n\n"
+        f"تعداد کاربران حذف شده: {removed_count}",
+        reply_markup=keyboards.back("back_to_admin"),
+    )
+    return ADMIN_PANEL
+
+
+@admin_router.exact("back_to_admin")
+async def admin_back_to_admin(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, query
+) -> int:
+    reply_markup = keyboards.get("admin_panel")
+
+    await query.edit_message_text("👑 پنل مدیریت", reply_markup=reply_markup)
+    return ADMIN_PANEL
+
+
+# تابع‌های جدید برای مدیریت کاربران
+async def admin_user_id_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> int:
+    user_input = update.message.text
+    context.user_data["admin_target_user_id"] = user_input
+
+    # بررسی اینکه آیا این از طرف add_user_balance آمده یا view_user_info
+    if "admin_action" not in context.user_data:
+        # اگر از منوی افزایش موجودی آمده باشد
+        await update.message.reply_text(
+            f"لطفا مبلغی که می‌خواهید به موجودی کاربر با شناسه {user_input} اضافه کنید را وارد کنید:",
+            reply_markup=keyboards.back("back_to_admin"),
+        )
+        context.user_data["admin_action"] = "add_balance"
+        return ADMIN_AMOUNT_INPUT
+    elif context.user_data.get("admin_action") == "view_info":
+        # اگر از منوی مشاهده اطلاعات آمده باشد
+        if user_input in user_data:
+            user_info = user_data[user_input]
+            join_date = datetime.fromisoformat(user_info["joined_at"]).strftime(
+                "%Y-%m-%d"
+            )
+            persian_date = gregorian_to_persian(user_info["joined_at"])
+            services_count = len(user_info.get("services", []))
+
+            await update.message.reply_text(
+                f"👤 *اطلاعات کاربر*\n\n"
+                f"🆔 شناسه کاربری: `{user_input}`\n"
+                f"👤 نام کاربری: @{user_info['username'] or 'بدون نام کاربری'}\n"
+                f"💰 موجودی: {user_info['balance']} تومان\n"
+                f"📊 تعداد سرویس‌ها: {services_count}\n"
+                f"📅 تاریخ عضویت: {persian_date}",
+                reply_markup=keyboards.back("back_to_admin"),
+                parse_mode="Markdown",
+            )
+        else:
+            await update.message.reply_text(
+                "❌ کاربری با این شناسه یافت نشد.",
+                reply_markup=keyboards.back("back_to_admin"),
+            )
+        return ADMIN_PANEL
+
+
+async def admin_amount_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> int:
+    try:
+        amount = int(update.message.text)
+        user_id = context.user_data.get("admin_target_user_id")
+
+        if user_id in user_data:
+            adjust_balance(user_id, amount)
+            save_user_data()
+
+            # Notify admin
+            await update.message.reply_text(
+                f"✅ مبلغ {amount:,} تومان با موفقیت به موجودی کاربر با شناسه {user_id} اضافه شد.\n"
+                f"موجودی جدید: {user_data[user_id]['balance']:,} تومان",
+                reply_markup=keyboards.back("back_to_admin"),
+            )
+
+            # Try to notify user
+            try:
+                admin_name = update.effective_user.full_name or "مدیر سیستم"
+                await outbound.send_message(
+                    context.bot,
+                    chat_id=int(user_id),
+                    text=f"💰 *افزایش موجودی*\n\n"
+                    f"مبلغ {amount:,} تومان توسط {admin_name} به موجودی کیف پول شما اضافه شد.\n"
+                    f"موجودی فعلی: {user_data[user_id]['balance']:,} تومان",
+                    parse_mode="Markdown",
+                )
+            except Exception as e:
+                logger.error(f"Error notifying user {user_id}: {e}")
+                # Continue even if notification fails
+        else:
+            await update.message.reply_text(
+                "❌ کاربری با این شناسه یافت نشد.",
+                reply_markup=keyboards.back("back_to_admin"),
+            )
+    except ValueError:
+        await update.message.reply_text(
+            "❌ لطفا یک عدد صحیح وارد کنید.",
+            reply_markup=keyboards.back("back_to_admin"),
+        )
+
+    return ADMIN_PANEL
+
+
+async def admin_gift_amount_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> int:
+    try:
+        amount = int(update.message.text)
+        count = 0
+        # Resumed conversations can get here without passing admin_callback
+        warm_up.ensure()
+
+        # One snapshot version for the whole gift, so exports and reports
+        # never see it half applied
+        with user_snapshots.batch():
+            for user_id in user_snapshots.snapshot():
+                adjust_balance(user_id, amount)
+                count += 1
+
+        save_user_data()
+
+        await update.message.reply_text(
+            f"✅ مبلغ {amount:,} تومان با موفقیت به موجودی {count} کاربر اضافه شد.",
+            reply_markup=keyboards.back("back_to_admin"),
+        )
+    except ValueError:
+        await update.message.reply_text(
+            "❌ لطفا یک عدد صحیح وارد کنید.",
+            reply_markup=keyboards.back("back_to_admin"),
+        )
+
+    return ADMIN_PANEL
+
+
+async def admin_broadcast_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> int:
+    message_text = update.message.text
+    recipients = broadcast_recipients()
+    # The suffix keeps two broadcasts started in the same second apart
+    job_id = f"bc_{datetime.now().strftime('%Y%m%d%H%M%S')}_{secrets.token_hex(4)}"
+
+    # Show processing message
+    processing_msg = await update.message.reply_text(
+        "📣 در حال ارسال پیام به تمامی کاربران...\n"
+        f"تعداد گیرندگان: {len(recipients)}\n"
+        f"شناسه ارسال: {job_id}\n"
+        "نتیجه در همین پیام نمایش داده می‌شود."
+    )
+
+    # Add sender info and timestamp to the message
+    broadcast_text = (
+        f"📢 *پیام از طرف مدیریت*\n\n"
+        f"{message_text}\n\n"
+        f"🕒 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+    )
+
+    job = BroadcastJob(
+        job_id=job_id,
+        text=broadcast_text,
+        message_text=message_text,
+        recipients=recipients,
+        chat_id=processing_msg.chat_id,
+        message_id=processing_msg.message_id,
+        created_by=str(update.effective_user.id),
+    )
+    broadcast_jobs[job_id] = job
+
+    # Run in the background so the admin conversation returns right away
+    start_broadcast_job(context.application, job)
+
+    return ADMIN_PANEL
+
+
+def format_broadcast_job_status(job):
+    status_names = {
+        "running": "در حال ارسال ▶️",
+        "paused": "متوقف ⏸",
+        "cancelled": "لغو شده 🛑",
+        "done": "تکمیل شده ✅",
+    }
+    return (
+        f"📣 `{job.job_id}` - {status_names.get(job.status, job.status)}\n"
+        f"   ✅ {job.sent}  ❌ {job.failed}  📊 {job.sent + job.failed}/{job.total}"
+    )
+
+
+async def broadcast_control_command(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> None:
+    """Handle /broadcast_status, /broadcast_pause, /broadcast_resume and /broadcast_cancel"""
+    if not is_admin(update.effective_user.id):
+        return
+    warm_up.ensure()
+
+    command = update.message.text.split()[0].lstrip("/").split("@")[0]
+    action = command.replace("broadcast_", "", 1)
+
+    if action == "status" and not context.args:
+        if not broadcast_jobs:
+            await update.message.reply_text("هیچ پیام همگانی ثبت نشده است.")
+            return
+        jobs = sorted(broadcast_jobs.values(), key=lambda job: job.created_at)
+        await update.message.reply_text(
+            "\n\n".join(format_broadcast_job_status(job) for job in jobs[-10:]),
+            parse_mode="Markdown",
+        )
+        return
+
+    if not context.args:
+        await update.message.reply_text(f"استفاده: /{command} <شناسه ارسال>")
+        return
+
+    job = broadcast_jobs.get(context.args[0])
+    if job is None:
+        await update.message.reply_text("❌ ارسالی با این شناسه یافت نشد.")
+        return
+
+    if action == "pause" and job.status == "running":
+        job.status = "paused"
+    elif action == "resume" and job.status == "paused":
+        start_broadcast_job(context.application, job)
+    elif action == "cancel" and not job.is_finished:
+        job.status = "cancelled"
+        if not broadcast_task_running(job):
+            job.finished_at = datetime.now().isoformat()
+    elif action != "status":
+        await update.message.reply_text(
+            f"⚠️ این عملیات در وضعیت فعلی امکان‌پذیر نیست ({job.status})."
+        )
+        return
+
+    save_broadcast_jobs()
+    await update.message.reply_text(
+        format_broadcast_job_status(job), parse_mode="Markdown"
+    )
@@ -0,0 +1,233 @@
+# IP Address Generation Functions
+# Addresses are handed out from the ranges of each location and recorded in
+# the used address list, which lives in the storage backend.
+import logging
+import functools
+
+from dnsbot import config, data
+from dnsbot.data import USED_ADDRESSES_FILE, address_index, warm_up
+
+logger = logging.getLogger(__name__)
+
+
+def load_used_addresses():
+    return data.storage.load_document(USED_ADDRESSES_FILE, {"ipv4": {}, "ipv6": {}})
+
+
+def save_used_addresses(used_addresses):
+    return data.storage.save_document(USED_ADDRESSES_FILE, used_addresses)
+
+
+def allocator_transaction(generate):
+    """Run an address generator as one storage transaction
+
+    The generators load, extend and save the used address list; with a shared
+    backend this keeps two workers from handing out the same address.
+    """
+
+    @functools.wraps(generate)
+    def wrapper(*args, **kwargs):
+        with data.storage.transaction():
+            return generate(*args, **kwargs)
+
+    return wrapper
+
+
+@allocator_transaction
+def generate_ipv4(cidr_or_list):
+    """Generate a new IPv4 address from one of the CIDR ranges that hasn't been used before"""
+    import random
+
+    # Load used addresses
+    used_addresses = load_used_addresses()
+
+    # Handle both single CIDR and list of CIDRs
+    cidr_list = [cidr_or_list] if isinstance(cidr_or_list, str) else cidr_or_list
+
+    # Check if we have a valid CIDR list
+    if not cidr_list:
+        logger.error("No CIDR ranges provided to generate_ipv4")
+        # Return a fallback IP if no ranges provided
+        return "192.0.2.1"  # TEST-NET-1 address for documentation
+
+    # Shuffle a copy of the CIDR list to randomize selection; the list
+    # belongs to server_data
+    cidr_list = random.sample(cidr_list, len(cidr_list))
+
+    # Try each CIDR range until we find an available address
+    for cidr in cidr_list:
+        try:
+            # Initialize CIDR tracking if needed
+            if cidr not in used_addresses["ipv4"]:
+                used_addresses["ipv4"][cidr] = []
+
+            # Generate addresses from the network
+            network = config.network(cidr)
+            total_addresses = (
+                network.num_addresses - 2
+            )  # Exclude network and broadcast addresses
+
+            # Skip very small networks
+            if total_addresses <= 2:
+                logger.warning(f"Network {cidr} too small for allocation, skipping")
+                continue
+
+            used_count = len(used_addresses["ipv4"][cidr])
+
+            # If all addresses used in this CIDR, try the next one
+            if used_count >= total_addresses:
+                logger.warning(
+                    f"All IPv4 addresses in {cidr} have been used. Trying another range."
+                )
+                continue
+
+            # Try to find an unused address (limit attempts to avoid long loops)
+            max_attempts = min(100, total_addresses - used_count)
+            for _ in range(max_attempts):
+                # Generate a random host part within the network size
+                host_part = random.randint(1, total_addresses)
+                ip = network[host_part]  # Get IP at that index
+                ip_str = str(ip)
+
+                if ip_str not in used_addresses["ipv4"][cidr]:
+                    # Record this IP as used
+                    used_addresses["ipv4"][cidr].append(ip_str)
+                    save_used_addresses(used_addresses)
+                    return ip_str
+        except Exception as e:
+            logger.error(f"Error generating IPv4 from CIDR {cidr}: {e}")
+            continue
+
+    # If all ranges are exhausted or no IP found, reuse the oldest one (with warning)
+    logger.warning(
+        "All IPv4 address ranges are exhausted or heavily used. Reusing an existing address."
+    )
+    for cidr in cidr_list:
+        if cidr in used_addresses["ipv4"] and used_addresses["ipv4"][cidr]:
+            return used_addresses["ipv4"][cidr][
+                0
+            ]  # Return the oldest IP from the first range
+
+    # Absolute fallback (should rarely reach here)
+    try:
+        fallback_cidr = cidr_list[0]
+        fallback_ip = str(next(config.network(fallback_cidr).hosts()))
+        used_addresses["ipv4"].setdefault(fallback_cidr, []).append(fallback_ip)
+        save_used_addresses(used_addresses)
+        return fallback_ip
+    except Exception as e:
+        logger.error(f"Critical error in IP generation: {e}")
+        return "192.0.2.1"  # TEST-NET-1 address as last resort
+
+
+@allocator_transaction
+def generate_ipv6(prefix_or_list, suffix="1"):
+    """Generate IPv6 addresses in a simplified format with consistent pattern"""
+    import random
+
+    # Load used addresses
+    used_addresses = load_used_addresses()
+
+    # Handle both single prefix and list of prefixes
+    prefix_list = (
+        [prefix_or_list] if isinstance(prefix_or_list, str) else prefix_or_list
+    )
+    prefix_list = random.sample(prefix_list, len(prefix_list))  # Randomize selection
+
+    for prefix in prefix_list:
+        # Initialize prefix tracking if needed
+        if prefix not in used_addresses["ipv6"]:
+            used_addresses["ipv6"][prefix] = []
+
+        # Parse prefix to get base parts
+        network = config.network(prefix)
+        prefix_parts = str(network.network_address).split(":")[:3]  # Get first 3 parts
+
+        # Try multiple times to find a unique address
+        for _ in range(20):  # Limit attempts
+            # Generate random parts that are easy to read (not too long)
+            part1 = f"{random.randint(1, 9999):04x}"
+            part2 = f"{random.randint(1, 9999):04x}"
+
+            # Create well-formatted IPv6 address
+            formatted_ip = f"{prefix_parts[0]}:{prefix_parts[1]}:{prefix_parts[2]}:{part1}:{part2}::{suffix}"
+
+            # Check if it's already used
+            if formatted_ip not in used_addresses["ipv6"][prefix]:
+                used_addresses["ipv6"][prefix].append(formatted_ip)
+                save_used_addresses(used_addresses)
+                return formatted_ip
+
+    # If no unique address found, reuse oldest address
+    for prefix in prefix_list:
+        if prefix in used_addresses["ipv6"] and used_addresses["ipv6"][prefix]:
+            return used_addresses["ipv6"][prefix][0]
+
+    # Absolute fallback - generate a new one even if it might be duplicate
+    first_prefix = prefix_list[0]
+    network = config.network(first_prefix)
+    prefix_parts = str(network.network_address).split(":")[:3]
+    part1 = f"{random.randint(1, 9999):04x}"
+    part2 = f"{random.randint(1, 9999):04x}"
+    formatted_ip = f"{prefix_parts[0]}:{prefix_parts[1]}:{prefix_parts[2]}:{part1}:{part2}::{suffix}"
+
+    used_addresses["ipv6"].setdefault(first_prefix, []).append(formatted_ip)
+    save_used_addresses(used_addresses)
+    return formatted_ip
+
+
+@allocator_transaction
+def generate_ipv6_pair(prefix):
+    """Generate a pair of IPv6 addresses with ::0 and ::1 endings, using same random parts"""
+    import random
+
+    # Load used addresses
+    used_addresses = load_used_addresses()
+
+    # Initialize prefix tracking if needed
+    if prefix not in used_addresses["ipv6"]:
+        used_addresses["ipv6"][prefix] = []
+
+    # Parse prefix to get base parts
+    network = config.network(prefix)
+    prefix_parts = str(network.network_address).split(":")[:3]
+
+    # Generate same random parts for both addresses
+    part1 = f"{random.randint(1, 9999):04x}"
+    part2 = f"{random.randint(1, 9999):04x}"
+
+    # Create the pair with same middle parts
+    ip0 = f"{prefix_parts[0]}:{prefix_parts[1]}:{prefix_parts[2]}:{part1}:{part2}::0"
+    ip1 = f"{prefix_parts[0]}:{prefix_parts[1]}:{prefix_parts[2]}:{part1}:{part2}::1"
+
+    # Record as used
+    used_addresses["ipv6"].setdefault(prefix, []).extend([ip0, ip1])
+    save_used_addresses(used_addresses)
+
+    return ip0, ip1
+
+
+def release_addresses(addresses):
+    """Return addresses to the pool, except ones that belong to a service"""
+    # Before taking the storage lock: the address index may still be warming up
+    warm_up.ensure()
+    # The allocator reuses addresses once a range is exhausted, so a
+    # reservation can point at an address somebody already bought
+    releasable = {address for address in addresses if address_index.owner(address) is None}
+    if not releasable:
+        return 0
+    return release_unassigned(releasable)
+
+
+@allocator_transaction
+def release_unassigned(releasable):
+    used_addresses = load_used_addresses()
+    released = 0
+    for ranges in used_addresses.values():
+        for network, used in ranges.items():
+            kept = [address for address in used if address not in releasable]
+            released += len(used) - len(kept)
+            ranges[network] = kept
+    if released:
+        save_used_addresses(used_addresses)
+    return released
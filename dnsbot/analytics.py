@@ -0,0 +1,249 @@
+import logging
+from array import array
+from datetime import datetime
+
+# numpy is optional (the array fallback is used instead) and slow to import,
+# so it is only imported once a report needs it
+numpy = None
+_numpy_checked = False
+
+logger = logging.getLogger(__name__)
+
+
+def load_numpy():
+    """Import numpy on first use; returns the module or None if it isn't installed"""
+    global numpy, _numpy_checked
+    if not _numpy_checked:
+        try:
+            import numpy as numpy_module
+
+            numpy = numpy_module
+        except ImportError:
+            pass
+        _numpy_checked = True
+    return numpy
+
+
+def month_index(iso_date):
+    """Months since year 0 for an ISO date string, so month arithmetic is subtraction"""
+    return int(iso_date[:4]) * 12 + int(iso_date[5:7]) - 1
+
+
+def month_label(index):
+    return f"{index // 12}-{index % 12 + 1:02d}"
+
+
+class AnalyticsSnapshot:
+    """Columnar copy of users and services for cohort, retention and LTV reports
+
+    Users and services are stored as parallel typed arrays. The snapshot is
+    built once from user_data and then kept current through add_user and
+    add_service; anything it can't apply incrementally (e.g. removed users)
+    marks it stale so the next read rebuilds it.
+    """
+
+    def __init__(self):
+        self.built = False
+        self.stale = False
+        self.user_index = {}  # user_id -> row in the user columns
+        # User columns
+        self.join_months = array("q")
+        # Service columns
+        self.service_users = array("q")
+        self.purchase_months = array("q")
+        self.location_ids = array("H")
+        self.amounts = array("q")
+        self.locations = []  # location id -> location code
+        self._location_ids = {}
+
+    def _location_id(self, location):
+        if location not in self._location_ids:
+            self._location_ids[location] = len(self.locations)
+            self.locations.append(location)
+        return self._location_ids[location]
+
+    def _add_user(self, user_id, user_info):
+        self.user_index[user_id] = len(self.join_months)
+        joined_at = user_info.get("joined_at") or datetime.now().isoformat()
+        self.join_months.append(month_index(joined_at))
+
+    def _add_service(self, user_id, service, amount):
+        if "purchase_date" not in service or not service.get("location"):
+            return
+        self.service_users.append(self.user_index[user_id])
+        self.purchase_months.append(month_index(service["purchase_date"]))
+        self.location_ids.append(self._location_id(service["location"]))
+        self.amounts.append(int(amount))
+
+    def rebuild(self, user_data, price_of):
+        """Build all columns from user_data; `price_of(service)` gives each sale's amount"""
+        self.__init__()
+        for user_id, user_info in user_data.items():
+            if not user_id.isdigit():
+                continue
+            self._add_user(user_id, user_info)
+            for service in user_info.get("services", []):
+                self._add_service(user_id, service, price_of(service))
+        self.built = True
+        logger.info(
+            f"Analytics snapshot built: {len(self.join_months)} users, "
+            f"{len(self.service_users)} services"
+        )
+
+    def ensure_current(self, user_data, price_of):
+        if not self.built or self.stale:
+            self.rebuild(user_data, price_of)
+
+    def add_user(self, user_id, user_info):
+        if self.built and user_id not in self.user_index:
+            self._add_user(user_id, user_info)
+
+    def add_service(self, user_id, service, amount):
+        if not self.built:
+            return
+        if user_id not in self.user_index:
+            self.stale = True
+            return
+        self._add_service(user_id, service, amount)
+
+    def invalidate(self):
+        self.stale = True
+
+    # Column access: numpy arrays share the array buffers, no copy is made
+    def _columns(self):
+        # Every computation starts here, so numpy is loaded before it is used
+        if load_numpy() is None:
+            return (
+                self.join_months,
+                self.service_users,
+                self.purchase_months,
+                self.location_ids,
+                self.amounts,
+            )
+        return (
+            numpy.frombuffer(self.join_months, dtype=numpy.int64),
+            numpy.frombuffer(self.service_users, dtype=numpy.int64),
+            numpy.frombuffer(self.purchase_months, dtype=numpy.int64),
+            numpy.frombuffer(self.location_ids, dtype=numpy.uint16),
+            numpy.frombuffer(self.amounts, dtype=numpy.int64),
+        )
+
+    def _purchases_per_user(self):
+        users = len(self.join_months)
+        _, service_users, _, _, amounts = self._columns()
+        if numpy is not None:
+            counts = numpy.bincount(service_users, minlength=users)
+            revenue = numpy.bincount(service_users, weights=amounts, minlength=users)
+            return counts, revenue
+        counts = [0] * users
+        revenue = [0] * users
+        for user, amount in zip(service_users, amounts):
+            counts[user] += 1
+            revenue[user] += amount
+        return counts, revenue
+
+    def cohort_retention(self, max_offset=6):
+        """Return [(cohort label, cohort size, [share of cohort buying in month +k])]"""
+        join_months, service_users, purchase_months, _, _ = self._columns()
+        if not len(join_months):
+            return []
+        width = max_offset + 1
+        if numpy is not None:
+            first_month = int(join_months.min())
+            cohorts = join_months - first_month
+            offsets = purchase_months - join_months[service_users]
+            in_range = (offsets >= 0) & (offsets <= max_offset)
+            # Count each (user, offset) pair once, however many services it has
+            active = numpy.unique(
+                service_users[in_range].astype(numpy.int64) * width
+                + offsets[in_range]
+            )
+            active_users = active // width
+            cells = cohorts[active_users] * width + active % width
+            cohort_count = int(cohorts.max()) + 1
+            matrix = numpy.bincount(cells, minlength=cohort_count * width).reshape(
+                cohort_count, width
+            )
+            sizes = numpy.bincount(cohorts, minlength=cohort_count)
+            rows = []
+            for cohort in range(cohort_count):
+                size = int(sizes[cohort])
+                if size:
+                    rows.append(
+                        (
+                            month_label(first_month + cohort),
+                            size,
+                            [float(count) / size for count in matrix[cohort]],
+                        )
+                    )
+            return rows
+
+        sizes = {}
+        for join_month in join_months:
+            sizes[join_month] = sizes.get(join_month, 0) + 1
+        active = set()
+        for user, purchase_month in zip(service_users, purchase_months):
+            offset = purchase_month - join_months[user]
+            if 0 <= offset <= max_offset:
+                active.add((user, offset))
+        matrix = {}
+        for user, offset in active:
+            row = matrix.setdefault(join_months[user], [0] * width)
+            row[offset] += 1
+        return [
+            (
+                month_label(cohort),
+                size,
+                [count / size for count in matrix.get(cohort, [0] * width)],
+            )
+            for cohort, size in sorted(sizes.items())
+        ]
+
+    def repeat_purchase_rate(self):
+        """Share of buying users who bought more than once"""
+        counts, _ = self._purchases_per_user()
+        if numpy is not None:
+            buyers = int((counts >= 1).sum())
+            repeaters = int((counts >= 2).sum())
+        else:
+            buyers = sum(1 for count in counts if count >= 1)
+            repeaters = sum(1 for count in counts if count >= 2)
+        return repeaters / buyers if buyers else 0.0
+
+    def revenue_by_location(self):
+        _, _, _, location_ids, amounts = self._columns()
+        if numpy is not None:
+            sums = numpy.bincount(
+                location_ids, weights=amounts, minlength=len(self.locations)
+            )
+        else:
+            sums = [0] * len(self.locations)
+            for location_id, amount in zip(location_ids, amounts):
+                sums[location_id] += amount
+        return {
+            self.locations[location_id]: int(total)
+            for location_id, total in enumerate(sums)
+            if total
+        }
+
+    def lifetime_value(self):
+        """Average, median and top-decile revenue per user, over all and over paying users"""
+        _, revenue = self._purchases_per_user()
+        if numpy is not None:
+            revenue = numpy.sort(revenue)
+            paying = revenue[revenue > 0]
+        else:
+            revenue = sorted(revenue)
+            paying = [value for value in revenue if value > 0]
+        users = len(revenue)
+        if not users:
+            return {"users": 0, "paying": 0, "avg": 0, "paying_avg": 0, "median": 0, "p90": 0}
+        total = float(sum(revenue)) if numpy is None else float(revenue.sum())
+        return {
+            "users": users,
+            "paying": len(paying),
+            "avg": total / users,
+            "paying_avg": total / len(paying) if len(paying) else 0,
+            "median": float(revenue[users // 2]),
+            "p90": float(revenue[min(users - 1, int(users * 0.9))]),
+        }
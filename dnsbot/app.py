@@ -0,0 +1,499 @@
+# Application setup
+# Builds the Application, registers the handlers and jobs and runs it in
+# polling, webhook or worker mode. The admin panel and the reports are
+# registered through lazy proxies (see lazy.py), so a bot that only serves
+# users never imports them.
+import os
+import logging
+import json
+import secrets
+import signal
+import sys
+import asyncio
+import importlib.util
+from telegram import Update
+from telegram.ext import (
+    Application,
+    CommandHandler,
+    MessageHandler,
+    CallbackQueryHandler,
+    filters,
+    ConversationHandler,
+    TypeHandler,
+)
+from telegram.request import HTTPXRequest
+
+from dnsbot import config, data, lazy
+from dnsbot.persistence import SqlitePersistence
+from dnsbot.states import (
+    ADMIN_AMOUNT_INPUT,
+    ADMIN_BROADCAST_MESSAGE,
+    ADMIN_GIFT_AMOUNT_INPUT,
+    ADMIN_PANEL,
+    ADMIN_USER_ID_INPUT,
+    CONFIRM_PURCHASE,
+    MAIN_MENU,
+    PAYMENT_RECEIPT,
+    SELECT_IP_TYPE,
+    SELECT_LOCATION,
+    WALLET,
+)
+from dnsbot.data import (
+    PERSISTENCE_FILE,
+    WORKER_COUNT,
+    WORKER_INDEX,
+    bot_config,
+    init_data,
+    server_data,
+    user_data,
+    warm_up,
+)
+from dnsbot.config import CONFIG_WATCH_INTERVAL, config_watcher, reload_changed_config
+from dnsbot.flood import flood_control
+from dnsbot.menu import menu_callback, start
+from dnsbot.wallet import payment_receipt_handler, wallet_callback
+from dnsbot.purchase import (
+    confirm_direct_purchase,
+    confirm_purchase_callback,
+    ip_type_callback,
+    location_callback,
+)
+from dnsbot.conversation import (
+    CONTEXT_SWEEP_INTERVAL,
+    sweep_conversation_contexts,
+    track_conversation_states,
+)
+from dnsbot.broadcast import (
+    EXPIRY_REMINDER_INTERVAL,
+    UNREACHABLE_PROBE_INTERVAL,
+    probe_unreachable_users,
+    resume_broadcast_jobs,
+    send_expiry_reminders,
+)
+from dnsbot.sync import SHARED_SYNC_INTERVAL, refresh_sender_balance, sync_shared_data
+
+# Enable logging with more structured format
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    level=logging.INFO,
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+# Set up exception handler to log unhandled exceptions
+def handle_exception(exc_type, exc_value, exc_traceback):
+    if issubclass(exc_type, KeyboardInterrupt):
+        # Don't log KeyboardInterrupt
+        sys.__excepthook__(exc_type, exc_value, exc_traceback)
+        return
+    logger.critical(
+        "Unhandled exception", exc_info=(exc_type, exc_value, exc_traceback)
+    )
+
+
+sys.excepthook = handle_exception
+
+
+# Conversation persistence
+# Conversation states and context.user_data survive restarts (see
+# persistence.py). Tunable in bot_config: persistence_flush_interval (seconds
+# between writes), persistence_max_age_days (idle conversations older than
+# this are dropped) and persistence_load_limit (most users loaded at startup).
+DEFAULT_PERSISTENCE_FLUSH_INTERVAL = 30  # seconds
+DEFAULT_PERSISTENCE_MAX_AGE_DAYS = 7
+DEFAULT_PERSISTENCE_LOAD_LIMIT = 10000
+
+
+def build_persistence():
+    return SqlitePersistence(
+        PERSISTENCE_FILE,
+        update_interval=bot_config.get(
+            "persistence_flush_interval", DEFAULT_PERSISTENCE_FLUSH_INTERVAL
+        ),
+        max_age=bot_config.get(
+            "persistence_max_age_days", DEFAULT_PERSISTENCE_MAX_AGE_DAYS
+        )
+        * 86400,
+        load_limit=bot_config.get(
+            "persistence_load_limit", DEFAULT_PERSISTENCE_LOAD_LIMIT
+        ),
+    )
+
+
+# Worker mode
+# One of the processes ingress.py starts. There is no updater: the ingress
+# POSTs each update as JSON to http://127.0.0.1:WORKER_PORT/update with the
+# X-Worker-Secret header, and it is put straight onto the update queue.
+def run_worker(application):
+    from tornado.web import Application as WebApplication, RequestHandler
+
+    port = int(os.environ["WORKER_PORT"])
+    secret = os.environ["WORKER_SECRET"]
+
+    class UpdateHandler(RequestHandler):
+        async def post(self):
+            if not secrets.compare_digest(
+                self.request.headers.get("X-Worker-Secret", ""), secret
+            ):
+                self.set_status(403)
+                return
+            update = Update.de_json(json.loads(self.request.body), application.bot)
+            await application.update_queue.put(update)
+
+    async def serve():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+
+        async with application:
+            if application.post_init:
+                await application.post_init(application)
+            await application.start()
+            server = WebApplication([(r"/update", UpdateHandler)]).listen(
+                port, address="127.0.0.1"
+            )
+            logger.info(f"Worker {WORKER_INDEX}/{WORKER_COUNT} listening on port {port}")
+            await stop.wait()
+            server.stop()
+            await application.stop()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+
+    asyncio.run(serve())
+
+
+# Bot API HTTP client
+# Outgoing calls and getUpdates use separate HTTPXRequest pools, so the long
+# poll never waits for a connection behind a broadcast and vice versa. The
+# outgoing pool must cover outbound_max_in_flight, broadcast_concurrency and
+# the handlers' own replies. Settings come from bot_config["http"] and
+# bot_config["get_updates_http"], and can be overridden per process with
+# BOT_HTTP_<SETTING> and BOT_GET_UPDATES_HTTP_<SETTING> (e.g.
+# BOT_HTTP_CONNECTION_POOL_SIZE=200). http_version "2" needs the h2 package
+# (pip install "httpx[http2]"); without it HTTP/1.1 is used.
+DEFAULT_HTTP_SETTINGS = {
+    "connection_pool_size": 100,
+    "pool_timeout": 10.0,  # seconds to wait for a free connection
+    "connect_timeout": 5.0,
+    "read_timeout": 10.0,
+    "write_timeout": 20.0,
+    "http_version": "1.1",
+}
+DEFAULT_GET_UPDATES_HTTP_SETTINGS = {
+    "connection_pool_size": 1,
+    "pool_timeout": 1.0,
+    "connect_timeout": 5.0,
+    "read_timeout": 5.0,  # PTB adds the long poll timeout on top of this
+    "write_timeout": 5.0,
+    "http_version": "1.1",
+}
+
+
+def http_settings(config_key, env_prefix, defaults):
+    settings = dict(defaults)
+    settings.update(bot_config.get(config_key, {}))
+    for name in defaults:
+        value = os.environ.get(f"{env_prefix}{name.upper()}")
+        if value:
+            settings[name] = value
+    settings["connection_pool_size"] = int(settings["connection_pool_size"])
+    for name in ("pool_timeout", "connect_timeout", "read_timeout", "write_timeout"):
+        settings[name] = float(settings[name])
+    settings["http_version"] = str(settings["http_version"])
+    if settings["http_version"] in ("2", "2.0") and importlib.util.find_spec("h2") is None:
+        logger.warning(f"{config_key}: HTTP/2 needs the h2 package, using HTTP/1.1")
+        settings["http_version"] = "1.1"
+    return settings
+
+
+def build_requests():
+    """HTTPXRequest objects for outgoing calls and for getUpdates"""
+    requests = []
+    for config_key, env_prefix, defaults in (
+        ("http", "BOT_HTTP_", DEFAULT_HTTP_SETTINGS),
+        ("get_updates_http", "BOT_GET_UPDATES_HTTP_", DEFAULT_GET_UPDATES_HTTP_SETTINGS),
+    ):
+        settings = http_settings(config_key, env_prefix, defaults)
+        logger.info(f"{config_key} settings: {settings}")
+        requests.append(HTTPXRequest(**settings))
+    return requests
+
+
+# Webhook mode
+# Telegram pushes updates to our HTTP server instead of us long-polling
+# getUpdates. Settings come from the environment:
+#   WEBHOOK_URL     public base URL Telegram should call (required)
+#   WEBHOOK_LISTEN  address to bind, default 0.0.0.0
+#   WEBHOOK_PORT    port to bind, default 8443
+#   WEBHOOK_PATH    URL path, default "telegram"
+#   WEBHOOK_SECRET  checked against X-Telegram-Bot-Api-Secret-Token; a random
+#                   one is generated per start if unset
+#   WEBHOOK_CERT / WEBHOOK_KEY
+#                   serve TLS ourselves; leave unset when a reverse proxy
+#                   terminates TLS and forwards plain HTTP to us
+def run_webhook(application):
+    webhook_url = os.environ.get("WEBHOOK_URL")
+    if not webhook_url:
+        raise RuntimeError("BOT_MODE=webhook requires WEBHOOK_URL")
+    url_path = os.environ.get("WEBHOOK_PATH", "telegram").strip("/")
+    cert = os.environ.get("WEBHOOK_CERT")
+    key = os.environ.get("WEBHOOK_KEY")
+    if bool(cert) != bool(key):
+        raise RuntimeError("WEBHOOK_CERT and WEBHOOK_KEY must be set together")
+
+    logger.info(
+        f"Starting webhook on {os.environ.get('WEBHOOK_LISTEN', '0.0.0.0')}:"
+        f"{os.environ.get('WEBHOOK_PORT', '8443')}/{url_path} "
+        f"({'TLS' if cert else 'plain HTTP, TLS offloaded'})"
+    )
+    application.run_webhook(
+        listen=os.environ.get("WEBHOOK_LISTEN", "0.0.0.0"),
+        port=int(os.environ.get("WEBHOOK_PORT", "8443")),
+        url_path=url_path,
+        webhook_url=f"{webhook_url.rstrip('/')}/{url_path}",
+        secret_token=os.environ.get("WEBHOOK_SECRET") or secrets.token_urlsafe(32),
+        cert=cert,
+        key=key,
+    )
+
+
+async def start_warm_up(application: Application) -> None:
+    # Broadcasts iterate the deliverable index, so they resume afterwards
+    warm_up.start(resume_broadcast_jobs(application))
+
+
+async def shutdown_heavy_jobs(application: Application) -> None:
+    # The process pool only exists if an admin ran a report
+    reports = lazy.loaded("reports")
+    if reports is not None:
+        await reports.shutdown_heavy_jobs(application)
+
+
+# Main function
+def main() -> None:
+    # Set up detailed logging for important operations
+    logger.info("Starting DNS Service Bot...")
+    # Edits made from here on are picked up by reload_changed_config
+    config_watcher.mark_current()
+    init_data()
+    config.refresh()
+
+    # Log important initial data counts
+    logger.info(f"Loaded {len(user_data)} users")
+    logger.info(f"Loaded {len(server_data['locations'])} server locations")
+    logger.info(
+        f"Bot status: {'Active' if bot_config.get('is_active', True) else 'Inactive'}"
+    )
+
+    # Create the application and pass it your bot's token
+    token = os.environ.get(
+        "TELEGRAM_BOT_TOKEN", "7426668282:AAGomYDgN_lXAkpzABbwM7irPs_XT0SW11c"
+    )
+    request, get_updates_request = build_requests()
+    builder = (
+        Application.builder()
+        .token(token)
+        .request(request)
+        .persistence(build_persistence())
+        .post_init(start_warm_up)
+        .post_shutdown(shutdown_heavy_jobs)
+    )
+    # Point the bot at another Bot API server, e.g. tools/fake_telegram.py
+    base_url = os.environ.get("TELEGRAM_BASE_URL")
+    if base_url:
+        builder = builder.base_url(f"{base_url}/bot").base_file_url(
+            f"{base_url}/file/bot"
+        )
+    bot_mode = os.environ.get("BOT_MODE", "polling")
+    if bot_mode == "worker":
+        # Updates come from the ingress, not from getUpdates or a webhook
+        builder = builder.updater(None)
+    else:
+        builder = builder.get_updates_request(get_updates_request)
+    application = builder.build()
+
+    # Flood control goes first, so dropped updates cost nothing further
+    application.add_handler(TypeHandler(Update, flood_control), group=-2)
+    if data.storage.shared:
+        # Pick up balance changes other workers made before handling anything
+        application.add_handler(TypeHandler(Update, refresh_sender_balance), group=-1)
+
+    # Admin handlers; dnsbot.admin is imported on the first call
+    admin_callback = lazy.handler("admin", "admin_callback")
+
+    # Create conversation handler with states
+    conv_handler = ConversationHandler(
+        entry_points=[CommandHandler("start", start)],
+        per_message=False,  # Changed to False to allow mixed handler types
+        name="main_conversation",
+        persistent=True,
+        states={
+            MAIN_MENU: [
+                CallbackQueryHandler(
+                    menu_callback,
+                    pattern="^(wallet|buy_dns|my_services|admin_panel|back_to_main|user_profile)$",
+                ),
+                CallbackQueryHandler(wallet_callback, pattern="^add_balance$"),
+            ],
+            WALLET: [
+                CallbackQueryHandler(
+                    wallet_callback,
+                    pattern="^(add_balance|back_to_wallet|payment_[0-9]+)$",
+                ),
+                CallbackQueryHandler(menu_callback, pattern="^back_to_main$"),
+            ],
+            PAYMENT_RECEIPT: [
+                MessageHandler(
+                    filters.PHOTO | filters.TEXT & ~filters.COMMAND,
+                    payment_receipt_handler,
+                ),
+                CallbackQueryHandler(menu_callback, pattern="^back_to_main$"),
+                CallbackQueryHandler(wallet_callback, pattern="^back_to_wallet$"),
+            ],
+            SELECT_LOCATION: [
+                CallbackQueryHandler(
+                    location_callback,
+                    pattern="^(direct_purchase_|location_|back_to_locations)",
+                ),
+                CallbackQueryHandler(menu_callback, pattern="^back_to_main$"),
+            ],
+            SELECT_IP_TYPE: [
+                CallbackQueryHandler(ip_type_callback, pattern="^ip_type_"),
+                CallbackQueryHandler(location_callback, pattern="^back_to_locations$"),
+                CallbackQueryHandler(menu_callback, pattern="^back_to_main$"),
+            ],
+            CONFIRM_PURCHASE: [
+                CallbackQueryHandler(
+                    confirm_purchase_callback, pattern="^confirm_purchase$"
+                ),
+                CallbackQueryHandler(ip_type_callback, pattern="^back_to_ip_type$"),
+                CallbackQueryHandler(
+                    confirm_direct_purchase, pattern="^confirm_direct_purchase$"
+                ),
+                CallbackQueryHandler(location_callback, pattern="^back_to_locations$"),
+                CallbackQueryHandler(menu_callback, pattern="^back_to_main$"),
+            ],
+            ADMIN_PANEL: [
+                CallbackQueryHandler(menu_callback, pattern="^back_to_main$"),
+                # admin_callback answers presses that have no route itself
+                CallbackQueryHandler(admin_callback),
+            ],
+            ADMIN_USER_ID_INPUT: [
+                MessageHandler(
+                    filters.TEXT & ~filters.COMMAND,
+                    lazy.handler("admin", "admin_user_id_handler"),
+                ),
+                CallbackQueryHandler(admin_callback, pattern="^back_to_admin$"),
+            ],
+            ADMIN_AMOUNT_INPUT: [
+                MessageHandler(
+                    filters.TEXT & ~filters.COMMAND,
+                    lazy.handler("admin", "admin_amount_handler"),
+                ),
+                CallbackQueryHandler(admin_callback, pattern="^back_to_admin$"),
+            ],
+            ADMIN_GIFT_AMOUNT_INPUT: [
+                MessageHandler(
+                    filters.TEXT & ~filters.COMMAND,
+                    lazy.handler("admin", "admin_gift_amount_handler"),
+                ),
+                CallbackQueryHandler(admin_callback, pattern="^back_to_admin$"),
+            ],
+            ADMIN_BROADCAST_MESSAGE: [
+                MessageHandler(
+                    filters.TEXT & ~filters.COMMAND,
+                    lazy.handler("admin", "admin_broadcast_handler"),
+                ),
+                CallbackQueryHandler(admin_callback, pattern="^back_to_admin$"),
+            ],
+        },
+        fallbacks=[
+            CommandHandler("start", start),
+            MessageHandler(filters.COMMAND, start),
+        ],
+    )
+    track_conversation_states(conv_handler)
+
+    # Broadcast job controls are registered before the conversation so its
+    # command fallback does not swallow them
+    application.add_handler(
+        CommandHandler(
+            [
+                "broadcast_status",
+                "broadcast_pause",
+                "broadcast_resume",
+                "broadcast_cancel",
+            ],
+            lazy.admin_command("admin", "broadcast_control_command"),
+        )
+    )
+    application.add_handler(
+        CommandHandler(
+            ["sales_range", "sales_month"],
+            lazy.admin_command("reports", "sales_range_command"),
+        )
+    )
+    application.add_handler(
+        CommandHandler(
+            "backfill_revenue", lazy.admin_command("reports", "backfill_revenue_command")
+        )
+    )
+    application.add_handler(
+        CommandHandler("export", lazy.admin_command("reports", "export_command"))
+    )
+    application.add_handler(
+        CommandHandler(
+            "heavy_report", lazy.admin_command("reports", "heavy_report_command")
+        )
+    )
+    application.add_handler(conv_handler)
+
+    application.job_queue.run_repeating(
+        probe_unreachable_users,
+        interval=UNREACHABLE_PROBE_INTERVAL,
+        first=UNREACHABLE_PROBE_INTERVAL,
+        name="probe_unreachable_users",
+    )
+    application.job_queue.run_repeating(
+        send_expiry_reminders,
+        interval=EXPIRY_REMINDER_INTERVAL,
+        first=60,
+        name="send_expiry_reminders",
+    )
+    application.job_queue.run_repeating(
+        sweep_conversation_contexts,
+        interval=CONTEXT_SWEEP_INTERVAL,
+        first=CONTEXT_SWEEP_INTERVAL,
+        name="sweep_conversation_contexts",
+    )
+    application.job_queue.run_repeating(
+        reload_changed_config,
+        interval=CONFIG_WATCH_INTERVAL,
+        first=CONFIG_WATCH_INTERVAL,
+        name="reload_changed_config",
+    )
+    if WORKER_COUNT > 1:
+        application.job_queue.run_repeating(
+            sync_shared_data,
+            interval=SHARED_SYNC_INTERVAL,
+            first=SHARED_SYNC_INTERVAL,
+            name="sync_shared_data",
+        )
+
+    # Display success message in logs
+    print("Bot start sucesfuly✅")
+    logger.info("Bot start sucesfuly✅")
+
+    # Run the bot until the user presses Ctrl-C
+    if bot_mode == "webhook":
+        run_webhook(application)
+    elif bot_mode == "worker":
+        run_worker(application)
+    else:
+        application.run_polling()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,455 @@
+# Broadcast engine
+# Broadcasts are sent concurrently through the bulk lane of the outbound
+# dispatcher, which paces them under Telegram's limits.
+import logging
+import asyncio
+import base64
+import time
+from datetime import datetime, timedelta
+from telegram.ext import Application, ContextTypes
+from telegram.constants import ChatAction
+from telegram.error import RetryAfter, TelegramError
+
+from dnsbot.data import (
+    BROADCAST_JOBS_FILE,
+    bot_config,
+    deliverable_users,
+    expiry_index,
+    find_service,
+    gregorian_to_persian,
+    is_unreachable_error,
+    load_data,
+    mark_user_reachable,
+    mark_user_unreachable,
+    owns_user,
+    save_data,
+    save_user_data,
+    server_data,
+    update_service,
+    user_data,
+    user_snapshots,
+    warm_up,
+)
+from dnsbot.outbound import LANE_BULK, outbound
+from dnsbot.keyboards import keyboards
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_BROADCAST_CONCURRENCY = 10
+BROADCAST_PROGRESS_INTERVAL = 5  # seconds between progress message updates
+
+
+def broadcast_recipients():
+    warm_up.ensure()
+    return sorted(deliverable_users, key=int)
+
+
+def format_broadcast_progress(job, session_done, session_started_at):
+    done = job.sent + job.failed
+    total = job.total
+    elapsed = time.monotonic() - session_started_at
+    if session_done and done < total:
+        eta_seconds = int(elapsed / session_done * (total - done))
+        eta = str(timedelta(seconds=eta_seconds))
+    else:
+        eta = "-"
+    return (
+        f"📣 در حال ارسال پیام همگانی... (`{job.job_id}`)\n\n"
+        f"✅ ارسال موفق: {job.sent}\n"
+        f"❌ ارسال ناموفق: {job.failed}\n"
+        f"📊 پیشرفت: {done}/{total}\n"
+        f"⏳ زمان باقی‌مانده: {eta}"
+    )
+
+
+# Persisted broadcast jobs
+# Every broadcast is stored in BROADCAST_JOBS_FILE with its recipient list, a
+# cursor and a 2-bit outcome per recipient, so a restart resumes the job
+# instead of sending the message to everyone again.
+OUTCOME_PENDING, OUTCOME_SENT, OUTCOME_FAILED = 0, 1, 2
+MAX_FINISHED_BROADCAST_JOBS = 20
+
+
+class BroadcastJob:
+    def __init__(
+        self,
+        job_id,
+        text,
+        message_text,
+        recipients,
+        chat_id,
+        message_id,
+        created_by,
+        status="running",
+        cursor=0,
+        outcomes=None,
+        total=None,
+        sent=0,
+        failed=0,
+        created_at=None,
+        finished_at=None,
+    ):
+        self.job_id = job_id
+        self.text = text
+        self.message_text = message_text
+        self.recipients = recipients
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.created_by = created_by
+        self.status = status
+        # All recipients before `cursor` already have a final outcome
+        self.cursor = cursor
+        self.total = len(recipients) if total is None else total
+        self.outcomes = outcomes or bytearray((self.total + 3) // 4)
+        self.sent = sent
+        self.failed = failed
+        self.created_at = created_at or datetime.now().isoformat()
+        self.finished_at = finished_at
+        # Set when a recipient turned out to be unreachable during this run
+        self.unreachable_found = False
+
+    def get_outcome(self, index):
+        return (self.outcomes[index >> 2] >> ((index & 3) * 2)) & 3
+
+    def set_outcome(self, index, outcome):
+        shift = (index & 3) * 2
+        self.outcomes[index >> 2] = (self.outcomes[index >> 2] & ~(3 << shift)) | (
+            outcome << shift
+        )
+        if outcome == OUTCOME_SENT:
+            self.sent += 1
+        elif outcome == OUTCOME_FAILED:
+            self.failed += 1
+        while self.cursor < self.total and self.get_outcome(self.cursor):
+            self.cursor += 1
+
+    def pending_indices(self):
+        for index in range(self.cursor, self.total):
+            if self.get_outcome(index) == OUTCOME_PENDING:
+                yield index
+
+    @property
+    def is_finished(self):
+        return self.status in ("done", "cancelled")
+
+    def to_dict(self):
+        return {
+            "id": self.job_id,
+            "text": self.text,
+            "message_text": self.message_text,
+            # Finished jobs only keep their counters
+            "recipients": [] if self.is_finished else self.recipients,
+            "chat_id": self.chat_id,
+            "message_id": self.message_id,
+            "created_by": self.created_by,
+            "status": self.status,
+            "cursor": self.cursor,
+            "outcomes": (
+                ""
+                if self.is_finished
+                else base64.b64encode(bytes(self.outcomes)).decode("ascii")
+            ),
+            "total": self.total,
+            "sent": self.sent,
+            "failed": self.failed,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            job_id=data["id"],
+            text=data["text"],
+            message_text=data.get("message_text", ""),
+            recipients=data.get("recipients", []),
+            chat_id=data.get("chat_id"),
+            message_id=data.get("message_id"),
+            created_by=data.get("created_by"),
+            status=data.get("status", "running"),
+            cursor=data.get("cursor", 0),
+            outcomes=bytearray(base64.b64decode(data.get("outcomes") or "")),
+            total=data.get("total"),
+            sent=data.get("sent", 0),
+            failed=data.get("failed", 0),
+            created_at=data.get("created_at"),
+            finished_at=data.get("finished_at"),
+        )
+
+
+broadcast_jobs = {}
+_broadcast_tasks = {}
+
+
+def load_broadcast_jobs():
+    data = load_data(BROADCAST_JOBS_FILE, {})
+    for job_id, job_data in data.items():
+        try:
+            broadcast_jobs[job_id] = BroadcastJob.from_dict(job_data)
+        except Exception as e:
+            logger.error(f"Error loading broadcast job {job_id}: {e}")
+
+
+def save_broadcast_jobs():
+    finished = sorted(
+        (job for job in broadcast_jobs.values() if job.is_finished),
+        key=lambda job: job.created_at,
+    )
+    for job in finished[:-MAX_FINISHED_BROADCAST_JOBS]:
+        del broadcast_jobs[job.job_id]
+    return save_data(
+        BROADCAST_JOBS_FILE,
+        {job_id: job.to_dict() for job_id, job in broadcast_jobs.items()},
+    )
+
+
+async def run_broadcast(bot, job):
+    """Send the job's message to its pending recipients and keep the progress message up to date"""
+    session_started_at = time.monotonic()
+    session_start_done = job.sent + job.failed
+
+    async def worker(pending):
+        # Workers share one generator, so each recipient is handed out once
+        for index in pending:
+            if job.status != "running":
+                return
+            user_id = job.recipients[index]
+            try:
+                await outbound.send_message(
+                    bot, int(user_id), job.text, lane=LANE_BULK, parse_mode="Markdown"
+                )
+                job.set_outcome(index, OUTCOME_SENT)
+            except Exception as e:
+                if is_unreachable_error(e):
+                    mark_user_unreachable(user_id, e)
+                    job.unreachable_found = True
+                else:
+                    logger.error(f"Error sending broadcast to user {user_id}: {e}")
+                job.set_outcome(index, OUTCOME_FAILED)
+
+    async def report_progress():
+        while True:
+            await asyncio.sleep(BROADCAST_PROGRESS_INTERVAL)
+            save_broadcast_jobs()
+            try:
+                await bot.edit_message_text(
+                    chat_id=job.chat_id,
+                    message_id=job.message_id,
+                    text=format_broadcast_progress(
+                        job,
+                        job.sent + job.failed - session_start_done,
+                        session_started_at,
+                    ),
+                    parse_mode="Markdown",
+                )
+            except TelegramError as e:
+                # "message is not modified" and similar errors are harmless here
+                logger.debug(f"Could not update broadcast progress: {e}")
+
+    concurrency = bot_config.get(
+        "broadcast_concurrency", DEFAULT_BROADCAST_CONCURRENCY
+    )
+    progress_task = asyncio.create_task(report_progress())
+    try:
+        # A pause followed by a quick resume can leave work behind, so keep
+        # going until the job is complete or no longer running
+        while job.status == "running" and job.cursor < job.total:
+            pending = job.pending_indices()
+            await asyncio.gather(
+                *(worker(pending) for _ in range(max(1, concurrency)))
+            )
+    finally:
+        progress_task.cancel()
+        outbound.chat_limiter.prune()
+        _broadcast_tasks.pop(job.job_id, None)
+        if job.status == "running" and job.cursor >= job.total:
+            job.status = "done"
+        if job.is_finished:
+            job.finished_at = datetime.now().isoformat()
+        save_broadcast_jobs()
+        if job.unreachable_found:
+            save_user_data()
+
+    logger.info(
+        f"Broadcast {job.job_id} {job.status}: {job.sent} sent, {job.failed} failed "
+        f"in {time.monotonic() - session_started_at:.1f}s"
+    )
+
+    if job.status == "paused":
+        status_line = "⏸ ارسال متوقف شد."
+    elif job.status == "cancelled":
+        status_line = "🛑 ارسال لغو شد."
+    else:
+        status_line = "✅ *نتیجه ارسال پیام همگانی*"
+
+    # Update processing message with results
+    try:
+        await bot.edit_message_text(
+            chat_id=job.chat_id,
+            message_id=job.message_id,
+            text=f"{status_line}\n\n"
+            f"📨 پیام ارسال شده:\n"
+            f"`{job.message_text[:50]}{'...' if len(job.message_text) > 50 else ''}`\n\n"
+            f"✅ ارسال موفق: {job.sent}\n"
+            f"❌ ارسال ناموفق: {job.failed}\n"
+            f"📊 پیشرفت: {job.sent + job.failed}/{job.total}\n",
+            reply_markup=keyboards.back("back_to_admin"),
+            parse_mode="Markdown",
+        )
+    except TelegramError as e:
+        logger.error(f"Error updating broadcast result message: {e}")
+
+
+def start_broadcast_job(application, job):
+    job.status = "running"
+    save_broadcast_jobs()
+    if job.job_id in _broadcast_tasks:
+        # The previous task is still draining and will pick the job up again
+        return
+    _broadcast_tasks[job.job_id] = asyncio.get_running_loop().create_task(
+        run_broadcast(application.bot, job)
+    )
+
+
+def broadcast_task_running(job):
+    return job.job_id in _broadcast_tasks
+
+
+async def resume_broadcast_jobs(application: Application) -> None:
+    """Restart broadcasts that were still running when the bot stopped"""
+    load_broadcast_jobs()
+    for job in broadcast_jobs.values():
+        if job.status == "running":
+            logger.info(
+                f"Resuming broadcast {job.job_id} at {job.sent + job.failed}/{job.total}"
+            )
+            start_broadcast_job(application, job)
+
+
+def format_expiry_notice(service, days_left):
+    loc_data = server_data["locations"][service["location"]]
+    persian_date = gregorian_to_persian(service["expiration_date"])
+    return (
+        f"⚠️ *اطلاعیه مهم*\n\n"
+        f"کاربر گرامی، یکی از سرویس‌های شما در حال انقضاست:\n\n"
+        f"🌍 لوکیشن: {loc_data['flag']} {loc_data['name']}\n"
+        f"⏱️ زمان باقی‌مانده: {days_left} روز\n"
+        f"📅 تاریخ انقضا: {persian_date}\n\n"
+        f"لطفاً جهت تمدید سرویس، از طریق منوی اصلی اقدام کنید."
+    )
+
+
+# Automatic expiry reminders
+# A JobQueue job walks the expiry index and reminds users when one of their
+# services crosses 7, 3 and 1 days before expiration. The stages already
+# reminded are stored on the service, so nobody is reminded twice.
+EXPIRY_REMINDER_STAGES = (7, 3, 1)  # days before expiration
+EXPIRY_REMINDER_INTERVAL = 30 * 60  # seconds between reminder runs
+
+
+async def send_expiry_reminders(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """JobQueue callback that sends due expiry reminders"""
+    warm_up.ensure()
+    now = time.time()
+    horizon = now + max(EXPIRY_REMINDER_STAGES) * 86400
+    due = []
+
+    for expires_at, user_id, purchase_date in expiry_index.expiring_between(
+        now, horizon
+    ):
+        # Each worker reminds its own users
+        if user_id not in deliverable_users or not owns_user(user_id):
+            continue
+        service = find_service(user_id, purchase_date)
+        if service is None:
+            continue
+        days_left = (expires_at - now) / 86400
+        stages = [stage for stage in EXPIRY_REMINDER_STAGES if days_left <= stage]
+        reminded = service.get("reminders_sent", [])
+        if min(stages) in reminded:
+            continue
+        due.append((user_id, service, int(days_left), stages))
+
+    if not due:
+        return
+
+    async def remind(user_id, service, days_left, stages):
+        try:
+            await outbound.send_message(
+                context.bot,
+                chat_id=int(user_id),
+                text=format_expiry_notice(service, days_left),
+                parse_mode="Markdown",
+                lane=LANE_BULK,
+            )
+        except Exception as e:
+            if is_unreachable_error(e):
+                mark_user_unreachable(user_id, e)
+            else:
+                logger.error(f"Error sending expiry reminder to user {user_id}: {e}")
+            return False
+        # Earlier stages that were skipped (e.g. bought with 2 days left) count
+        # as reminded too
+        reminded = service.get("reminders_sent", [])
+        update_service(
+            user_id,
+            service["purchase_date"],
+            reminders_sent=reminded + [stage for stage in stages if stage not in reminded],
+        )
+        return True
+
+    results = await asyncio.gather(*(remind(*item) for item in due))
+    save_user_data()
+    logger.info(f"Sent {sum(results)} of {len(due)} due expiry reminders")
+
+
+# Unreachable users are probed again now and then with a chat action, which
+# fails with Forbidden while the bot is still blocked but shows nothing to the
+# user otherwise.
+UNREACHABLE_PROBE_INTERVAL = 6 * 60 * 60  # seconds between probe runs
+UNREACHABLE_PROBE_MIN_AGE = timedelta(days=1)  # minimum time between probes of a user
+UNREACHABLE_PROBE_BATCH = 500  # maximum users probed per run
+
+
+async def probe_unreachable_users(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """JobQueue callback that moves users who unblocked the bot back to the deliverable index"""
+    warm_up.ensure()
+    cutoff = (datetime.now() - UNREACHABLE_PROBE_MIN_AGE).isoformat()
+    candidates = [
+        user_id
+        for user_id, user_info in user_snapshots.snapshot().items()
+        if "unreachable" in user_info
+        and user_info["unreachable"].get("last_probe", "") < cutoff
+        and owns_user(user_id)
+    ]
+    candidates.sort(
+        key=lambda user_id: user_data[user_id]["unreachable"]["last_probe"]
+    )
+
+    recovered = 0
+    for user_id in candidates[:UNREACHABLE_PROBE_BATCH]:
+        try:
+            await outbound.submit(
+                LANE_BULK,
+                int(user_id),
+                context.bot.send_chat_action,
+                chat_id=int(user_id),
+                action=ChatAction.TYPING,
+            )
+            mark_user_reachable(user_id)
+            recovered += 1
+        except RetryAfter:
+            break
+        except TelegramError as e:
+            if is_unreachable_error(e):
+                mark_user_unreachable(user_id, e)
+            else:
+                logger.warning(f"Error probing user {user_id}: {e}")
+
+    if candidates:
+        save_user_data()
+        logger.info(
+            f"Probed {min(len(candidates), UNREACHABLE_PROBE_BATCH)} unreachable users, "
+            f"{recovered} reachable again"
+        )
@@ -0,0 +1,300 @@
+# Config snapshot
+# What the hot paths need from server_data and bot_config is compiled once
+# into a ConfigSnapshot: the admin ids as a frozenset, the address ranges as
+# parsed networks, the active locations in order and the location keyboards.
+# A snapshot is never changed; a new one is compiled and swapped in with a
+# single assignment, so readers that take `config.snapshot` see either the
+# old config or the new one, never a mix.
+#
+# Hot reload
+# server_data.json and bot_config.json can be edited while the bot runs. A
+# JobQueue job compares their modification times every CONFIG_WATCH_INTERVAL
+# seconds; a changed file is read, parsed and compiled in a worker thread and
+# then swapped in between two updates. A file that doesn't parse, lacks keys
+# the handlers read or drops a location that sold services still point at is
+# logged and the current config stays in place.
+import asyncio
+import ipaddress
+import json
+import logging
+import os
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes
+
+from dnsbot import data
+from dnsbot.data import (
+    BOT_CONFIG_FILE,
+    SERVER_DATA_FILE,
+    aggregates,
+    bot_config,
+    report_cache,
+    server_data,
+    warm_up,
+)
+
+logger = logging.getLogger(__name__)
+
+CONFIG_WATCH_INTERVAL = 5  # seconds between checks for edited config files
+
+
+class ConfigSnapshot:
+    def __init__(self, admins, networks, active_locations, keyboards):
+        self.admins = admins  # frozenset of user ids as strings
+        self.networks = networks  # range as written in server_data -> parsed network
+        self.active_locations = active_locations  # tuple of location codes
+        self.keyboards = keyboards  # name -> InlineKeyboardMarkup
+
+    def replace(self, **parts):
+        values = {
+            "admins": self.admins,
+            "networks": self.networks,
+            "active_locations": self.active_locations,
+            "keyboards": self.keyboards,
+        }
+        values.update(parts)
+        return ConfigSnapshot(**values)
+
+
+def build_locations_keyboard(server_data):
+    keyboard = []
+    for loc_code, loc_data in server_data["locations"].items():
+        if loc_data["active"]:
+            # Use location-specific price instead of the general package price
+            location_price = loc_data.get("price", server_data["prices"]["dns_package"])
+            keyboard.append(
+                [
+                    InlineKeyboardButton(
+                        f"{loc_data['flag']} {loc_data['name']} - {location_price:,} تومان",
+                        callback_data=f"direct_purchase_{loc_code}",
+                    )
+                ]
+            )
+    keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_main")])
+    return keyboard
+
+
+def build_manage_servers_keyboard(server_data):
+    keyboard = []
+    for loc_code, loc_data in server_data["locations"].items():
+        status = "✅" if loc_data["active"] else "❌"
+        keyboard.append(
+            [
+                InlineKeyboardButton(
+                    f"{status} {loc_data['flag']} {loc_data['name']}",
+                    callback_data=f"toggle_location_{loc_code}",
+                )
+            ]
+        )
+    keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_admin")])
+    return keyboard
+
+
+def compile_server_data(server_data):
+    networks = {}
+    for loc_code, loc_data in server_data["locations"].items():
+        for cidr in loc_data.get("ipv4_cidr", []) + loc_data.get("ipv6_prefix", []):
+            try:
+                networks[cidr] = ipaddress.ip_network(cidr)
+            except ValueError as e:
+                # Left out; the allocator logs it again and skips the range
+                logger.error(f"Invalid range {cidr} in location {loc_code}: {e}")
+    return {
+        "networks": networks,
+        "active_locations": tuple(
+            loc_code
+            for loc_code, loc_data in server_data["locations"].items()
+            if loc_data["active"]
+        ),
+        "keyboards": {
+            "locations": InlineKeyboardMarkup(build_locations_keyboard(server_data)),
+            "manage_servers": InlineKeyboardMarkup(
+                build_manage_servers_keyboard(server_data)
+            ),
+        },
+    }
+
+
+def compile_bot_config(bot_config):
+    return {"admins": frozenset(str(admin_id) for admin_id in bot_config.get("admins", []))}
+
+
+LOCATION_KEYS = ("active", "flag", "name", "ipv4_cidr", "ipv6_prefix")
+
+
+def validate_server_data(server_data):
+    """Raise ValueError if an edited server_data lacks what the handlers read"""
+    if not isinstance(server_data, dict) or not isinstance(server_data.get("locations"), dict):
+        raise ValueError("no locations")
+    if not isinstance(server_data.get("prices"), dict) or not isinstance(
+        server_data["prices"].get("dns_package"), int
+    ):
+        raise ValueError("no prices.dns_package")
+    for loc_code, loc_data in server_data["locations"].items():
+        if not isinstance(loc_data, dict):
+            raise ValueError(f"location {loc_code} is not an object")
+        missing = [key for key in LOCATION_KEYS if key not in loc_data]
+        if missing:
+            raise ValueError(f"location {loc_code} has no {', '.join(missing)}")
+        if not isinstance(loc_data.get("price", 0), int):
+            raise ValueError(f"location {loc_code} has a price that is not a number")
+
+
+def validate_bot_config(bot_config):
+    """Raise ValueError if an edited bot_config lacks what the handlers read"""
+    if not isinstance(bot_config, dict):
+        raise ValueError("not an object")
+    if not isinstance(bot_config.get("admins", []), list):
+        raise ValueError("admins is not a list")
+
+
+def locations_in_use():
+    """Locations that sold services point at"""
+    warm_up.ensure()
+    return {location for location, count in aggregates.services_per_location.items() if count > 0}
+
+
+COMPILERS = {SERVER_DATA_FILE: compile_server_data, BOT_CONFIG_FILE: compile_bot_config}
+VALIDATORS = {SERVER_DATA_FILE: validate_server_data, BOT_CONFIG_FILE: validate_bot_config}
+DOCUMENTS = {SERVER_DATA_FILE: server_data, BOT_CONFIG_FILE: bot_config}
+
+# Replaced by refresh() once init_data() has loaded the documents
+snapshot = ConfigSnapshot(frozenset(), {}, (), {})
+
+
+def refresh(*names):
+    """Recompile the snapshot from the documents as they are now (all by default)"""
+    global snapshot
+    parts = {}
+    for name in names or COMPILERS:
+        parts.update(COMPILERS[name](DOCUMENTS[name]))
+    snapshot = snapshot.replace(**parts)
+
+
+def is_admin(user_id):
+    return str(user_id) in snapshot.admins
+
+
+def network(cidr):
+    """Parsed network for an address range; ranges not in the config are parsed here"""
+    parsed = snapshot.networks.get(cidr)
+    return parsed if parsed is not None else ipaddress.ip_network(cidr)
+
+
+def save_server_data():
+    """Save server_data; call this after changing locations or prices"""
+    refresh(SERVER_DATA_FILE)
+    # Reports show location names and prices
+    report_cache.clear()
+    saved = data.storage.save_document(SERVER_DATA_FILE, server_data)
+    config_watcher.mark_current(SERVER_DATA_FILE)
+    return saved
+
+
+def save_bot_config():
+    """Save bot_config; call this after changing settings or admins"""
+    refresh(BOT_CONFIG_FILE)
+    saved = data.storage.save_document(BOT_CONFIG_FILE, bot_config)
+    config_watcher.mark_current(BOT_CONFIG_FILE)
+    return saved
+
+
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_config_file(name):
+    """Read and compile one config file; runs in a worker thread"""
+    with open(name, "r", encoding="utf-8") as file:
+        document = json.load(file)
+    VALIDATORS[name](document)
+    return document, COMPILERS[name](document)
+
+
+class ConfigWatcher:
+    def __init__(self, names):
+        self.names = names
+        self.reloads = 0
+        self._seen = {}  # name -> file signature when it was last loaded
+        self._reloading = False
+
+    def mark_current(self, *names):
+        """Take the files as they are now as loaded (all by default)"""
+        for name in names or self.names:
+            self._seen[name] = file_signature(name)
+
+    async def poll(self):
+        if self._reloading:
+            return
+        changed = {}
+        for name in self.names:
+            signature = file_signature(name)
+            if signature is not None and signature != self._seen.get(name):
+                changed[name] = signature
+        if not changed:
+            return
+
+        self._reloading = True
+        try:
+            loaded = {}
+            for name, signature in changed.items():
+                # A broken file is only reported once; the next save retries it
+                self._seen[name] = signature
+                try:
+                    loaded[name] = await asyncio.to_thread(load_config_file, name)
+                except Exception as e:
+                    logger.error(f"Not reloading {name}, keeping the current config: {e}")
+        finally:
+            self._reloading = False
+        # Skip files the bot saved itself while they were being read; its own
+        # change is newer
+        loaded = {
+            name: result
+            for name, result in loaded.items()
+            if self._seen.get(name) == changed[name]
+        }
+        if SERVER_DATA_FILE in loaded:
+            # "My services" and reminders look up the location of every service
+            document, _ = loaded[SERVER_DATA_FILE]
+            removed = locations_in_use() - set(document["locations"])
+            if removed:
+                logger.error(
+                    f"Not reloading {SERVER_DATA_FILE}, keeping the current config: "
+                    f"services still use {', '.join(sorted(removed))}"
+                )
+                del loaded[SERVER_DATA_FILE]
+        if loaded:
+            self._swap(loaded)
+
+    def _swap(self, loaded):
+        # No await in here, so handlers see the whole change or none of it
+        global snapshot
+        parts = {}
+        for name, (document, compiled) in loaded.items():
+            DOCUMENTS[name].clear()
+            DOCUMENTS[name].update(document)
+            parts.update(compiled)
+            if data.storage.shared:
+                # The other workers read the config from the storage
+                data.storage.save_document(name, document)
+        snapshot = snapshot.replace(**parts)
+        if SERVER_DATA_FILE in loaded:
+            # Reports show location names and prices
+            report_cache.clear()
+        self.reloads += 1
+        logger.info(
+            f"Reloaded {', '.join(loaded)}: {len(snapshot.active_locations)} active "
+            f"locations, {len(snapshot.admins)} admins"
+        )
+
+
+config_watcher = ConfigWatcher((SERVER_DATA_FILE, BOT_CONFIG_FILE))
+
+
+async def reload_changed_config(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """JobQueue callback that reloads config files edited since the last check"""
+    await config_watcher.poll()
@@ -0,0 +1,201 @@
+# Conversation timeouts
+# Every state has its own idle limit. The conversation handlers are wrapped
+# so they record the user's state and last activity in context.user_data;
+# the first update after the limit ends the conversation instead of running
+# the handler. The main menu holds nothing that can go stale, so there the
+# leftover flow keys are cleared and the press goes through. A periodic sweep
+# clears the flow keys of expired conversations, hands reserved but unbought
+# addresses back to the pool and drops contexts of users who are no longer in
+# a conversation.
+import logging
+import functools
+import time
+import sys
+from telegram import Update
+from telegram.ext import ContextTypes, ConversationHandler
+from telegram.error import BadRequest
+
+from dnsbot.states import (
+    ADMIN_AMOUNT_INPUT,
+    ADMIN_BROADCAST_MESSAGE,
+    ADMIN_GIFT_AMOUNT_INPUT,
+    ADMIN_PANEL,
+    ADMIN_USER_ID_INPUT,
+    CONFIRM_PURCHASE,
+    MAIN_MENU,
+    PAYMENT_RECEIPT,
+    SELECT_IP_TYPE,
+    SELECT_LOCATION,
+    WALLET,
+)
+from dnsbot.data import warm_up
+from dnsbot.allocator import release_addresses
+
+logger = logging.getLogger(__name__)
+
+
+CONVERSATION_STATE_TIMEOUTS = {  # seconds
+    MAIN_MENU: 24 * 60 * 60,
+    WALLET: 30 * 60,
+    PAYMENT_RECEIPT: 30 * 60,
+    SELECT_LOCATION: 15 * 60,
+    SELECT_IP_TYPE: 15 * 60,
+    CONFIRM_PURCHASE: 10 * 60,
+    ADMIN_PANEL: 60 * 60,
+    ADMIN_USER_ID_INPUT: 15 * 60,
+    ADMIN_AMOUNT_INPUT: 15 * 60,
+    ADMIN_GIFT_AMOUNT_INPUT: 15 * 60,
+    ADMIN_BROADCAST_MESSAGE: 30 * 60,
+}
+# States where an expired conversation carries on instead of ending
+CONVERSATION_RESUMABLE_STATES = {MAIN_MENU}
+CONTEXT_SWEEP_INTERVAL = 10 * 60  # seconds
+CONTEXT_IDLE_DROP = 24 * 60 * 60  # seconds before a context outside any conversation is dropped
+
+# Addresses generated for a purchase that isn't confirmed yet
+RESERVATION_KEYS = (
+    "selected_ipv4",
+    "selected_ipv6",
+    "selected_ipv6_0",
+    "selected_ipv6_1",
+    "selected_ip",
+)
+FLOW_KEYS = RESERVATION_KEYS + (
+    "selected_location",
+    "selected_ip_type",
+    "selected_price",
+    "payment_amount",
+    "payment_receipt_photo",
+    "payment_receipt_text",
+    "admin_action",
+    "admin_target_user_id",
+)
+
+context_sweep_totals = {"runs": 0, "flows": 0, "addresses": 0, "contexts": 0, "bytes": 0}
+
+
+def consume_reservation(context_data):
+    """Forget the reserved addresses once they belong to a bought service"""
+    for key in RESERVATION_KEYS:
+        context_data.pop(key, None)
+
+
+def release_reservation(context_data):
+    addresses = [
+        context_data.pop(key) for key in RESERVATION_KEYS if context_data.get(key)
+    ]
+    consume_reservation(context_data)
+    return release_addresses(addresses) if addresses else 0
+
+
+def approx_size(value):
+    """Rough memory footprint of a context value, including its contents"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approx_size(k) + approx_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(approx_size(item) for item in value)
+    return size
+
+
+def clear_flow_context(context_data):
+    """Drop the flow keys of an ended or expired conversation; returns (bytes, addresses released)"""
+    freed = sum(
+        approx_size(key) + approx_size(context_data[key])
+        for key in FLOW_KEYS
+        if key in context_data
+    )
+    released = release_reservation(context_data)
+    for key in FLOW_KEYS:
+        context_data.pop(key, None)
+    return freed, released
+
+
+def conversation_expired(context_data, now=None):
+    timeout = CONVERSATION_STATE_TIMEOUTS.get(context_data.get("conversation_state"))
+    if timeout is None:
+        return False
+    return (now or time.time()) - context_data.get("last_active", 0) > timeout
+
+
+def track_conversation_state(handler, check_expiry):
+    callback = handler.callback
+
+    @functools.wraps(callback)
+    async def tracked(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        context_data = context.user_data
+        if check_expiry and conversation_expired(context_data):
+            clear_flow_context(context_data)
+            if context_data.get("conversation_state") in CONVERSATION_RESUMABLE_STATES:
+                return await run(update, context)
+            context_data.pop("conversation_state", None)
+            text = "⌛ زمان این مرحله به پایان رسید. برای شروع دوباره /start را بزنید."
+            if update.callback_query:
+                await update.callback_query.answer()
+                try:
+                    await update.callback_query.edit_message_text(text)
+                except BadRequest:
+                    # Too old to edit; the message is shown in a new one
+                    await update.effective_chat.send_message(text)
+            elif update.effective_message:
+                await update.effective_message.reply_text(text)
+            return ConversationHandler.END
+        return await run(update, context)
+
+    async def run(update, context):
+        context_data = context.user_data
+        new_state = await callback(update, context)
+        context_data["last_active"] = time.time()
+        if new_state == ConversationHandler.END:
+            clear_flow_context(context_data)
+            context_data.pop("conversation_state", None)
+        elif new_state is not None:
+            context_data["conversation_state"] = new_state
+        return new_state
+
+    handler.callback = tracked
+
+
+def track_conversation_states(conv_handler):
+    for handler in conv_handler.entry_points + conv_handler.fallbacks:
+        track_conversation_state(handler, check_expiry=False)
+    for handlers in conv_handler.states.values():
+        for handler in handlers:
+            track_conversation_state(handler, check_expiry=True)
+
+
+async def sweep_conversation_contexts(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """JobQueue callback that reclaims context.user_data of idle users"""
+    warm_up.ensure()
+    now = time.time()
+    flows = addresses = freed = 0
+    dropped = []
+    for user_id, context_data in list(context.application.user_data.items()):
+        idle = now - context_data.get("last_active", 0)
+        if not context_data or (
+            "conversation_state" not in context_data and idle > CONTEXT_IDLE_DROP
+        ):
+            dropped.append(user_id)
+            freed += approx_size(context_data)
+        elif conversation_expired(context_data, now) and any(
+            key in context_data for key in FLOW_KEYS
+        ):
+            flow_bytes, released = clear_flow_context(context_data)
+            flows += 1
+            addresses += released
+            freed += flow_bytes
+    for user_id in dropped:
+        context.application.drop_user_data(user_id)
+
+    context_sweep_totals["runs"] += 1
+    context_sweep_totals["flows"] += flows
+    context_sweep_totals["addresses"] += addresses
+    context_sweep_totals["contexts"] += len(dropped)
+    context_sweep_totals["bytes"] += freed
+    if flows or dropped:
+        logger.info(
+            f"Context sweep: cleared {flows} expired flows, released {addresses} "
+            f"addresses, dropped {len(dropped)} idle contexts, reclaimed ~{freed / 1024:.1f} KiB "
+            f"(total ~{context_sweep_totals['bytes'] / 1024:.1f} KiB over "
+            f"{context_sweep_totals['runs']} runs)"
+        )
@@ -0,0 +1,1332 @@
+# Bot data
+# The shared documents (users, server locations, bot settings), the storage
+# backend they are loaded from, and the indexes and counters derived from the
+# users. Everything that changes a user goes through the helpers here so the
+# derived state stays current.
+import os
+import logging
+import json
+import asyncio
+import bisect
+import struct
+import time
+from array import array
+from collections import deque
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from telegram.error import BadRequest, Forbidden
+
+from dnsbot import analytics
+from dnsbot.storage import open_storage
+
+logger = logging.getLogger(__name__)
+
+
+# Data storage
+USER_DATA_FILE = "user_data.json"
+SERVER_DATA_FILE = "server_data.json"
+BOT_CONFIG_FILE = "bot_config.json"
+USED_ADDRESSES_FILE = "used_addresses.json"
+
+# Sharded deployment (see ingress.py): each worker process handles the users
+# with user_id % WORKER_COUNT == WORKER_INDEX and keeps its derived files in
+# its own directory; shared data lives in the storage backend.
+WORKER_INDEX = int(os.environ.get("WORKER_INDEX", "0"))
+WORKER_COUNT = int(os.environ.get("WORKER_COUNT", "1"))
+LOCAL_DATA_DIR = os.environ.get("BOT_LOCAL_DIR", ".")
+
+# Files derived from the shared data, local to this process
+BROADCAST_JOBS_FILE = os.path.join(LOCAL_DATA_DIR, "broadcast_jobs.json")
+STATS_DATA_FILE = os.path.join(LOCAL_DATA_DIR, "stats_data.json")
+ROLLUPS_FILE = os.path.join(LOCAL_DATA_DIR, "sales_rollups.json")
+REVENUE_FACTS_FILE = os.path.join(LOCAL_DATA_DIR, "revenue_facts.bin")
+PERSISTENCE_FILE = os.path.join(LOCAL_DATA_DIR, "conversations.db")
+
+# Default configurations
+DEFAULT_BOT_CONFIG = {
+    "is_active": True,
+    "admins": ["7240662021"],  # Replace with your Telegram ID
+}
+
+# IP ranges organized for easier management
+DEFAULT_IP_RANGES = {
+    "singapore": {
+        "ipv4_cidr": [
+            "5.222.0.0/15",
+            "46.224.0.0/15",
+            "5.223.0.0/24",
+            "5.223.1.0/24",
+            "5.223.2.0/24",
+            "5.223.3.0/24",
+            "5.223.4.0/24",
+            "5.223.5.0/24",
+            "5.223.6.0/24",
+            "5.223.7.0/24",
+            "5.223.8.0/24",
+            "5.223.9.0/24",
+            "5.223.10.0/24",
+            "5.223.11.0/24",
+            "5.223.12.0/24",
+            "5.223.13.0/24",
+        ],
+        "ipv6_prefix": [
+            "2a01:4ff:2f2::/48",
+            "2a01:4ff:2f3::/48",
+            "2a01:4ff:2f0::/48",
+            "2a01:4ff:2f1::/48",
+        ],
+    },
+    "germany": {
+        "ipv4_cidr": [
+            "80.254.64.0/19",
+            "91.223.192.0/18",
+            "49.12.0.0/15",
+            "65.108.0.0/15",
+            "78.46.0.0/15",
+            "116.202.0.0/15",
+            "80.254.96.0/20",
+        ],
+        "ipv6_prefix": [
+            "2a00:1a28::/32",
+            "2a01:4f8:200::/48",
+            "2a01:4f8:210::/48",
+            "2a01:4f9::/32",
+            "2a0e:7700::/32",
+            "2a01:4f8::/33",
+            "2a06:be80::/29",
+            "2a11:e980::/29",
+        ],
+    },
+    "finland": {
+        "ipv4_cidr": [
+            "185.136.180.0/22",
+            "185.136.184.0/22",
+            "185.136.188.0/22",
+            "95.216.0.0/15",
+            "65.108.0.0/15",
+            "135.181.0.0/16",
+            "37.27.0.0/16",
+            "65.21.0.0/16",
+        ],
+        "ipv6_prefix": [
+            "2a01:4f8:600::/48",
+            "2a01:4f8:610::/48",
+            "2a01:4f8:620::/48",
+            "2a01:4f9:c01f::/48",
+            "2a01:4f9:c010::/48",
+            "2a01:4f9:c011::/48",
+            "2a01:4f9:c012::/48",
+            "2a01:4f9:c01e::/48",
+        ],
+    },
+    "hungary": {
+        "ipv4_cidr": [
+            "31.192.64.0/18",
+            "31.192.128.0/18",
+            "31.192.0.0/19",
+            "5.38.128.0/17",
+            "5.187.128.0/17",
+            "31.46.128.0/17",
+            "31.46.64.0/18",
+            "31.46.32.0/19",
+            "37.76.0.0/17",
+            "46.107.0.0/17",
+            "46.139.0.0/16",
+            "62.201.64.0/18",
+            "78.92.0.0/17",
+            "79.122.0.0/17",
+            "81.182.0.0/16",
+            "81.183.128.0/17",
+            "84.0.0.0/16",
+            "84.3.0.0/16",
+            "84.2.128.0/17",
+            "86.59.128.0/17",
+            "94.27.128.0/17",
+            "134.255.0.0/17",
+            "188.6.0.0/16",
+            "188.36.0.0/16",
+            "188.156.0.0/15",
+            "195.228.192.0/18",
+            "212.51.64.0/18",
+        ],
+        "ipv6_prefix": [
+            "2a00:1a28:100::/48",
+            "2a00:1a28:110::/48",
+            "2a00:1a28:120::/48",
+            "2a02:738::/32",
+            "2001:4c48::/30",
+            "2001:4c4c::/32",
+        ],
+    },
+    "turkey": {
+        "ipv4_cidr": [
+            "5.24.0.0/15",
+            "5.26.0.0/16",
+            "5.27.128.0/17",
+            "31.140.0.0/16",
+            "31.142.0.0/15",
+            "77.67.128.0/17",
+            "141.196.0.0/17",
+            "176.89.0.0/16",
+            "176.91.0.0/16",
+            "176.237.0.0/16",
+            "176.239.0.0/16",
+            "178.240.0.0/16",
+            "178.242.0.0/15",
+            "178.244.0.0/16",
+            "178.246.0.0/16",
+            "188.57.0.0/17",
+            "188.58.0.0/17",
+            "188.59.0.0/17",
+            "213.43.0.0/17",
+        ],
+        "ipv6_prefix": [
+            "2a02:4e0:2000::/41",
+            "2a02:4e0:2100::/41",
+            "2a02:4e0:2200::/41",
+            "2a02:4e0:2300::/41",
+            "2a02:4e0:2400::/41",
+            "2a02:4e0:2500::/41",
+            "2a02:4e0:2700::/41",
+            "2a02:4e0:2900::/41",
+            "2a02:4e0:2a00::/41",
+            "2a02:4e0:2c00::/41",
+            "2a02:4e0:2d00::/41",
+            "2a02:4e0:2e00::/41",
+        ],
+    },
+    "russia": {
+        "ipv4_cidr": [
+            "146.70.0.0/16",
+            "130.195.216.0/21",
+            "185.45.12.0/22",
+            "185.120.144.0/22",
+            "185.183.104.0/22",
+            "185.253.160.0/22",
+        ],
+        "ipv6_prefix": [
+            "2a04:9dc0::/29",
+            "2a0a:b640::/29",
+            "2a04:9dc0:7::/48",
+            "2a04:9dc0:9::/48",
+            "2a0a:b640:1::/48",
+            "2a0a:b640:3::/48",
+        ],
+    },
+}
+
+DEFAULT_SERVER_DATA = {
+    "locations": {
+        "singapore": {
+            "active": True,
+            "flag": "🇸🇬",
+            "name": "سنگاپور",
+            "ipv4_cidr": DEFAULT_IP_RANGES["singapore"]["ipv4_cidr"],
+            "ipv6_prefix": DEFAULT_IP_RANGES["singapore"]["ipv6_prefix"],
+            "price": 20000,
+        },
+        "germany": {
+            "active": True,
+            "flag": "🇩🇪",
+            "name": "آلمان",
+            "ipv4_cidr": DEFAULT_IP_RANGES["germany"]["ipv4_cidr"],
+            "ipv6_prefix": DEFAULT_IP_RANGES["germany"]["ipv6_prefix"],
+            "price": 18000,
+        },
+        "finland": {
+            "active": True,
+            "flag": "🇫🇮",
+            "name": "فنلاند",
+            "ipv4_cidr": DEFAULT_IP_RANGES["finland"]["ipv4_cidr"],
+            "ipv6_prefix": DEFAULT_IP_RANGES["finland"]["ipv6_prefix"],
+            "price": 22500,
+        },
+        "hungary": {  # Fixed capitalization
+            "active": True,
+            "flag": "🇭🇺",
+            "name": "مجارستان",
+            "ipv4_cidr": DEFAULT_IP_RANGES["hungary"]["ipv4_cidr"],
+            "ipv6_prefix": DEFAULT_IP_RANGES["hungary"]["ipv6_prefix"],
+            "price": 16500,
+        },
+        "turkey": {
+            "active": True,
+            "flag": "🇹🇷",
+            "name": "ترکیه",
+            "ipv4_cidr": DEFAULT_IP_RANGES["turkey"]["ipv4_cidr"],
+            "ipv6_prefix": DEFAULT_IP_RANGES["turkey"]["ipv6_prefix"],
+            "price": 19500,
+        },
+        "russia": {
+            "active": True,
+            "flag": "🇷🇺",
+            "name": "روسیه",
+            "ipv4_cidr": DEFAULT_IP_RANGES["russia"]["ipv4_cidr"],
+            "ipv6_prefix": DEFAULT_IP_RANGES["russia"]["ipv6_prefix"],
+            "price": 15000,
+        },
+    },
+    "prices": {"dns_package": 30000},  # Price for the DNS package
+}
+
+DEFAULT_USER_DATA = {}
+
+
+# The storage backend, opened by init_data(). STORAGE_URL is "json:" (the
+# files above) or "sqlite:<path>", which is required when more than one
+# worker shares the data
+storage = None
+
+
+def owns_user(user_id):
+    return WORKER_COUNT <= 1 or int(user_id) % WORKER_COUNT == WORKER_INDEX
+
+
+# Helper functions to load and save data
+# These handle the local files; shared data goes through `storage`
+def load_data(file_path, default_data):
+    try:
+        if os.path.exists(file_path):
+            with open(file_path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        return default_data
+    except Exception as e:
+        logger.error(f"Error loading data from {file_path}: {e}")
+        return default_data
+
+
+def save_data(file_path, data):
+    try:
+        with open(file_path, "w", encoding="utf-8") as file:
+            json.dump(data, file, ensure_ascii=False, indent=4)
+        return True
+    except Exception as e:
+        logger.error(f"Error saving data to {file_path}: {e}")
+        return False
+
+
+# Filled in place by init_data(), so importing this module doesn't read anything
+user_data = {}
+server_data = {}
+bot_config = {}
+
+
+# Users that can currently receive messages. Broadcasts and notifications
+# iterate this index instead of user_data, so users who blocked the bot (or
+# deleted their account) don't cost an API call every time.
+deliverable_users = set()
+
+
+def rebuild_deliverable_index():
+    deliverable_users.clear()
+    deliverable_users.update(
+        user_id
+        for user_id, user_info in user_data.items()
+        # user_data also holds the "pending_payments" bucket, which is not a user
+        if user_id.isdigit() and "unreachable" not in user_info
+    )
+
+
+
+def is_unreachable_error(error):
+    """Return True if `error` means the chat can't receive messages at all"""
+    if isinstance(error, Forbidden):
+        return True
+    return isinstance(error, BadRequest) and "chat not found" in str(error).lower()
+
+
+def mark_user_unreachable(user_id, error):
+    user_id = str(user_id)
+    user_info = user_data.get(user_id)
+    if user_info is None:
+        return
+    now = datetime.now().isoformat()
+    unreachable = {
+        "since": now,
+        **user_info.get("unreachable", {}),
+        "reason": str(error),
+        "last_probe": now,
+    }
+    replace_user(user_id, {**user_info, "unreachable": unreachable})
+    deliverable_users.discard(user_id)
+
+
+def mark_user_reachable(user_id):
+    user_id = str(user_id)
+    user_info = user_data.get(user_id)
+    if user_info is None:
+        return False
+    deliverable_users.add(user_id)
+    if "unreachable" not in user_info:
+        return False
+    replace_user(
+        user_id, {key: value for key, value in user_info.items() if key != "unreachable"}
+    )
+    return True
+
+
+# Versioned user snapshots
+# Readers that run across awaits or in worker threads (exports, analytics,
+# admin sweeps) iterate a snapshot instead of user_data. Users are spread
+# over fixed buckets; a write copies only the bucket it touches, so taking a
+# snapshot is O(buckets) and older snapshots stay valid while writers go on.
+# A user's dict is never changed once it is in user_data: the helpers below
+# build a new dict and store it with replace_user(), so a snapshot taken
+# before a change sees none of it.
+SNAPSHOT_BUCKETS = 64
+
+
+class UserSnapshot:
+    """Read-only view of the users at one version"""
+
+    __slots__ = ("version", "_buckets", "_size")
+
+    def __init__(self, version, buckets, size):
+        self.version = version
+        self._buckets = buckets
+        self._size = size
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for bucket in self._buckets:
+            yield from bucket
+
+    def __contains__(self, user_id):
+        return user_id in self._buckets[hash(user_id) % SNAPSHOT_BUCKETS]
+
+    def get(self, user_id, default=None):
+        return self._buckets[hash(user_id) % SNAPSHOT_BUCKETS].get(user_id, default)
+
+    def items(self):
+        for bucket in self._buckets:
+            yield from bucket.items()
+
+    def values(self):
+        for bucket in self._buckets:
+            yield from bucket.values()
+
+
+class UserSnapshots:
+    def __init__(self):
+        self.version = 0
+        self._buckets = tuple({} for _ in range(SNAPSHOT_BUCKETS))
+        self._size = 0
+        self._pending = None  # bucket index -> copied bucket while a batch is open
+
+    def rebuild(self, users):
+        buckets = [{} for _ in range(SNAPSHOT_BUCKETS)]
+        size = 0
+        for user_id, user_info in users.items():
+            # Only real users; "pending_payments" lives in user_data too
+            if user_id.isdigit():
+                buckets[hash(user_id) % SNAPSHOT_BUCKETS][user_id] = user_info
+                size += 1
+        self._buckets = tuple(buckets)
+        self._size = size
+        self.version += 1
+
+    def _replace(self, changes):
+        # changes: {bucket index: new bucket dict}
+        buckets = list(self._buckets)
+        for index, bucket in changes.items():
+            buckets[index] = bucket
+        self._buckets = tuple(buckets)
+        self._size = sum(len(bucket) for bucket in buckets)
+        self.version += 1
+
+    def _changes(self):
+        # Inside batch() every write goes to the pending copies
+        return {} if self._pending is None else self._pending
+
+    def put(self, user_id, user_info):
+        changes = self._changes()
+        index = hash(user_id) % SNAPSHOT_BUCKETS
+        if index not in changes:
+            changes[index] = dict(self._buckets[index])
+        changes[index][user_id] = user_info
+        if self._pending is None:
+            self._replace(changes)
+
+    @contextmanager
+    def batch(self):
+        """Publish the puts made inside the block together, as one new version"""
+        # Copies each touched bucket once instead of once per user, and
+        # readers see either none of the changes or all of them
+        self._pending = {}
+        try:
+            yield
+        finally:
+            pending, self._pending = self._pending, None
+            if pending:
+                self._replace(pending)
+
+    def remove(self, user_ids):
+        changes = self._changes()
+        for user_id in user_ids:
+            index = hash(user_id) % SNAPSHOT_BUCKETS
+            if index not in changes:
+                changes[index] = dict(self._buckets[index])
+            changes[index].pop(user_id, None)
+        if changes and self._pending is None:
+            self._replace(changes)
+
+    def snapshot(self):
+        return UserSnapshot(self.version, self._buckets, self._size)
+
+
+user_snapshots = UserSnapshots()
+
+
+def replace_user(user_id, user_info):
+    """Store a new dict for a user in user_data and the snapshots"""
+    user_data[user_id] = user_info
+    user_snapshots.put(user_id, user_info)
+
+
+# Create user if not exists
+def ensure_user_exists(user_id, username):
+    user_id = str(user_id)
+    if user_id not in user_data:
+        user_data[user_id] = {
+            "username": username,
+            "balance": 0,
+            "services": [],
+            "joined_at": datetime.now().isoformat(),
+        }
+        deliverable_users.add(user_id)
+        user_snapshots.put(user_id, user_data[user_id])
+        aggregates.on_user_added(user_data[user_id])
+        analytics_snapshot.add_user(user_id, user_data[user_id])
+        report_cache.invalidate("users")
+        save_user_data()
+    elif "unreachable" in user_data[user_id]:
+        # The user is talking to the bot again, so they can receive messages
+        mark_user_reachable(user_id)
+        save_user_data()
+    return user_data[user_id]
+
+
+# Expiry index
+# Services sorted by expiration time, so "what expires in the next N days" is a
+# binary search plus a slice instead of a scan over every service of every user.
+class ExpiryIndex:
+    def __init__(self):
+        self._entries = []  # sorted (expiration timestamp, user_id, purchase_date)
+        self._by_key = {}  # (user_id, purchase_date) -> expiration timestamp
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _key(user_id, service):
+        return (str(user_id), service.get("purchase_date", ""))
+
+    def add(self, user_id, service):
+        if "expiration_date" not in service:
+            return
+        key = self._key(user_id, service)
+        if key in self._by_key:
+            self.discard(user_id, service)
+        expires_at = datetime.fromisoformat(service["expiration_date"]).timestamp()
+        self._by_key[key] = expires_at
+        bisect.insort(self._entries, (expires_at,) + key)
+
+    def discard(self, user_id, service):
+        key = self._key(user_id, service)
+        expires_at = self._by_key.pop(key, None)
+        if expires_at is None:
+            return
+        entry = (expires_at,) + key
+        position = bisect.bisect_left(self._entries, entry)
+        if position < len(self._entries) and self._entries[position] == entry:
+            del self._entries[position]
+
+    def rebuild(self):
+        entries = []
+        for user_id, user_info in user_data.items():
+            if not user_id.isdigit():
+                continue
+            for service in user_info.get("services", []):
+                if "expiration_date" in service:
+                    expires_at = datetime.fromisoformat(
+                        service["expiration_date"]
+                    ).timestamp()
+                    entries.append((expires_at,) + self._key(user_id, service))
+        entries.sort()
+        self._entries = entries
+        self._by_key = {entry[1:]: entry[0] for entry in entries}
+
+    def _bounds(self, start, end):
+        low = bisect.bisect_left(self._entries, (start,))
+        # (end, <max str>) sorts after every entry that expires exactly at `end`
+        high = bisect.bisect_right(self._entries, (end, "\U0010ffff"))
+        return low, high
+
+    def expiring_between(self, start, end):
+        """Return (timestamp, user_id, purchase_date) entries with start <= timestamp <= end"""
+        low, high = self._bounds(start, end)
+        return self._entries[low:high]
+
+    def count_between(self, start, end):
+        low, high = self._bounds(start, end)
+        return max(0, high - low)
+
+
+def find_service(user_id, purchase_date):
+    for service in user_data.get(user_id, {}).get("services", []):
+        if service.get("purchase_date") == purchase_date:
+            return service
+    return None
+
+
+expiry_index = ExpiryIndex()
+
+
+# Address index
+# Which service every sold address belongs to, so the allocator can tell
+# whether an address is taken without going over all services.
+class AddressIndex:
+    def __init__(self):
+        self._owners = {}  # address -> (user_id, purchase_date)
+
+    def __len__(self):
+        return len(self._owners)
+
+    @staticmethod
+    def _addresses(service):
+        return [address for address in service.get("address", "").split("\n") if address]
+
+    def add(self, user_id, service):
+        owner = (str(user_id), service.get("purchase_date", ""))
+        for address in self._addresses(service):
+            self._owners[address] = owner
+
+    def discard(self, user_id, service):
+        owner = (str(user_id), service.get("purchase_date", ""))
+        for address in self._addresses(service):
+            if self._owners.get(address) == owner:
+                del self._owners[address]
+
+    def owner(self, address):
+        return self._owners.get(address)
+
+    def rebuild(self):
+        self._owners = {}
+        for user_id, user_info in user_data.items():
+            if not user_id.isdigit():
+                continue
+            for service in user_info.get("services", []):
+                self.add(user_id, service)
+
+
+address_index = AddressIndex()
+
+
+def update_service(user_id, purchase_date, **fields):
+    """Replace a service of the user with a copy that has `fields` set"""
+    user_info = user_data.get(user_id)
+    if user_info is None:
+        return
+    services = [
+        {**service, **fields} if service.get("purchase_date") == purchase_date else service
+        for service in user_info.get("services", [])
+    ]
+    replace_user(user_id, {**user_info, "services": services})
+
+
+def expiring_window(days):
+    # Matches the old "0 <= (expiration - now).days <= days" check
+    now = time.time()
+    return now, now + (days + 1) * 86400 - 1e-6
+
+
+def count_expiring_services(days=7):
+    return expiry_index.count_between(*expiring_window(days))
+
+
+def get_expiring_services(days=7, limit=None):
+    """Return services expiring within `days` days, soonest first"""
+    now = datetime.now()
+    expiring_services = []
+    entries = expiry_index.expiring_between(*expiring_window(days))
+    for expires_at, user_id, purchase_date in entries[:limit]:
+        service = find_service(user_id, purchase_date)
+        if service is None:
+            continue
+        exp_date = datetime.fromtimestamp(expires_at)
+        expiring_services.append(
+            {
+                "user_id": user_id,
+                "username": user_data[user_id].get("username", "بدون نام کاربری"),
+                "service": service,
+                "location": service["location"],
+                "days_left": (exp_date - now).days,
+                "expiration_date": exp_date,
+            }
+        )
+    return expiring_services
+
+
+# Incrementally maintained aggregates
+# The counters behind the stats and user reports are updated on every mutation
+# and saved next to user_data, so those screens don't need a pass over all
+# users. `rebuild` recomputes them from scratch for verification.
+class Aggregates:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.users = 0
+        self.active_users = 0  # users with at least one service
+        self.total_services = 0
+        self.total_balance = 0
+        self.services_per_location = {}
+        self.joined_by_day = {}  # "YYYY-MM-DD" -> number of users
+
+    def on_user_added(self, user_info):
+        self.users += 1
+        self.total_balance += user_info.get("balance", 0)
+        day = user_info.get("joined_at", "")[:10]
+        if day:
+            self.joined_by_day[day] = self.joined_by_day.get(day, 0) + 1
+        services = user_info.get("services", [])
+        if services:
+            self.active_users += 1
+        for service in services:
+            self._count_service(service, 1)
+
+    def on_user_removed(self, user_info):
+        self.users -= 1
+        self.total_balance -= user_info.get("balance", 0)
+        day = user_info.get("joined_at", "")[:10]
+        if day in self.joined_by_day:
+            self.joined_by_day[day] -= 1
+        services = user_info.get("services", [])
+        if services:
+            self.active_users -= 1
+        for service in services:
+            self._count_service(service, -1)
+
+    def on_balance_change(self, delta):
+        self.total_balance += delta
+
+    def on_service_added(self, user_info, service):
+        # Called after the service was appended to the user's list
+        if len(user_info.get("services", [])) == 1:
+            self.active_users += 1
+        self._count_service(service, 1)
+
+    def _count_service(self, service, delta):
+        self.total_services += delta
+        location = service.get("location")
+        if location:
+            self.services_per_location[location] = (
+                self.services_per_location.get(location, 0) + delta
+            )
+
+    def joined_on(self, day):
+        return self.joined_by_day.get(day.isoformat(), 0)
+
+    def rebuild(self):
+        self.reset()
+        for user_id, user_info in user_data.items():
+            if user_id.isdigit():
+                self.on_user_added(user_info)
+
+    def to_dict(self):
+        return {
+            "users": self.users,
+            "active_users": self.active_users,
+            "total_services": self.total_services,
+            "total_balance": self.total_balance,
+            "services_per_location": dict(self.services_per_location),
+            "joined_by_day": dict(self.joined_by_day),
+        }
+
+    def load(self, data):
+        self.reset()
+        for key, value in data.items():
+            if hasattr(self, key):
+                setattr(self, key, value)
+
+
+def count_users():
+    # user_data holds every user plus the "pending_payments" bucket
+    return len(user_data) - ("pending_payments" in user_data)
+
+
+aggregates = Aggregates()
+
+
+# Sales rollups
+# Sales count and revenue per location are added to daily and hourly buckets
+# at purchase time, so report windows and arbitrary date ranges are answered
+# by summing a few buckets instead of parsing every service.
+HOURLY_ROLLUP_RETENTION_DAYS = 35
+
+
+class SalesRollups:
+    def __init__(self):
+        self.daily = {}  # "YYYY-MM-DD" -> {location: [count, revenue]}
+        self.hourly = {}  # "YYYY-MM-DDTHH" -> {location: [count, revenue]}
+
+    @staticmethod
+    def _add(buckets, key, location, count, amount):
+        totals = buckets.setdefault(key, {}).setdefault(location, [0, 0])
+        totals[0] += count
+        totals[1] += amount
+
+    def record(self, location, when, amount, count=1):
+        self._add(self.daily, when.strftime("%Y-%m-%d"), location, count, amount)
+        self._add(self.hourly, when.strftime("%Y-%m-%dT%H"), location, count, amount)
+
+    def prune(self, now=None):
+        cutoff = (
+            (now or datetime.now()) - timedelta(days=HOURLY_ROLLUP_RETENTION_DAYS)
+        ).strftime("%Y-%m-%dT%H")
+        for key in [key for key in self.hourly if key < cutoff]:
+            del self.hourly[key]
+
+    @staticmethod
+    def _sum(buckets, keys):
+        totals = {}
+        for key in keys:
+            for location, (count, amount) in buckets.get(key, {}).items():
+                location_totals = totals.setdefault(location, [0, 0])
+                location_totals[0] += count
+                location_totals[1] += amount
+        return totals
+
+    def range_totals(self, start_date, end_date):
+        """Return {location: [count, revenue]} for the days start_date..end_date (inclusive)"""
+        if not self.daily:
+            return {}
+        # The range comes from the admin and can span thousands of years;
+        # nothing was sold before the first recorded day or after today
+        first_day = date.fromisoformat(self.first_day())
+        start_date = max(start_date, first_day)
+        end_date = min(end_date, date.today())
+        days = (end_date - start_date).days + 1
+        if days <= 0:
+            return {}
+        if days > len(self.daily):
+            start, end = start_date.isoformat(), end_date.isoformat()
+            keys = [key for key in self.daily if start <= key <= end]
+        else:
+            keys = ((start_date + timedelta(days=i)).isoformat() for i in range(days))
+        return self._sum(self.daily, keys)
+
+    def last_days(self, days, today=None):
+        """Totals for the last `days` calendar days, including today"""
+        today = today or datetime.now().date()
+        return self.range_totals(today - timedelta(days=days - 1), today)
+
+    def last_hours(self, hours, now=None):
+        """Totals for the current hour and the `hours - 1` hours before it"""
+        now = now or datetime.now()
+        return self._sum(
+            self.hourly,
+            (
+                (now - timedelta(hours=i)).strftime("%Y-%m-%dT%H")
+                for i in range(hours)
+            ),
+        )
+
+    def first_day(self):
+        return min(self.daily) if self.daily else None
+
+    def rebuild(self):
+        """Recompute all buckets from the services in user_data"""
+        self.daily = {}
+        self.hourly = {}
+        for user_id, user_info in user_data.items():
+            if not user_id.isdigit():
+                continue
+            for service in user_info.get("services", []):
+                if "purchase_date" in service and service.get("location"):
+                    self.record(
+                        service["location"],
+                        datetime.fromisoformat(service["purchase_date"]),
+                        service_price(service),
+                    )
+        self.prune()
+
+    def to_dict(self):
+        return {"daily": self.daily, "hourly": self.hourly}
+
+    def load(self, data):
+        self.daily = data.get("daily", {})
+        self.hourly = data.get("hourly", {})
+
+
+def service_price(service):
+    """Best known price of a service at purchase time"""
+    if "amount" in service:
+        return service["amount"]
+    # Older services don't record what was charged; use the current price
+    loc_data = server_data["locations"].get(service.get("location"), {})
+    return loc_data.get("price", server_data["prices"]["dns_package"])
+
+
+def sum_totals(totals):
+    count = sum(location_totals[0] for location_totals in totals.values())
+    revenue = sum(location_totals[1] for location_totals in totals.values())
+    return count, revenue
+
+
+sales_rollups = SalesRollups()
+
+
+# Revenue fact table
+# One row per sale (timestamp, location id, amount) kept in three typed arrays
+# sorted by time. Revenue for a window is a binary search plus a sum over an
+# array slice, and per-location revenue is a single bincount when numpy is
+# installed.
+SERVICE_CURRENCY = "IRT"  # Iranian toman, the unit all prices are stored in
+REVENUE_FACTS_HEADER = struct.Struct("<II")  # row count, location table size
+
+
+class RevenueFacts:
+    def __init__(self):
+        self.timestamps = array("d")
+        self.location_ids = array("H")
+        self.amounts = array("q")
+        self.locations = []  # location id -> location code
+        self._location_ids = {}
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def location_id(self, location):
+        if location not in self._location_ids:
+            self._location_ids[location] = len(self.locations)
+            self.locations.append(location)
+        return self._location_ids[location]
+
+    def append(self, timestamp, location, amount):
+        position = len(self.timestamps)
+        if position and timestamp < self.timestamps[-1]:
+            # Out of order (e.g. clock change); keep the table sorted
+            position = bisect.bisect_right(self.timestamps, timestamp)
+        self.timestamps.insert(position, timestamp)
+        self.location_ids.insert(position, self.location_id(location))
+        self.amounts.insert(position, int(amount))
+        self.dirty = True
+
+    def _bounds(self, start, end):
+        low = bisect.bisect_left(self.timestamps, start)
+        high = bisect.bisect_left(self.timestamps, end)
+        return low, high
+
+    def revenue_between(self, start, end):
+        """Total revenue for sales with start <= timestamp < end"""
+        low, high = self._bounds(start, end)
+        return sum(self.amounts[low:high])
+
+    def revenue_by_location(self, start, end):
+        """Return {location: revenue} for sales with start <= timestamp < end"""
+        low, high = self._bounds(start, end)
+        numpy = analytics.load_numpy()
+        if numpy is not None:
+            sums = numpy.bincount(
+                numpy.frombuffer(self.location_ids, dtype=numpy.uint16)[low:high],
+                weights=numpy.frombuffer(self.amounts, dtype=numpy.int64)[low:high],
+                minlength=len(self.locations),
+            )
+            totals = {
+                self.locations[location_id]: int(total)
+                for location_id, total in enumerate(sums)
+                if total
+            }
+        else:
+            sums = [0] * len(self.locations)
+            for location_id, amount in zip(
+                self.location_ids[low:high], self.amounts[low:high]
+            ):
+                sums[location_id] += amount
+            totals = {
+                self.locations[location_id]: total
+                for location_id, total in enumerate(sums)
+                if total
+            }
+        return totals
+
+    def rebuild(self):
+        rows = []
+        for user_id, user_info in user_data.items():
+            if not user_id.isdigit():
+                continue
+            for service in user_info.get("services", []):
+                if "purchase_date" in service and service.get("location"):
+                    rows.append(
+                        (
+                            datetime.fromisoformat(service["purchase_date"]).timestamp(),
+                            service["location"],
+                            service_price(service),
+                        )
+                    )
+        rows.sort()
+        self.__init__()
+        for timestamp, location, amount in rows:
+            self.timestamps.append(timestamp)
+            self.location_ids.append(self.location_id(location))
+            self.amounts.append(int(amount))
+        self.dirty = True
+
+    def save(self, file_path=REVENUE_FACTS_FILE):
+        try:
+            locations = json.dumps(self.locations).encode("utf-8")
+            with open(file_path, "wb") as file:
+                file.write(REVENUE_FACTS_HEADER.pack(len(self), len(locations)))
+                file.write(locations)
+                self.timestamps.tofile(file)
+                self.location_ids.tofile(file)
+                self.amounts.tofile(file)
+            self.dirty = False
+            return True
+        except Exception as e:
+            logger.error(f"Error saving revenue facts to {file_path}: {e}")
+            return False
+
+    def load(self, file_path=REVENUE_FACTS_FILE):
+        try:
+            with open(file_path, "rb") as file:
+                count, locations_size = REVENUE_FACTS_HEADER.unpack(
+                    file.read(REVENUE_FACTS_HEADER.size)
+                )
+                self.__init__()
+                for location in json.loads(file.read(locations_size)):
+                    self.location_id(location)
+                self.timestamps.fromfile(file, count)
+                self.location_ids.fromfile(file, count)
+                self.amounts.fromfile(file, count)
+            return True
+        except Exception as e:
+            logger.error(f"Error loading revenue facts from {file_path}: {e}")
+            self.__init__()
+            return False
+
+
+def backfill_service_prices():
+    """Record a price on services bought before prices were stored; returns how many were updated"""
+    updated = 0
+    changed = {}
+    for user_id, user_info in user_data.items():
+        if not user_id.isdigit():
+            continue
+        services = user_info.get("services", [])
+        missing = sum("amount" not in service for service in services)
+        if not missing:
+            continue
+        # The real price paid is unknown; this is the price at backfill time
+        services = [
+            service
+            if "amount" in service
+            else {
+                **service,
+                "amount": service_price(service),
+                "currency": SERVICE_CURRENCY,
+                "amount_estimated": True,
+            }
+            for service in services
+        ]
+        updated += missing
+        changed[user_id] = {**user_info, "services": services}
+    with user_snapshots.batch():
+        for user_id, user_info in changed.items():
+            replace_user(user_id, user_info)
+    sales_rollups.rebuild()
+    revenue_facts.rebuild()
+    analytics_snapshot.invalidate()
+    report_cache.clear()
+    return updated
+
+
+revenue_facts = RevenueFacts()
+
+
+# Report cache
+# Rendered report texts are cached per report type and parameters. Entries
+# expire after REPORT_CACHE_TTL seconds and are dropped earlier when one of the
+# kinds of data they depend on changes ("users", "balances", "purchases" or
+# "payments") or the server locations are saved, so repeated presses by several
+# admins are served from memory. Expired entries are pruned whenever a report
+# is built.
+REPORT_CACHE_TTL = 60  # seconds
+
+
+class ReportCache:
+    def __init__(self, ttl=REPORT_CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}  # key -> (expires_at, value)
+        self._keys_by_dependency = {}  # dependency -> set of keys
+
+    def get_or_build(self, key, build, depends_on=()):
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None and entry[0] > now:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        self._prune(now)
+        value = build()
+        self._entries[key] = (now + self.ttl, value)
+        for dependency in depends_on:
+            self._keys_by_dependency.setdefault(dependency, set()).add(key)
+        return value
+
+    def _prune(self, now):
+        # Keys with parameters (date ranges) are rarely asked for again, so
+        # expired entries are dropped instead of waiting to be rebuilt
+        expired = {key for key, (expires_at, _) in self._entries.items() if expires_at <= now}
+        if not expired:
+            return
+        for key in expired:
+            del self._entries[key]
+        for keys in self._keys_by_dependency.values():
+            keys -= expired
+
+    def invalidate(self, *dependencies):
+        for dependency in dependencies:
+            for key in self._keys_by_dependency.pop(dependency, ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_dependency.clear()
+
+    def format_stats(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total * 100 if total else 0
+        return (
+            f"🗂 کش گزارش‌ها: {self.hits} hit | {self.misses} miss "
+            f"({hit_rate:.0f}%) | {len(self._entries)} مورد"
+        )
+
+
+report_cache = ReportCache()
+
+
+# Columnar snapshot for cohort and LTV reports, built on first use and then
+# kept current by ensure_user_exists / add_user_service
+analytics_snapshot = analytics.AnalyticsSnapshot()
+
+
+def save_derived_data():
+    # Whatever warm-up hasn't rebuilt yet is partial; keep its file as it is
+    if not warm_up.is_pending("aggregates"):
+        save_data(STATS_DATA_FILE, aggregates.to_dict())
+    if not warm_up.is_pending("sales rollups"):
+        save_data(ROLLUPS_FILE, sales_rollups.to_dict())
+    if revenue_facts.dirty and not warm_up.is_pending("revenue facts"):
+        revenue_facts.save()
+
+
+def save_user_data():
+    """Save user_data together with the aggregates derived from it"""
+    saved = storage.save_users(user_data, owns=owns_user)
+    save_derived_data()
+    return saved
+
+
+def adjust_balance(user_id, delta):
+    user_info = user_data[str(user_id)]
+    # A shared backend applies the delta atomically and returns the result,
+    # which also picks up changes other workers made in the meantime
+    balance = storage.add_balance(user_id, delta)
+    if balance is None:
+        balance = user_info.get("balance", 0) + delta
+    aggregates.on_balance_change(balance - user_info.get("balance", 0))
+    replace_user(str(user_id), {**user_info, "balance": balance})
+    report_cache.invalidate("balances")
+    return balance
+
+
+def add_user_service(user_id, service):
+    user_info = user_data[str(user_id)]
+    user_info = {**user_info, "services": user_info.get("services", []) + [service]}
+    replace_user(str(user_id), user_info)
+    aggregates.on_service_added(user_info, service)
+    expiry_index.add(user_id, service)
+    address_index.add(user_id, service)
+    purchased_at = datetime.fromisoformat(service["purchase_date"])
+    sales_rollups.record(service["location"], purchased_at, service_price(service))
+    sales_rollups.prune()
+    revenue_facts.append(
+        purchased_at.timestamp(), service["location"], service_price(service)
+    )
+    analytics_snapshot.add_service(str(user_id), service, service_price(service))
+    report_cache.invalidate("purchases")
+
+
+def remove_users(user_ids):
+    for user_id in user_ids:
+        user_info = user_data.pop(user_id, None)
+        if user_info is None:
+            continue
+        aggregates.on_user_removed(user_info)
+        deliverable_users.discard(user_id)
+        for service in user_info.get("services", []):
+            expiry_index.discard(user_id, service)
+            address_index.discard(user_id, service)
+    user_snapshots.remove(user_ids)
+    storage.delete_users(user_ids)
+    analytics_snapshot.invalidate()
+    report_cache.invalidate("users", "balances", "purchases")
+
+
+def apply_stored_user(user_id, user_info):
+    """Take over a user another worker changed in the storage; None removes the user"""
+    old = user_data.get(user_id)
+    known_purchases = set()
+    if old is not None:
+        aggregates.on_user_removed(old)
+        for service in old.get("services", []):
+            expiry_index.discard(user_id, service)
+            address_index.discard(user_id, service)
+            known_purchases.add(service.get("purchase_date"))
+    if user_info is None:
+        user_data.pop(user_id, None)
+        deliverable_users.discard(user_id)
+        user_snapshots.remove([user_id])
+        analytics_snapshot.invalidate()
+        return
+
+    replace_user(user_id, user_info)
+    aggregates.on_user_added(user_info)
+    if "unreachable" in user_info:
+        deliverable_users.discard(user_id)
+    else:
+        deliverable_users.add(user_id)
+    analytics_snapshot.add_user(user_id, user_info)
+    for service in user_info.get("services", []):
+        expiry_index.add(user_id, service)
+        address_index.add(user_id, service)
+        if (
+            service.get("purchase_date") in known_purchases
+            or "purchase_date" not in service
+            or not service.get("location")
+        ):
+            continue
+        # A sale made on the worker that owns this user
+        purchased_at = datetime.fromisoformat(service["purchase_date"])
+        price = service_price(service)
+        sales_rollups.record(service["location"], purchased_at, price)
+        revenue_facts.append(purchased_at.timestamp(), service["location"], price)
+        analytics_snapshot.add_service(user_id, service, price)
+
+
+def refresh_pending_payments():
+    """Return pending_payments, reloaded first when other workers may have added some"""
+    payments = storage.load_payments()
+    if payments is not None:
+        user_data["pending_payments"] = payments
+        report_cache.invalidate("payments")
+    return user_data.get("pending_payments", {})
+
+
+# Function to convert Gregorian date to Persian date
+def gregorian_to_persian(date_str):
+    from jdatetime import date as jdate
+
+    try:
+        gregorian_date = datetime.fromisoformat(date_str).date()
+        persian_date = jdate(
+            gregorian_date.year, gregorian_date.month, gregorian_date.day
+        )
+        return persian_date.strftime("%Y/%m/%d")
+    except ValueError:
+        return "تاریخ نامعتبر"
+
+
+# Startup
+# Importing this module only defines things. init_data() loads what the first
+# update needs: the shared data and the derived state that is cheap to read
+# back from its files. Everything that has to be rebuilt from user_data (the
+# indexes, and counters or rollups whose files are missing or stale) is
+# queued on warm_up and built in the background after the bot has started;
+# code that reads those indexes calls warm_up.ensure() first, which finishes
+# whatever is still queued.
+WARM_UP_DELAY = 2  # seconds; updates queued while the bot was down go first
+
+
+class WarmUp:
+    def __init__(self):
+        self._steps = deque()
+        self._task = None
+
+    def is_pending(self, name):
+        return any(step_name == name for step_name, _ in self._steps)
+
+    def start(self, then):
+        """Run the steps in a background task, then await the coroutine `then`"""
+
+        async def run_then():
+            await self.run()
+            await then
+
+        self._task = asyncio.create_task(run_then())
+
+    def add(self, name, step):
+        self._steps.append((name, step))
+
+    def _run_step(self):
+        name, step = self._steps.popleft()
+        started = time.monotonic()
+        step()
+        logger.info(f"Warm-up: {name} in {time.monotonic() - started:.2f}s")
+
+    def ensure(self):
+        """Run the remaining steps now"""
+        if self._steps:
+            while self._steps:
+                self._run_step()
+            save_derived_data()
+
+    async def run(self):
+        await asyncio.sleep(WARM_UP_DELAY)
+        started = time.monotonic()
+        # Each step runs in one go, between updates, so nothing sees it half done
+        while self._steps:
+            self._run_step()
+            await asyncio.sleep(0)
+        save_derived_data()
+        logger.info(f"Warm-up finished in {time.monotonic() - started:.2f}s")
+
+
+warm_up = WarmUp()
+
+
+def init_data():
+    """Load the data the bot needs before it takes updates"""
+    global storage
+    started = time.monotonic()
+    os.makedirs(LOCAL_DATA_DIR, exist_ok=True)
+    storage = open_storage(os.environ.get("STORAGE_URL"), USER_DATA_FILE)
+    if WORKER_COUNT > 1 and not storage.shared:
+        raise RuntimeError("Sharded workers need a shared STORAGE_URL, e.g. sqlite:bot.db")
+    user_data.update(storage.load_users() or DEFAULT_USER_DATA)
+    server_data.update(storage.load_document(SERVER_DATA_FILE, DEFAULT_SERVER_DATA))
+    bot_config.update(storage.load_document(BOT_CONFIG_FILE, DEFAULT_BOT_CONFIG))
+
+    aggregates.load(load_data(STATS_DATA_FILE, {}))
+    if os.path.exists(ROLLUPS_FILE):
+        sales_rollups.load(load_data(ROLLUPS_FILE, {}))
+    else:
+        # First start with rollups: backfill them from the existing services
+        warm_up.add("sales rollups", sales_rollups.rebuild)
+    if not (os.path.exists(REVENUE_FACTS_FILE) and revenue_facts.load()):
+        warm_up.add("revenue facts", revenue_facts.rebuild)
+    if aggregates.users != count_users():
+        # Missing or stale counters (e.g. user_data.json edited by hand)
+        warm_up.add("aggregates", aggregates.rebuild)
+    warm_up.add("deliverable index", rebuild_deliverable_index)
+    warm_up.add("user snapshots", lambda: user_snapshots.rebuild(user_data))
+    warm_up.add("expiry index", expiry_index.rebuild)
+    warm_up.add("address index", address_index.rebuild)
+    logger.info(f"Loaded data in {time.monotonic() - started:.2f}s")
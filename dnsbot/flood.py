@@ -0,0 +1,111 @@
+# Flood control
+# Runs before every other handler. Each user has a token bucket (a sustained
+# rate plus a burst) and all users together share a global budget; updates
+# over either limit are dropped, and a repeat of the same button within
+# FLOOD_COALESCE_WINDOW is coalesced into the first press. Dropped callback
+# queries still get an answer so the button stops spinning. Admins are exempt.
+# Tunable in bot_config: flood_user_rate, flood_user_burst, flood_global_rate.
+import time
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+from telegram.error import TelegramError
+
+from dnsbot.data import bot_config
+from dnsbot.config import is_admin
+from dnsbot.outbound import TokenBucket
+
+
+DEFAULT_FLOOD_USER_RATE = 1.0  # updates per second
+DEFAULT_FLOOD_USER_BURST = 5
+DEFAULT_FLOOD_GLOBAL_RATE = 100  # updates per second
+FLOOD_COALESCE_WINDOW = 1.0  # seconds
+FLOOD_PRUNE_INTERVAL = 5 * 60  # seconds
+
+
+class FloodControl:
+    def __init__(self):
+        self._users = {}  # user_id -> (tokens, last refill time)
+        self._last_callback = {}  # user_id -> (callback data, time)
+        self._global_bucket = None
+        self._pruned_at = time.monotonic()
+        self.counters = {"passed": 0, "coalesced": 0, "user_limited": 0, "global_limited": 0}
+
+    @property
+    def global_bucket(self):
+        rate = float(bot_config.get("flood_global_rate", DEFAULT_FLOOD_GLOBAL_RATE))
+        if self._global_bucket is None or self._global_bucket.rate != rate:
+            self._global_bucket = TokenBucket(rate)
+        return self._global_bucket
+
+    def check(self, user_id, callback_data=None):
+        """Return None if the update may pass, otherwise why it is dropped"""
+        now = time.monotonic()
+        if now - self._pruned_at > FLOOD_PRUNE_INTERVAL:
+            self._prune(now)
+
+        if callback_data is not None:
+            last = self._last_callback.get(user_id)
+            if last and last[0] == callback_data and now - last[1] < FLOOD_COALESCE_WINDOW:
+                self.counters["coalesced"] += 1
+                return "coalesced"
+            self._last_callback[user_id] = (callback_data, now)
+
+        rate = float(bot_config.get("flood_user_rate", DEFAULT_FLOOD_USER_RATE))
+        burst = float(bot_config.get("flood_user_burst", DEFAULT_FLOOD_USER_BURST))
+        tokens, updated = self._users.get(user_id, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens < 1:
+            self._users[user_id] = (tokens, now)
+            self.counters["user_limited"] += 1
+            return "user_limited"
+        if not self.global_bucket.try_acquire():
+            self.counters["global_limited"] += 1
+            return "global_limited"
+        self._users[user_id] = (tokens - 1, now)
+        self.counters["passed"] += 1
+        return None
+
+    def _prune(self, now):
+        # A bucket that has refilled completely is the same as no bucket
+        rate = float(bot_config.get("flood_user_rate", DEFAULT_FLOOD_USER_RATE))
+        burst = float(bot_config.get("flood_user_burst", DEFAULT_FLOOD_USER_BURST))
+        self._users = {
+            user_id: (tokens, updated)
+            for user_id, (tokens, updated) in self._users.items()
+            if tokens + (now - updated) * rate < burst
+        }
+        self._last_callback = {
+            user_id: last
+            for user_id, last in self._last_callback.items()
+            if now - last[1] < FLOOD_COALESCE_WINDOW
+        }
+        self._pruned_at = now
+
+    def format_stats(self):
+        counters = self.counters
+        return (
+            f"🚦 کنترل فلود: عبور {counters['passed']} | ادغام {counters['coalesced']} | "
+            f"محدودیت کاربر {counters['user_limited']} | محدودیت کلی {counters['global_limited']}"
+        )
+
+
+flood_limiter = FloodControl()
+
+
+async def flood_control(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user = update.effective_user
+    if user is None or is_admin(user.id):
+        return
+    query = update.callback_query
+    reason = flood_limiter.check(user.id, query.data if query else None)
+    if reason is None:
+        return
+    if query:
+        try:
+            if reason == "coalesced":
+                await query.answer()
+            else:
+                await query.answer("⏳ لطفا کمی صبر کنید...")
+        except TelegramError:
+            pass
+    raise ApplicationHandlerStop
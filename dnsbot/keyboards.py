@@ -0,0 +1,91 @@
+# Keyboard registry
+# InlineKeyboardMarkup objects are immutable, so menus that never change are
+# built once and shared. Keyboards derived from server_data are prebuilt in
+# the config snapshot whenever it is compiled (see config.py).
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from dnsbot import config
+
+
+class KeyboardRegistry:
+    def __init__(self):
+        self._static = {}
+
+    def static(self, name, rows):
+        self._static[name] = InlineKeyboardMarkup(rows)
+
+    def get(self, name):
+        if name in self._static:
+            return self._static[name]
+        return config.snapshot.keyboards[name]
+
+    def back(self, callback_data):
+        """Single "back" button leading to `callback_data`"""
+        name = f"back:{callback_data}"
+        if name not in self._static:
+            self.static(
+                name, [[InlineKeyboardButton("🔙 بازگشت", callback_data=callback_data)]]
+            )
+        return self._static[name]
+
+
+keyboards = KeyboardRegistry()
+
+MAIN_MENU_ROWS = [
+    [InlineKeyboardButton("🌐 خرید DNS", callback_data="buy_dns")],
+    [
+        InlineKeyboardButton("💰 کیف پول", callback_data="wallet"),
+        InlineKeyboardButton("📋 سرویس های من", callback_data="my_services"),
+    ],
+    [
+        InlineKeyboardButton("👤 حساب کاربری", callback_data="user_profile"),
+        InlineKeyboardButton("➕ افزایش موجودی", callback_data="add_balance"),
+    ],  # Add "Add Balance" button
+]
+keyboards.static("main_menu", MAIN_MENU_ROWS)
+keyboards.static(
+    "main_menu_admin",
+    MAIN_MENU_ROWS
+    + [[InlineKeyboardButton("👑 پنل مدیریت", callback_data="admin_panel")]],
+)
+# Improved layout with 3x3 button arrangement
+keyboards.static(
+    "admin_panel",
+    [
+        [
+            InlineKeyboardButton("👥 مدیریت کاربران", callback_data="manage_users"),
+            InlineKeyboardButton("🌐 مدیریت سرورها", callback_data="manage_servers"),
+            InlineKeyboardButton("⚙️ تنظیمات ربات", callback_data="bot_settings"),
+        ],
+        [
+            InlineKeyboardButton("📊 آمار", callback_data="stats"),
+            InlineKeyboardButton("🔄 مدیریت سرویس‌ها", callback_data="manage_services"),
+            InlineKeyboardButton("📝 گزارش‌ گیری", callback_data="generate_reports"),
+        ],
+        [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_main")],
+    ],
+)
+# Payment plans
+keyboards.static(
+    "wallet_amounts",
+    [
+        [
+            InlineKeyboardButton("50,000 تومان", callback_data="payment_50000"),
+            InlineKeyboardButton("100,000 تومان", callback_data="payment_100000"),
+            InlineKeyboardButton("200,000 تومان", callback_data="payment_200000"),
+        ],
+        [
+            InlineKeyboardButton("300,000 تومان", callback_data="payment_300000"),
+            InlineKeyboardButton("500,000 تومان", callback_data="payment_500000"),
+            InlineKeyboardButton("1,000,000 تومان", callback_data="payment_1000000"),
+        ],
+        [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_main")],
+    ],
+)
+keyboards.static(
+    "wallet",
+    [
+        [InlineKeyboardButton("➕ افزایش موجودی", callback_data="add_balance")],
+        [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_main")],
+    ],
+)
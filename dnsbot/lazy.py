@@ -0,0 +1,42 @@
+# Lazily imported modules
+# The admin panel and the reports (with their export, analytics and process
+# pool code) are only used by admins, so they are not imported at startup.
+# Their handlers are registered through proxies that import the module the
+# first time one of them is called and then call straight through.
+import importlib
+import sys
+
+from dnsbot.config import is_admin
+
+
+def load(name):
+    """Import dnsbot.<name> if it isn't imported yet and return it"""
+    return importlib.import_module(f"dnsbot.{name}")
+
+
+def loaded(name):
+    """dnsbot.<name> if something imported it already, else None"""
+    return sys.modules.get(f"dnsbot.{name}")
+
+
+def handler(name, attribute):
+    """Handler that runs dnsbot.<name>.<attribute>"""
+
+    async def proxy(update, context):
+        return await getattr(load(name), attribute)(update, context)
+
+    proxy.__name__ = proxy.__qualname__ = attribute
+    return proxy
+
+
+def admin_command(name, attribute):
+    """Like handler(), but other users' commands don't import the module"""
+
+    async def proxy(update, context):
+        # The commands ignore everyone else anyway
+        if not is_admin(update.effective_user.id):
+            return None
+        return await getattr(load(name), attribute)(update, context)
+
+    proxy.__name__ = proxy.__qualname__ = attribute
+    return proxy
@@ -0,0 +1,146 @@
+# Main menu
+# /start and the main menu buttons: profile, services and the way into the
+# wallet, the purchase flow and the admin panel.
+from datetime import datetime
+from telegram import Update
+from telegram.ext import ContextTypes, ConversationHandler
+
+from dnsbot import config, lazy
+from dnsbot.states import ADMIN_PANEL, MAIN_MENU, SELECT_LOCATION, WALLET
+from dnsbot.data import (
+    bot_config,
+    ensure_user_exists,
+    gregorian_to_persian,
+    server_data,
+)
+from dnsbot.config import is_admin
+from dnsbot.keyboards import keyboards
+
+
+# Command handlers
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    user = update.effective_user
+    ensure_user_exists(user.id, user.username)
+
+    if not bot_config.get("is_active", True) and not is_admin(user.id):
+        await update.message.reply_text(
+            "ربات در حال حاضر غیرفعال است. لطفا بعدا مراجعه کنید."
+        )
+        return ConversationHandler.END
+
+    reply_markup = keyboards.get("main_menu_admin" if is_admin(user.id) else "main_menu")
+
+    await update.message.reply_text(
+        f"سلام {user.first_name}! به ربات فروش DNS خوش آمدید.",
+        reply_markup=reply_markup,
+    )
+
+    return MAIN_MENU
+
+
+async def menu_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
+    user_id = query.from_user.id
+
+    if query.data == "user_profile":
+        user_info = ensure_user_exists(user_id, query.from_user.username)
+        join_date = datetime.fromisoformat(user_info["joined_at"]).strftime("%Y-%m-%d")
+        persian_date = gregorian_to_persian(user_info["joined_at"])
+        services_count = len(user_info.get("services", []))
+
+        reply_markup = keyboards.back("back_to_main")
+
+        await query.edit_message_text(
+            f"👤 *اطلاعات حساب کاربری*\n\n"
+            f"🆔 شناسه کاربری: `{user_id}`\n"
+            f"👤 نام کاربری: @{user_info['username'] or 'بدون نام کاربری'}\n"
+            f"💰 موجودی: {user_info['balance']} تومان\n"
+            f"📊 تعداد سرویس‌ها: {services_count}\n"
+            f"📅 تاریخ عضویت: {persian_date}",
+            reply_markup=reply_markup,
+            parse_mode="Markdown",
+        )
+        return MAIN_MENU
+
+    elif query.data == "wallet":
+        user_info = ensure_user_exists(user_id, query.from_user.username)
+        reply_markup = keyboards.back("back_to_main")
+
+        await query.edit_message_text(
+            f"💰 موجودی کیف پول شما: {user_info['balance']} تومان",
+            reply_markup=reply_markup,
+        )
+        return WALLET
+
+    elif query.data == "buy_dns":
+        # Check if any locations are active
+        if not config.snapshot.active_locations:
+            await query.edit_message_text(
+                "در حال حاضر هیچ لوکیشنی برای خرید فعال نیست.",
+                reply_markup=keyboards.back("back_to_main"),
+            )
+            return MAIN_MENU
+
+        reply_markup = keyboards.get("locations")
+
+        await query.edit_message_text(
+            "🌍 لطفا لوکیشن مورد نظر خود را انتخاب کنید:\n"
+            "(هر سرویس شامل یک آدرس IPv4 و یک آدرس IPv6 می‌باشد)",
+            reply_markup=reply_markup,
+        )
+        return SELECT_LOCATION
+
+    elif query.data == "my_services":
+        user_info = ensure_user_exists(user_id, query.from_user.username)
+        if not user_info.get("services", []):
+            await query.edit_message_text(
+                "شما هنوز سرویسی خریداری نکرده‌اید.",
+                reply_markup=keyboards.back("back_to_main"),
+            )
+        else:
+            message = "📋 *سرویس‌های شما:*\n\n"
+            for index, service in enumerate(user_info.get("services", []), 1):
+                loc_data = server_data["locations"][service["location"]]
+                message += f"*سرویس {index}:*\n"
+                # عدم نمایش نوع سرویس و فقط نمایش لوکیشن و آدرس و تاریخ
+                message += f"🔹 لوکیشن: {loc_data['flag']} {loc_data['name']}\n"
+                message += f"🔹 آدرس: `{service['address']}`\n"
+                purchase_date = datetime.fromisoformat(service["purchase_date"])
+                persian_purchase_date = gregorian_to_persian(service["purchase_date"])
+
+                # Check if expiration_date exists (for backward compatibility)
+                if "expiration_date" in service:
+                    expiration_date = datetime.fromisoformat(service["expiration_date"])
+                    persian_expiration_date = gregorian_to_persian(
+                        service["expiration_date"]
+                    )
+                    message += f"🔹 تاریخ خرید: {persian_purchase_date}\n"
+                    message += f"🔹 تاریخ انقضا: {persian_expiration_date}\n\n"
+                else:
+                    message += f"🔹 تاریخ خرید: {persian_purchase_date}\n\n"
+
+            await query.edit_message_text(
+                message,
+                reply_markup=keyboards.back("back_to_main"),
+                parse_mode="Markdown",
+            )
+        return MAIN_MENU
+
+    elif query.data == "admin_panel" and is_admin(user_id):
+        # Import the admin panel now rather than on its first button
+        lazy.load("admin")
+        reply_markup = keyboards.get("admin_panel")
+
+        await query.edit_message_text("👑 پنل مدیریت", reply_markup=reply_markup)
+        return ADMIN_PANEL
+
+    elif query.data == "back_to_main":
+        reply_markup = keyboards.get(
+            "main_menu_admin" if is_admin(user_id) else "main_menu"
+        )
+
+        await query.edit_message_text("منوی اصلی:", reply_markup=reply_markup)
+        return MAIN_MENU
+
+    return MAIN_MENU
@@ -0,0 +1,250 @@
+# Outbound message dispatcher
+# Every message the bot sends on its own (not as a reply to a button press)
+# goes through one dispatcher with two priority lanes. Telegram allows roughly
+# 30 messages per second overall, so both lanes share one token bucket and
+# bulk traffic (broadcasts, reminders) only gets the tokens that transactional
+# traffic (payment notices, receipts) is not using.
+import logging
+import asyncio
+import time
+from collections import deque
+from datetime import timedelta
+from telegram.error import RetryAfter
+
+from dnsbot.data import WORKER_COUNT, bot_config
+
+logger = logging.getLogger(__name__)
+
+
+LANE_TRANSACTIONAL = "transactional"
+LANE_BULK = "bulk"
+OUTBOUND_LANES = (LANE_TRANSACTIONAL, LANE_BULK)  # in priority order
+DEFAULT_OUTBOUND_RATE = 30  # messages per second
+DEFAULT_OUTBOUND_MAX_IN_FLIGHT = 20
+OUTBOUND_MAX_RETRIES = 3
+PER_CHAT_INTERVAL = 1.0  # seconds between two bulk messages to one chat
+
+
+class TokenBucket:
+    """Async token bucket that paces outgoing requests to `rate` per second"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    async def acquire(self):
+        # Waiters queue on the lock, so tokens are handed out in FIFO order
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+    def try_acquire(self):
+        """Take a token if one is available right now, without waiting"""
+        self._refill()
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def pause(self, seconds):
+        """Stop handing out tokens for `seconds` (used when Telegram sends RetryAfter)"""
+        self._refill()
+        # Requests in flight all get the same RetryAfter; the wait must not
+        # add up across them
+        self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class PerChatLimiter:
+    """Keeps at least `interval` seconds between two messages to the same chat"""
+
+    def __init__(self, interval=PER_CHAT_INTERVAL):
+        self.interval = interval
+        self._next_allowed = {}
+
+    async def wait(self, chat_id):
+        now = time.monotonic()
+        next_allowed = self._next_allowed.get(chat_id, now)
+        self._next_allowed[chat_id] = max(now, next_allowed) + self.interval
+        if next_allowed > now:
+            await asyncio.sleep(next_allowed - now)
+
+    def prune(self):
+        now = time.monotonic()
+        self._next_allowed = {
+            chat_id: ts for chat_id, ts in self._next_allowed.items() if ts > now
+        }
+
+
+def retry_after_seconds(error):
+    # retry_after is an int in older PTB releases and a timedelta in newer ones
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class LaneStats:
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.latency_avg = 0.0  # exponential moving average, seconds
+        self.latency_max = 0.0
+
+    def record(self, latency, ok):
+        if ok:
+            self.sent += 1
+        else:
+            self.failed += 1
+        if self.sent + self.failed == 1:
+            self.latency_avg = latency
+        else:
+            self.latency_avg += (latency - self.latency_avg) * 0.1
+        self.latency_max = max(self.latency_max, latency)
+
+
+class OutboundRequest:
+    def __init__(self, lane, chat_id, method, args, kwargs, future):
+        self.lane = lane
+        self.chat_id = chat_id
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+
+
+class OutboundDispatcher:
+    def __init__(self):
+        self._queues = {lane: deque() for lane in OUTBOUND_LANES}
+        self.stats = {lane: LaneStats() for lane in OUTBOUND_LANES}
+        self.chat_limiter = PerChatLimiter()
+        self._bucket = None
+        self._wakeup = None
+        self._in_flight = None
+        self._pump_task = None
+
+    @property
+    def bucket(self):
+        """The shared token bucket, rebuilt if the configured rate changed"""
+        rate = float(bot_config.get("outbound_rate", DEFAULT_OUTBOUND_RATE))
+        # The Bot API limit is per token, so sharded workers split it
+        rate /= WORKER_COUNT
+        if self._bucket is None or self._bucket.rate != rate:
+            self._bucket = TokenBucket(rate)
+        return self._bucket
+
+    def queue_depth(self, lane):
+        return len(self._queues[lane])
+
+    def _ensure_started(self):
+        if self._pump_task is None or self._pump_task.done():
+            self._wakeup = asyncio.Event()
+            self._in_flight = asyncio.Semaphore(
+                bot_config.get(
+                    "outbound_max_in_flight", DEFAULT_OUTBOUND_MAX_IN_FLIGHT
+                )
+            )
+            self._pump_task = asyncio.get_running_loop().create_task(self._pump())
+
+    async def submit(self, lane, chat_id, method, /, *args, **kwargs):
+        """Queue `method(*args, **kwargs)` on `lane` and return its result once sent"""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._queues[lane].append(
+            OutboundRequest(lane, chat_id, method, args, kwargs, future)
+        )
+        self._wakeup.set()
+        return await future
+
+    async def send_message(
+        self, bot, chat_id, text, lane=LANE_TRANSACTIONAL, **kwargs
+    ):
+        return await self.submit(
+            lane, chat_id, bot.send_message, chat_id=chat_id, text=text, **kwargs
+        )
+
+    async def _pump(self):
+        while True:
+            if not any(self._queues.values()):
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            await self._in_flight.acquire()
+            await self.bucket.acquire()
+            # Pick the request only after getting a token, so a transactional
+            # message that arrived in the meantime still goes first
+            request = None
+            for lane in OUTBOUND_LANES:
+                if self._queues[lane]:
+                    request = self._queues[lane].popleft()
+                    break
+            if request is None:
+                self._in_flight.release()
+                continue
+            asyncio.get_running_loop().create_task(self._execute(request))
+
+    async def _execute(self, request):
+        try:
+            if request.lane == LANE_BULK:
+                await self.chat_limiter.wait(request.chat_id)
+            result = await request.method(*request.args, **request.kwargs)
+        except RetryAfter as e:
+            delay = retry_after_seconds(e)
+            logger.warning(
+                f"Flood limit hit while sending to {request.chat_id}, waiting {delay}s"
+            )
+            # Pausing the shared bucket holds back both lanes, and the retry
+            # waits for a token like every other request
+            self.bucket.pause(delay)
+            retry = request.attempts < OUTBOUND_MAX_RETRIES
+            if retry and not request.future.done():
+                request.attempts += 1
+                self._queues[request.lane].appendleft(request)
+                self._wakeup.set()
+            else:
+                self._finish(request, error=e)
+        except Exception as e:
+            self._finish(request, error=e)
+        else:
+            self._finish(request, result=result)
+        finally:
+            self._in_flight.release()
+
+    def _finish(self, request, result=None, error=None):
+        self.stats[request.lane].record(
+            time.monotonic() - request.enqueued_at, error is None
+        )
+        if request.future.done():
+            return
+        if error is None:
+            request.future.set_result(result)
+        else:
+            request.future.set_exception(error)
+
+    def format_stats(self):
+        lines = []
+        for lane in OUTBOUND_LANES:
+            stats = self.stats[lane]
+            lines.append(
+                f"📤 {lane}: صف {self.queue_depth(lane)} | "
+                f"ارسال {stats.sent} | خطا {stats.failed} | "
+                f"تاخیر {stats.latency_avg:.2f}s (حداکثر {stats.latency_max:.2f}s)"
+            )
+        return "\n".join(lines)
+
+
+outbound = OutboundDispatcher()
@@ -0,0 +1,185 @@
+# Conversation persistence
+# Keeps ConversationHandler states and context.user_data in SQLite so a
+# restart doesn't drop users in the middle of a purchase or a payment.
+# PicklePersistence rewrites the whole pickle on every flush; here each
+# context.user_data key is its own row, and only keys whose value changed since
+# the last write (or that were removed) are written. Rows not touched for
+# max_age are dropped at startup and at most load_limit users and
+# conversations are loaded, most recent first, so startup stays bounded.
+import json
+import logging
+import sqlite3
+import time
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+
+class SqlitePersistence(BasePersistence):
+    def __init__(self, path, update_interval=30, max_age=7 * 86400, load_limit=10000):
+        super().__init__(
+            store_data=PersistenceInput(
+                bot_data=False, chat_data=False, user_data=True, callback_data=False
+            ),
+            update_interval=update_interval,
+        )
+        self.path = path
+        self.max_age = max_age
+        self.load_limit = load_limit
+        self._written = {}  # user_id -> {key: JSON text} as last written
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS context_users (
+                user_id INTEGER PRIMARY KEY,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS user_context (
+                user_id INTEGER NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (user_id, key)
+            );
+            CREATE TABLE IF NOT EXISTS conversations (
+                name TEXT NOT NULL,
+                key TEXT NOT NULL,
+                state TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (name, key)
+            );
+            CREATE INDEX IF NOT EXISTS conversations_updated_at
+                ON conversations (updated_at);
+            """
+        )
+        self._prune()
+
+    def _prune(self):
+        cutoff = time.time() - self.max_age
+        self._db.execute("BEGIN")
+        self._db.execute(
+            "DELETE FROM user_context WHERE user_id IN "
+            "(SELECT user_id FROM context_users WHERE updated_at < ?)",
+            (cutoff,),
+        )
+        users = self._db.execute(
+            "DELETE FROM context_users WHERE updated_at < ?", (cutoff,)
+        ).rowcount
+        conversations = self._db.execute(
+            "DELETE FROM conversations WHERE updated_at < ?", (cutoff,)
+        ).rowcount
+        self._db.execute("COMMIT")
+        if users or conversations:
+            logger.info(
+                f"Dropped {users} idle user contexts and {conversations} idle conversations"
+            )
+
+    # user_data
+    async def get_user_data(self):
+        user_data = {}
+        for user_id, key, value in self._db.execute(
+            "SELECT user_id, key, value FROM user_context WHERE user_id IN "
+            "(SELECT user_id FROM context_users ORDER BY updated_at DESC LIMIT ?)",
+            (self.load_limit,),
+        ):
+            user_data.setdefault(user_id, {})[key] = json.loads(value)
+            self._written.setdefault(user_id, {})[key] = value
+        logger.info(f"Loaded conversation data of {len(user_data)} users")
+        return user_data
+
+    async def update_user_data(self, user_id, data):
+        written = self._written.get(user_id, {})
+        current = {
+            key: json.dumps(value, ensure_ascii=False, sort_keys=True)
+            for key, value in data.items()
+        }
+        changed = [
+            (user_id, key, value)
+            for key, value in current.items()
+            if written.get(key) != value
+        ]
+        removed = [(user_id, key) for key in written if key not in current]
+        if not changed and not removed:
+            return
+        self._db.execute("BEGIN")
+        self._db.executemany(
+            "INSERT OR REPLACE INTO user_context (user_id, key, value) VALUES (?, ?, ?)",
+            changed,
+        )
+        self._db.executemany(
+            "DELETE FROM user_context WHERE user_id = ? AND key = ?", removed
+        )
+        self._db.execute(
+            "INSERT OR REPLACE INTO context_users (user_id, updated_at) VALUES (?, ?)",
+            (user_id, time.time()),
+        )
+        self._db.execute("COMMIT")
+        self._written[user_id] = current
+
+    async def drop_user_data(self, user_id):
+        self._db.execute("BEGIN")
+        self._db.execute("DELETE FROM user_context WHERE user_id = ?", (user_id,))
+        self._db.execute("DELETE FROM context_users WHERE user_id = ?", (user_id,))
+        self._db.execute("COMMIT")
+        self._written.pop(user_id, None)
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    # Conversations
+    async def get_conversations(self, name):
+        conversations = {}
+        for key, state in self._db.execute(
+            "SELECT key, state FROM conversations WHERE name = ? "
+            "ORDER BY updated_at DESC LIMIT ?",
+            (name, self.load_limit),
+        ):
+            conversations[tuple(json.loads(key))] = json.loads(state)
+        logger.info(f"Loaded {len(conversations)} {name} conversations")
+        return conversations
+
+    async def update_conversation(self, name, key, new_state):
+        key = json.dumps(list(key))
+        if new_state is None:
+            self._db.execute(
+                "DELETE FROM conversations WHERE name = ? AND key = ?", (name, key)
+            )
+        else:
+            self._db.execute(
+                "INSERT OR REPLACE INTO conversations (name, key, state, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                (name, key, json.dumps(new_state), time.time()),
+            )
+
+    async def flush(self):
+        self._db.close()
+
+    # Only user_data and conversations are stored
+    async def get_chat_data(self):
+        return {}
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def get_bot_data(self):
+        return {}
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_callback_data(self, data):
+        pass
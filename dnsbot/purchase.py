@@ -0,0 +1,447 @@
+# Purchase flow
+# Choosing a location and address type, reserving addresses and confirming
+# the purchase against the user's balance.
+import logging
+from datetime import datetime, timedelta
+from telegram import (
+    Update,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+)
+from telegram.ext import ContextTypes
+
+from dnsbot import config
+from dnsbot.states import CONFIRM_PURCHASE, MAIN_MENU, SELECT_IP_TYPE, SELECT_LOCATION
+from dnsbot.data import (
+    SERVICE_CURRENCY,
+    add_user_service,
+    adjust_balance,
+    ensure_user_exists,
+    gregorian_to_persian,
+    save_user_data,
+    server_data,
+)
+from dnsbot.allocator import generate_ipv4, generate_ipv6, generate_ipv6_pair
+from dnsbot.keyboards import keyboards
+from dnsbot.conversation import consume_reservation, release_reservation
+
+logger = logging.getLogger(__name__)
+
+
+async def location_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
+
+    if query.data.startswith("direct_purchase_"):
+        location = query.data.split("_")[2]
+        context.user_data["selected_location"] = location
+        context.user_data["selected_ip_type"] = "dns_package"  # For price reference
+
+        await direct_purchase(update, context)
+        return CONFIRM_PURCHASE
+
+    elif query.data.startswith("location_"):
+        # This part should not be reached with the new changes
+        location = query.data.split("_")[1]
+        context.user_data["selected_location"] = location
+
+        keyboard = [
+            [InlineKeyboardButton("IPv4", callback_data="ip_type_ipv4")],
+            [InlineKeyboardButton("IPv6", callback_data="ip_type_ipv6")],
+            [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_locations")],
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+
+        loc_data = server_data["locations"][location]
+        await query.edit_message_text(
+            f"شما لوکیشن {loc_data['flag']} {loc_data['name']} را انتخاب کردید.\n"
+            "لطفا نوع IP مورد نظر خود را انتخاب کنید:",
+            reply_markup=reply_markup,
+        )
+        return SELECT_IP_TYPE
+
+    elif query.data == "back_to_locations":
+        reply_markup = keyboards.get("locations")
+
+        await query.edit_message_text(
+            "🌍 لطفا لوکیشن مورد نظر خود را انتخاب کنید:\n"
+            "(هر سرویس شامل یک آدرس IPv4 و یک آدرس IPv6 می‌باشد)",
+            reply_markup=reply_markup,
+        )
+        return SELECT_LOCATION
+
+    return MAIN_MENU
+
+
+async def ip_type_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
+    user_id = query.from_user.id
+    user_info = ensure_user_exists(user_id, query.from_user.username)
+
+    if query.data.startswith("ip_type_"):
+        ip_type = query.data.split("_")[2]
+        location = context.user_data.get("selected_location")
+        price = server_data["prices"][ip_type]
+
+        context.user_data["selected_ip_type"] = ip_type
+
+        # Generate IP addresses for both IPv4 and IPv6
+        # برای IPv4
+        cidr = server_data["locations"][location]["ipv4_cidr"][0]
+        ipv4_address = next(generate_ipv4(cidr))
+
+        # برای IPv6
+        prefix = server_data["locations"][location]["ipv6_prefix"][0]
+        ipv6_address = next(generate_ipv6(prefix))
+
+        # ذخیره هر دو آدرس
+        context.user_data["selected_ipv4"] = ipv4_address
+        context.user_data["selected_ipv6"] = ipv6_address
+
+        # ذخیره آدرس انتخابی کاربر برای سازگاری با کد قبلی
+        if ip_type == "ipv4":
+            context.user_data["selected_ip"] = ipv4_address
+        else:
+            context.user_data["selected_ip"] = ipv6_address
+
+        keyboard = [
+            [InlineKeyboardButton("✅ تایید و خرید", callback_data="confirm_purchase")],
+            [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_ip_type")],
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+
+        loc_data = server_data["locations"][location]
+        await query.edit_message_text(
+            f"جزئیات خرید:\n\n"
+            f"🌍 لوکیشن: {loc_data['flag']} {loc_data['name']}\n"
+            f"🔢 نوع IP: {ip_type.upper()}\n"
+            f"🔗 آدرس IPv4: `{ipv4_address}`\n"
+            f"🔗 آدرس IPv6: `{ipv6_address}`\n"
+            f"💰 قیمت: {price} تومان\n\n"
+            f"موجودی فعلی شما: {user_info['balance']} تومان",
+            reply_markup=reply_markup,
+            parse_mode="Markdown",
+        )
+        return CONFIRM_PURCHASE
+
+    elif query.data == "confirm_direct_purchase":
+        return await confirm_direct_purchase(update, context)
+
+    elif query.data == "back_to_ip_type":
+        location = context.user_data.get("selected_location")
+        keyboard = [
+            [InlineKeyboardButton("IPv4", callback_data="ip_type_ipv4")],
+            [InlineKeyboardButton("IPv6", callback_data="ip_type_ipv6")],
+            [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_locations")],
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+
+        loc_data = server_data["locations"][location]
+        await query.edit_message_text(
+            f"شما لوکیشن {loc_data['flag']} {loc_data['name']} را انتخاب کردید.\n"
+            "لطفا نوع IP مورد نظر خود را انتخاب کنید:",
+            reply_markup=reply_markup,
+        )
+        return SELECT_IP_TYPE
+
+    return MAIN_MENU
+
+
+async def confirm_purchase_callback(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> int:
+    query = update.callback_query
+    await query.answer()
+    user_id = query.from_user.id
+    user_info = ensure_user_exists(user_id, query.from_user.username)
+
+    if query.data == "confirm_purchase":
+        ip_type = context.user_data.get("selected_ip_type")
+        location = context.user_data.get("selected_location")
+        ipv4_address = context.user_data.get("selected_ipv4")
+        ipv6_address = context.user_data.get("selected_ipv6")
+
+        # حالا از قیمت پکیج کامل استفاده می‌کنیم
+        price = server_data["prices"]["dns_package"]
+
+        if user_info["balance"] < price:
+            await query.edit_message_text(
+                "❌ موجودی کیف پول شما کافی نیست.\n"
+                "لطفا ابتدا موجودی خود را افزایش دهید.",
+                reply_markup=keyboards.back("back_to_main"),
+            )
+            return MAIN_MENU
+
+        # Process purchase
+        balance = adjust_balance(user_id, -price)
+
+        # Calculate expiration date (30 days from now)
+        purchase_date = datetime.now()
+        expiration_date = purchase_date + timedelta(days=30)
+        persian_expiration_date = gregorian_to_persian(expiration_date.isoformat())
+
+        # ایجاد یک سرویس جدید به جای دو سرویس IPv4 و IPv6 جداگانه
+        service = {
+            "location": location,
+            "address": f"{ipv4_address}\n{ipv6_address}",
+            "purchase_date": purchase_date.isoformat(),
+            "expiration_date": expiration_date.isoformat(),
+            "amount": price,
+            "currency": SERVICE_CURRENCY,
+        }
+
+        # اضافه کردن سرویس به کاربر
+        add_user_service(user_id, service)
+        consume_reservation(context.user_data)
+        save_user_data()
+
+        loc_data = server_data["locations"][location]
+
+        await query.edit_message_text(
+            f"✅ *خرید شما با موفقیت انجام شد!*\n\n"
+            f"🌍 لوکیشن: {loc_data['flag']} {loc_data['name']}\n"
+            f"⏱ مدت اعتبار: 30 روز (تا {persian_expiration_date})\n\n"
+            f"🔹 *آدرس IPv4:*\n`{ipv4_address}`\n\n"
+            f"🔹 *آدرس IPv6:*\n`{ipv6_address}`\n\n"
+            f"💰 قیمت: {price} تومان\n"
+            f"💰 موجودی جدید: {balance} تومان",
+            reply_markup=InlineKeyboardMarkup(
+                [
+                    [
+                        InlineKeyboardButton(
+                            "🔙 بازگشت به منوی اصلی", callback_data="back_to_main"
+                        )
+                    ]
+                ]
+            ),
+            parse_mode="Markdown",
+        )
+        return MAIN_MENU
+
+    elif query.data == "back_to_ip_type":
+        location = context.user_data.get("selected_location")
+        keyboard = [
+            [InlineKeyboardButton("IPv4", callback_data="ip_type_ipv4")],
+            [InlineKeyboardButton("IPv6", callback_data="ip_type_ipv6")],
+            [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_locations")],
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+
+        loc_data = server_data["locations"][location]
+        await query.edit_message_text(
+            f"شما لوکیشن {loc_data['flag']} {loc_data['name']} را انتخاب کردید.\n"
+            "لطفا نوع IP مورد نظر خود را انتخاب کنید:",
+            reply_markup=reply_markup,
+        )
+        return SELECT_IP_TYPE
+
+    return MAIN_MENU
+
+
+async def direct_purchase(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    user_id = query.from_user.id
+    user_info = ensure_user_exists(user_id, query.from_user.username)
+    location = context.user_data.get("selected_location")
+
+    # Validate location exists and is on sale
+    if location not in config.snapshot.active_locations:
+        await query.edit_message_text(
+            "❌ خطا: لوکیشن انتخابی نامعتبر است. لطفا دوباره تلاش کنید.",
+            reply_markup=keyboards.back("back_to_main"),
+        )
+        return MAIN_MENU
+
+    loc_data = server_data["locations"][location]
+    price = loc_data.get(
+        "price", server_data["prices"]["dns_package"]
+    )  # Price for the package
+
+    # Check if user has enough balance before generating IPs
+    if user_info["balance"] < price:
+        await query.edit_message_text(
+            "❌ موجودی کیف پول شما کافی نیست.\n" "لطفا ابتدا موجودی خود را افزایش دهید.",
+            reply_markup=InlineKeyboardMarkup(
+                [
+                    [
+                        InlineKeyboardButton(
+                            "➕ افزایش موجودی", callback_data="add_balance"
+                        ),
+                        InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_main"),
+                    ]
+                ]
+            ),
+        )
+        return MAIN_MENU
+
+    # Addresses reserved on an earlier visit to this step go back to the pool
+    release_reservation(context.user_data)
+
+    # Generate addresses with error handling
+    try:
+        # Generate IPv4 address
+        cidrs = loc_data["ipv4_cidr"]
+
+        # Log the CIDR ranges being used
+        logger.info(f"Generating IPv4 from CIDRs: {cidrs}")
+
+        ipv4_address = generate_ipv4(cidrs)
+        if not ipv4_address:
+            raise ValueError("Failed to generate valid IPv4 address")
+
+        logger.info(f"Generated IPv4: {ipv4_address}")
+
+        # Generate IPv6 pair
+        import random
+
+        prefixes = loc_data["ipv6_prefix"]
+        if not prefixes:
+            raise ValueError(f"No IPv6 prefixes found for location {location}")
+
+        prefix = random.choice(prefixes)
+        ipv6_address_0, ipv6_address_1 = generate_ipv6_pair(prefix)
+        logger.info(f"Generated IPv6 pair: {ipv6_address_0}, {ipv6_address_1}")
+
+        # Verify we got valid addresses
+        if not ipv6_address_0 or not ipv6_address_1:
+            raise ValueError("Failed to generate valid IPv6 addresses")
+
+        # Store in context
+        context.user_data["selected_ipv4"] = ipv4_address
+        context.user_data["selected_ipv6_0"] = ipv6_address_0
+        context.user_data["selected_ipv6_1"] = ipv6_address_1
+        # The price shown here is the one charged on confirm
+        context.user_data["selected_price"] = price
+
+    except Exception as e:
+        logger.error(f"Error generating IP addresses: {e}")
+        await query.edit_message_text(
+            "❌ خطا در تولید آدرس‌های IP. لطفا دوباره تلاش کنید یا با پشتیبانی تماس بگیرید.",
+            reply_markup=keyboards.back("back_to_main"),
+        )
+        return MAIN_MENU
+
+    # Show confirmation message with details
+    keyboard = [
+        [
+            InlineKeyboardButton(
+                "✅ تایید و خرید", callback_data="confirm_direct_purchase"
+            )
+        ],
+        [InlineKeyboardButton("🔙 انصراف", callback_data="back_to_locations")],
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+
+    expiration_date = datetime.now() + timedelta(days=30)
+    persian_expiration_date = gregorian_to_persian(expiration_date.isoformat())
+
+    # Format price with thousand separator
+    formatted_price = f"{price:,}"
+    formatted_balance = f"{user_info['balance']:,}"
+
+    await query.edit_message_text(
+        f"📋 *جزئیات سرویس*\n\n"
+        f"🌍 لوکیشن: {loc_data['flag']} {loc_data['name']}\n"
+        f"💰 قیمت: {formatted_price} تومان\n"
+        f"⏱ مدت اعتبار: 30 روز (تا {persian_expiration_date})\n\n"
+        f"💰 موجودی فعلی شما: {formatted_balance} تومان\n\n"
+        f"آیا مایل به خرید این سرویس هستید؟\n"
+        f"(آدرس‌ها پس از تایید خرید نمایش داده می‌شوند)",
+        reply_markup=reply_markup,
+        parse_mode="Markdown",
+    )
+    return CONFIRM_PURCHASE
+
+
+async def confirm_direct_purchase(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    user_id = query.from_user.id
+    user_info = ensure_user_exists(user_id, query.from_user.username)
+    location = context.user_data.get("selected_location")
+    price = context.user_data.pop("selected_price", None)
+
+    # The location may have been switched off or the config reloaded since
+    # the confirmation screen was shown
+    if location not in config.snapshot.active_locations or price is None:
+        release_reservation(context.user_data)
+        await query.edit_message_text(
+            "❌ این لوکیشن در حال حاضر در دسترس نیست. لطفا دوباره لوکیشن را انتخاب کنید.",
+            reply_markup=keyboards.back("back_to_main"),
+        )
+        return MAIN_MENU
+
+    loc_data = server_data["locations"][location]
+    ipv4_address = context.user_data.get("selected_ipv4")
+    ipv6_address_0 = context.user_data.get("selected_ipv6_0")
+    ipv6_address_1 = context.user_data.get("selected_ipv6_1")
+
+    if user_info["balance"] < price:
+        await query.edit_message_text(
+            "❌ موجودی کیف پول شما کافی نیست.\n" "لطفا ابتدا موجودی خود را افزایش دهید.",
+            reply_markup=keyboards.back("back_to_main"),
+        )
+        return MAIN_MENU
+
+    # Process purchase
+    balance = adjust_balance(user_id, -price)
+
+    # Calculate expiration date (30 days from now)
+    purchase_date = datetime.now()
+    expiration_date = purchase_date + timedelta(days=30)
+    persian_expiration_date = gregorian_to_persian(expiration_date.isoformat())
+
+    # ایجاد یک سرویس ترکیبی برای تمامی آدرس‌ها
+    service = {
+        "location": location,
+        "address": f"{ipv4_address}\n{ipv6_address_0}\n{ipv6_address_1}",
+        "purchase_date": purchase_date.isoformat(),
+        "expiration_date": expiration_date.isoformat(),
+        "amount": price,
+        "currency": SERVICE_CURRENCY,
+    }
+
+    # اضافه کردن سرویس به کاربر
+    add_user_service(user_id, service)
+    consume_reservation(context.user_data)
+    if not save_user_data():
+        logger.error(f"Failed to save service purchase for user {user_id}")
+        await query.edit_message_text(
+            "❌ خطا در ذخیره‌سازی اطلاعات سرویس. لطفاً با پشتیبانی تماس بگیرید.",
+            reply_markup=InlineKeyboardMarkup(
+                [
+                    [
+                        InlineKeyboardButton(
+                            "🔙 بازگشت به منوی اصلی", callback_data="back_to_main"
+                        )
+                    ]
+                ]
+            ),
+        )
+        return MAIN_MENU
+
+    loc_data = server_data["locations"][location]
+    expiration_date_str = persian_expiration_date
+
+    await query.edit_message_text(
+        f"✅ *خرید شما با موفقیت انجام شد!*\n\n"
+        f"🌍 لوکیشن: {loc_data['flag']} {loc_data['name']}\n"
+        f"⏱ مدت اعتبار: 30 روز (تا {expiration_date_str})\n\n"
+        f"🔹 *آدرس IPv4:*\n`{ipv4_address}`\n\n"
+        f"🔹 *آدرس‌های IPv6:*\n`{ipv6_address_0}`\n`{ipv6_address_1}`\n\n"
+        f"💰 قیمت: {price} تومان\n"
+        f"💰 موجودی جدید: {balance} تومان",
+        reply_markup=InlineKeyboardMarkup(
+            [
+                [
+                    InlineKeyboardButton(
+                        "🔙 بازگشت به منوی اصلی", callback_data="back_to_main"
+                    )
+                ]
+            ]
+        ),
+        parse_mode="Markdown",
+    )
+    return MAIN_MENU
@@ -0,0 +1,129 @@
+# Heavy report jobs
+# These functions run in worker processes, so they only see the serialized
+# rows they are given and must not import the bot modules. Each job is split into a map
+# step over one chunk of users and a reduce step that merges chunk results in
+# the bot process.
+#
+# A user row is (user_id, joined_at, balance, services), where services is a
+# list of (location, purchase_date, expiration_date, amount, ip_addresses).
+from datetime import datetime
+
+COHORT_MAX_OFFSET = 11
+
+
+def month_key(iso_date):
+    return iso_date[:7]
+
+
+def month_offset(start, end):
+    return (int(end[:4]) - int(start[:4])) * 12 + int(end[5:7]) - int(start[5:7])
+
+
+# Full-history income by month
+def income_by_month_chunk(rows):
+    months = {}  # "YYYY-MM" -> {location: [count, revenue]}
+    for _, _, _, services in rows:
+        for location, purchase_date, _, amount, _ in services:
+            if not purchase_date:
+                continue
+            bucket = months.setdefault(month_key(purchase_date), {}).setdefault(
+                location, [0, 0]
+            )
+            bucket[0] += 1
+            bucket[1] += amount
+    return months
+
+
+def merge_income_by_month(total, part):
+    for month, locations in part.items():
+        target = total.setdefault(month, {})
+        for location, (count, revenue) in locations.items():
+            bucket = target.setdefault(location, [0, 0])
+            bucket[0] += count
+            bucket[1] += revenue
+    return total
+
+
+# Cohort table: per join month, the cohort size and how many of its users
+# bought in each following month
+def cohort_table_chunk(rows):
+    cohorts = {}  # "YYYY-MM" -> [size, buyers at +0, +1, ... +COHORT_MAX_OFFSET]
+    for _, joined_at, _, services in rows:
+        if not joined_at:
+            continue
+        cohort = month_key(joined_at)
+        row = cohorts.setdefault(cohort, [0] * (COHORT_MAX_OFFSET + 2))
+        row[0] += 1
+        offsets = {
+            month_offset(joined_at, purchase_date)
+            for _, purchase_date, _, _, _ in services
+            if purchase_date
+        }
+        for offset in offsets:
+            if 0 <= offset <= COHORT_MAX_OFFSET:
+                row[offset + 1] += 1
+    return cohorts
+
+
+def merge_cohort_table(total, part):
+    for cohort, counts in part.items():
+        row = total.setdefault(cohort, [0] * len(counts))
+        for index, count in enumerate(counts):
+            row[index] += count
+    return total
+
+
+# Integrity check: problems that can be found per user, plus the addresses
+# so duplicates across users are found when the chunks are merged
+def integrity_check_chunk(rows):
+    result = {"issues": [], "addresses": {}}
+    for user_id, joined_at, balance, services in rows:
+        if balance < 0:
+            result["issues"].append((user_id, "negative_balance", balance))
+        try:
+            datetime.fromisoformat(joined_at)
+        except ValueError:
+            result["issues"].append((user_id, "bad_joined_at", joined_at))
+        for location, purchase_date, expiration_date, amount, addresses in services:
+            if not location:
+                result["issues"].append((user_id, "missing_location", purchase_date))
+            try:
+                purchased = datetime.fromisoformat(purchase_date)
+                expires = datetime.fromisoformat(expiration_date)
+            except (TypeError, ValueError):
+                result["issues"].append((user_id, "bad_dates", purchase_date))
+                continue
+            if expires < purchased:
+                result["issues"].append((user_id, "expires_before_purchase", purchase_date))
+            if amount < 0:
+                result["issues"].append((user_id, "negative_amount", amount))
+            for address in addresses:
+                result["addresses"].setdefault(address, []).append(user_id)
+    return result
+
+
+def merge_integrity_check(total, part):
+    total["issues"].extend(part["issues"])
+    for address, owners in part["addresses"].items():
+        total["addresses"].setdefault(address, []).extend(owners)
+    return total
+
+
+def integrity_duplicates(result):
+    """Addresses assigned to more than one service"""
+    return {
+        address: owners
+        for address, owners in result["addresses"].items()
+        if len(owners) > 1
+    }
+
+
+JOBS = {
+    "income_months": (income_by_month_chunk, merge_income_by_month, dict),
+    "cohorts": (cohort_table_chunk, merge_cohort_table, dict),
+    "integrity": (
+        integrity_check_chunk,
+        merge_integrity_check,
+        lambda: {"issues": [], "addresses": {}},
+    ),
+}
@@ -0,0 +1,701 @@
+# Reports
+# Report builders for the admin panel, sales ranges, data export and the
+# process pool for heavy reports. Only imported once an admin uses them
+# (see lazy.py).
+import os
+import logging
+import json
+import asyncio
+import csv
+import gzip
+import tempfile
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from telegram import Update
+from telegram.ext import Application, ContextTypes
+from telegram.constants import ChatAction
+from telegram.error import TelegramError
+
+from dnsbot import report_jobs
+from dnsbot.data import (
+    SERVICE_CURRENCY,
+    aggregates,
+    analytics_snapshot,
+    backfill_service_prices,
+    bot_config,
+    report_cache,
+    revenue_facts,
+    sales_rollups,
+    save_user_data,
+    server_data,
+    service_price,
+    sum_totals,
+    user_data,
+    user_snapshots,
+    warm_up,
+)
+from dnsbot.config import is_admin
+
+logger = logging.getLogger(__name__)
+
+
+# Report builders
+def build_sales_report():
+    # Generate sales report from the daily/hourly rollups
+    sales_today, _ = sum_totals(sales_rollups.last_days(1))
+    sales_day, _ = sum_totals(sales_rollups.last_hours(24))
+    sales_week, _ = sum_totals(sales_rollups.last_days(7))
+    sales_month, _ = sum_totals(sales_rollups.last_days(30))
+
+    # Most popular location
+    location_counts = {
+        location: count
+        for location, count in aggregates.services_per_location.items()
+        if count > 0 and location in server_data["locations"]
+    }
+
+    most_popular = (
+        max(location_counts.items(), key=lambda x: x[1])
+        if location_counts
+        else (None, 0)
+    )
+
+    if most_popular[0]:
+        loc_data = server_data["locations"][most_popular[0]]
+        popular_location = (
+            f"{loc_data['flag']} {loc_data['name']} ({most_popular[1]} سرویس)"
+        )
+    else:
+        popular_location = "هیچ"
+
+    return (
+        f"📊 *گزارش فروش*\n\n"
+        f"🔸 فروش امروز: {sales_today} سرویس\n"
+        f"🔸 فروش ۲۴ ساعت اخیر: {sales_day} سرویس\n"
+        f"🔸 فروش هفته اخیر: {sales_week} سرویس\n"
+        f"🔸 فروش ماه اخیر: {sales_month} سرویس\n\n"
+        f"📍 محبوب‌ترین لوکیشن: {popular_location}\n"
+    )
+
+
+def build_users_report():
+    # User statistics
+    total_users = aggregates.users
+    active_users = aggregates.active_users
+    inactive_users = total_users - active_users
+
+    total_balance = aggregates.total_balance
+    avg_balance = total_balance / total_users if total_users > 0 else 0
+
+    # Users joined today
+    joined_today = aggregates.joined_on(datetime.now().date())
+
+    return (
+        f"👥 *گزارش کاربران*\n\n"
+        f"🔸 کل کاربران: {total_users}\n"
+        f"🔸 کاربران فعال: {active_users}\n"
+        f"🔸 کاربران غیرفعال: {inactive_users}\n"
+        f"🔸 کاربران جدید امروز: {joined_today}\n\n"
+        f"💰 میانگین موجودی: {int(avg_balance):,} تومان\n"
+        f"💰 مجموع موجودی: {total_balance:,} تومان\n"
+    )
+
+
+def build_income_report():
+    # Calculate income from the revenue fact table
+    today_start = datetime.combine(datetime.now().date(), datetime.min.time())
+    tomorrow = (today_start + timedelta(days=1)).timestamp()
+    income_today = revenue_facts.revenue_between(today_start.timestamp(), tomorrow)
+    income_week = revenue_facts.revenue_between(
+        (today_start - timedelta(days=6)).timestamp(), tomorrow
+    )
+    month_start = (today_start - timedelta(days=29)).timestamp()
+    income_month = revenue_facts.revenue_between(month_start, tomorrow)
+    location_income = revenue_facts.revenue_by_location(month_start, tomorrow)
+
+    # Average over the days the bot has actually been selling, up to 30
+    days_selling = 30
+    first_day = sales_rollups.first_day()
+    if first_day:
+        today = datetime.now().date()
+        days_since_first_sale = (today - date.fromisoformat(first_day)).days
+        days_selling = max(1, min(30, days_since_first_sale + 1))
+    average_income = int(income_month / days_selling)
+
+    location_lines = ""
+    for location, income in sorted(
+        location_income.items(), key=lambda item: item[1], reverse=True
+    ):
+        loc_data = server_data["locations"].get(location)
+        name = f"{loc_data['flag']} {loc_data['name']}" if loc_data else location
+        location_lines += f"🔸 {name}: {income:,} تومان\n"
+
+    return (
+        f"💰 *گزارش درآمد*\n\n"
+        f"🔸 درآمد امروز: {income_today:,} تومان\n"
+        f"🔸 درآمد هفته: {income_week:,} تومان\n"
+        f"🔸 درآمد ماه: {income_month:,} تومان\n\n"
+        f"📊 میانگین درآمد روزانه (۳۰ روز اخیر): {average_income:,} تومان\n\n"
+        f"📍 درآمد ۳۰ روز اخیر به تفکیک لوکیشن:\n{location_lines}"
+    )
+
+
+COHORT_REPORT_MONTHS = 6
+
+
+def build_cohort_report():
+    from jdatetime import date as jdate
+
+    analytics_snapshot.ensure_current(user_snapshots.snapshot(), service_price)
+    rows = analytics_snapshot.cohort_retention(max_offset=COHORT_REPORT_MONTHS - 1)
+
+    lines = ""
+    for cohort, size, rates in rows[-12:]:
+        year, month = map(int, cohort.split("-"))
+        persian = jdate.fromgregorian(date=date(year, month, 1)).strftime("%Y/%m")
+        shares = " ".join(f"{int(rate * 100):>3}%" for rate in rates)
+        lines += f"🔸 {persian} ({size:,}): `{shares}`\n"
+
+    return (
+        f"📈 *گزارش ماندگاری کاربران*\n\n"
+        f"درصد کاربران هر ماه عضویت که در ماه‌های بعد خرید کرده‌اند "
+        f"(ماه عضویت تا {COHORT_REPORT_MONTHS - 1} ماه بعد):\n\n"
+        f"{lines or 'داده‌ای موجود نیست.'}"
+    )
+
+
+def build_ltv_report():
+    analytics_snapshot.ensure_current(user_snapshots.snapshot(), service_price)
+    ltv = analytics_snapshot.lifetime_value()
+    repeat_rate = analytics_snapshot.repeat_purchase_rate()
+
+    location_lines = ""
+    for location, revenue in sorted(
+        analytics_snapshot.revenue_by_location().items(),
+        key=lambda item: item[1],
+        reverse=True,
+    ):
+        loc_data = server_data["locations"].get(location)
+        name = f"{loc_data['flag']} {loc_data['name']}" if loc_data else location
+        location_lines += f"🔸 {name}: {revenue:,} تومان\n"
+
+    return (
+        f"💎 *گزارش ارزش طول عمر کاربران*\n\n"
+        f"👥 کاربران: {ltv['users']:,} (خریدار: {ltv['paying']:,})\n"
+        f"🔁 نرخ خرید مجدد: {repeat_rate * 100:.1f}%\n\n"
+        f"🔸 میانگین ارزش هر کاربر: {int(ltv['avg']):,} تومان\n"
+        f"🔸 میانگین ارزش هر خریدار: {int(ltv['paying_avg']):,} تومان\n"
+        f"🔸 میانه: {int(ltv['median']):,} تومان\n"
+        f"🔸 دهک بالا: {int(ltv['p90']):,} تومان\n\n"
+        f"📍 کل درآمد به تفکیک لوکیشن:\n{location_lines}"
+    )
+
+
+def format_sales_totals(title, totals):
+    message = f"📊 *{title}*\n\n"
+    for location, (count, revenue) in sorted(
+        totals.items(), key=lambda item: item[1][1], reverse=True
+    ):
+        loc_data = server_data["locations"].get(location)
+        name = f"{loc_data['flag']} {loc_data['name']}" if loc_data else location
+        message += f"🔸 {name}: {count} سرویس - {revenue:,} تومان\n"
+    count, revenue = sum_totals(totals)
+    message += f"\n📦 مجموع فروش: {count} سرویس\n💰 مجموع درآمد: {revenue:,} تومان"
+    return message
+
+
+def persian_month_range(year, month):
+    """Gregorian start and end dates of a Persian calendar month"""
+    from jdatetime import date as jdate
+
+    start = jdate(year, month, 1).togregorian()
+    next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    end = jdate(next_year, next_month, 1).togregorian() - timedelta(days=1)
+    return start, end
+
+
+async def sales_range_command(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> None:
+    """Handle /sales_range <from> <to> (Gregorian YYYY-MM-DD) and /sales_month [<year> <month>] (Persian)"""
+    if not is_admin(update.effective_user.id):
+        return
+    warm_up.ensure()
+
+    command = update.message.text.split()[0].lstrip("/").split("@")[0]
+    try:
+        if command == "sales_month":
+            if context.args:
+                year, month = int(context.args[0]), int(context.args[1])
+            else:
+                from jdatetime import date as jdate
+
+                today = jdate.today()
+                year, month = today.year, today.month
+            start, end = persian_month_range(year, month)
+            title = f"گزارش فروش ماه {year}/{month:02d}"
+        else:
+            start = datetime.strptime(context.args[0], "%Y-%m-%d").date()
+            end = datetime.strptime(
+                context.args[1] if len(context.args) > 1 else context.args[0],
+                "%Y-%m-%d",
+            ).date()
+            title = f"گزارش فروش {start.isoformat()} تا {end.isoformat()}"
+        if end < start:
+            raise ValueError("End date is before start date")
+    except (ValueError, IndexError):
+        await update.message.reply_text(
+            "استفاده:\n"
+            "/sales_range 2024-03-01 2024-03-31\n"
+            "/sales_month 1403 1"
+        )
+        return
+
+    await update.message.reply_text(
+        report_cache.get_or_build(
+            (command, start, end),
+            lambda: format_sales_totals(title, sales_rollups.range_totals(start, end)),
+            depends_on=("purchases",),
+        ),
+        parse_mode="Markdown",
+    )
+
+
+async def backfill_revenue_command(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> None:
+    """Handle /backfill_revenue: store prices on old services and rebuild revenue data"""
+    if not is_admin(update.effective_user.id):
+        return
+    warm_up.ensure()
+
+    updated = backfill_service_prices()
+    save_user_data()
+    await update.message.reply_text(
+        f"✅ قیمت {updated} سرویس قدیمی ثبت شد و داده‌های درآمد بازسازی شد.\n"
+        f"تعداد رکوردهای فروش: {len(revenue_facts)}"
+    )
+
+
+# Data export
+# /export streams rows through generator pipelines into a CSV or JSONL file
+# (optionally gzipped) in a worker thread, writing in chunks so memory stays
+# bounded, and then sends the file to the admin as a document.
+EXPORT_CHUNK_ROWS = 5000
+EXPORT_FIELDS = {
+    "users": [
+        "user_id",
+        "username",
+        "balance",
+        "services",
+        "joined_at",
+        "unreachable_since",
+    ],
+    "services": [
+        "user_id",
+        "location",
+        "address",
+        "purchase_date",
+        "expiration_date",
+        "amount",
+        "currency",
+        "amount_estimated",
+    ],
+    "payments": [
+        "payment_id",
+        "user_id",
+        "username",
+        "amount",
+        "timestamp",
+        "status",
+        "receipt_type",
+        "receipt_data",
+        "processed_by",
+        "processed_at",
+    ],
+    "sales": ["timestamp", "location", "amount"],
+}
+
+
+def iter_user_rows(user_items):
+    for user_id, user_info in user_items:
+        if not user_id.isdigit():
+            continue
+        yield {
+            "user_id": user_id,
+            "username": user_info.get("username"),
+            "balance": user_info.get("balance", 0),
+            "services": len(user_info.get("services", [])),
+            "joined_at": user_info.get("joined_at"),
+            "unreachable_since": user_info.get("unreachable", {}).get("since"),
+        }
+
+
+def iter_service_rows(user_items):
+    for user_id, user_info in user_items:
+        if not user_id.isdigit():
+            continue
+        for service in user_info.get("services", []):
+            yield {
+                "user_id": user_id,
+                "location": service.get("location"),
+                "address": service.get("address", "").replace("\n", " "),
+                "purchase_date": service.get("purchase_date"),
+                "expiration_date": service.get("expiration_date"),
+                "amount": service_price(service),
+                "currency": service.get("currency", SERVICE_CURRENCY),
+                "amount_estimated": "amount" not in service
+                or service.get("amount_estimated", False),
+            }
+
+
+def iter_payment_rows(payment_items):
+    for payment_id, payment_info in payment_items:
+        row = {"payment_id": payment_id}
+        row.update(payment_info)
+        yield row
+
+
+def iter_sales_rows(timestamps, location_ids, amounts, locations):
+    for timestamp, location_id, amount in zip(timestamps, location_ids, amounts):
+        yield {
+            "timestamp": datetime.fromtimestamp(timestamp).isoformat(),
+            "location": locations[location_id],
+            "amount": amount,
+        }
+
+
+def export_rows(kind):
+    """Return a row generator for `kind` over a point-in-time copy of the data"""
+    # User snapshots are never changed in place, so the worker thread can
+    # iterate them while the handlers keep writing
+    if kind == "users":
+        return iter_user_rows(user_snapshots.snapshot().items())
+    if kind == "services":
+        return iter_service_rows(user_snapshots.snapshot().items())
+    if kind == "payments":
+        return iter_payment_rows(list(user_data.get("pending_payments", {}).items()))
+    if kind == "sales":
+        return iter_sales_rows(
+            array("d", revenue_facts.timestamps),
+            array("H", revenue_facts.location_ids),
+            array("q", revenue_facts.amounts),
+            list(revenue_facts.locations),
+        )
+    raise ValueError(f"Unknown export kind: {kind}")
+
+
+def write_export(path, rows, fields, file_format, compress):
+    """Write `rows` to the file at `path` and return the row count"""
+    count = 0
+    opener = gzip.open if compress else open
+    with opener(path, "wt", encoding="utf-8", newline="") as file:
+        writer = None
+        if file_format == "csv":
+            writer = csv.DictWriter(file, fieldnames=fields, extrasaction="ignore")
+            writer.writeheader()
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            count += 1
+            if len(chunk) >= EXPORT_CHUNK_ROWS:
+                write_export_chunk(file, chunk, file_format, writer)
+                chunk = []
+        write_export_chunk(file, chunk, file_format, writer)
+    return count
+
+
+def write_export_chunk(file, chunk, file_format, writer):
+    if file_format == "csv":
+        writer.writerows(chunk)
+    else:
+        file.write(
+            "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in chunk)
+        )
+
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle /export <users|services|payments|sales> [csv|jsonl] [gz]"""
+    if not is_admin(update.effective_user.id):
+        return
+    warm_up.ensure()
+
+    args = [arg.lower() for arg in context.args]
+    kind = args[0] if args else None
+    file_format = "jsonl" if "jsonl" in args else "csv"
+    compress = "gz" in args or "gzip" in args
+    if kind not in EXPORT_FIELDS:
+        await update.message.reply_text(
+            "استفاده: /export <users|services|payments|sales> [csv|jsonl] [gz]"
+        )
+        return
+
+    status_msg = await update.message.reply_text("⏳ در حال آماده‌سازی خروجی...")
+    await context.bot.send_chat_action(
+        chat_id=update.effective_chat.id, action=ChatAction.UPLOAD_DOCUMENT
+    )
+
+    suffix = f".{file_format}" + (".gz" if compress else "")
+    # Created here so the finally below removes it even when writing fails
+    handle, path = tempfile.mkstemp(prefix="export_", suffix=suffix)
+    os.close(handle)
+    try:
+        count = await asyncio.to_thread(
+            write_export,
+            path,
+            export_rows(kind),
+            EXPORT_FIELDS[kind],
+            file_format,
+            compress,
+        )
+        filename = f"{kind}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{suffix}"
+        with open(path, "rb") as file:
+            await update.message.reply_document(
+                document=file,
+                filename=filename,
+                caption=f"📦 خروجی {kind}: {count:,} ردیف",
+            )
+        await status_msg.delete()
+    except Exception as e:
+        logger.error(f"Error exporting {kind}: {e}")
+        await status_msg.edit_text(f"❌ خطا در تهیه خروجی: {e}")
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# Heavy report jobs
+# CPU-heavy reports run in a process pool so they don't take the GIL from the
+# bot loop. Users are serialized into plain tuples from a snapshot, split into
+# chunks that the workers map, and merged here; the admin's message shows
+# progress as chunks finish.
+DEFAULT_HEAVY_JOB_WORKERS = 2
+DEFAULT_HEAVY_JOB_CONCURRENCY = 2
+DEFAULT_HEAVY_JOB_TIMEOUT = 300  # seconds
+HEAVY_JOB_CHUNK_USERS = 2000
+HEAVY_JOB_PROGRESS_INTERVAL = 2  # seconds between progress edits
+
+HEAVY_JOB_TITLES = {
+    "income_months": "درآمد ماهانه (کل تاریخچه)",
+    "cohorts": "جدول کوهورت",
+    "integrity": "بررسی سلامت داده‌ها",
+}
+
+
+def serialize_user_rows(snapshot):
+    """Plain tuples for the worker processes, see report_jobs for the layout"""
+    return [
+        (
+            user_id,
+            user_info.get("joined_at") or "",
+            user_info.get("balance", 0),
+            [
+                (
+                    service.get("location"),
+                    service.get("purchase_date") or "",
+                    service.get("expiration_date") or "",
+                    service_price(service),
+                    service.get("address", "").split(),
+                )
+                for service in user_info.get("services", [])
+            ],
+        )
+        for user_id, user_info in snapshot.items()
+    ]
+
+
+class HeavyJobRunner:
+    def __init__(self):
+        self._executor = None
+        self._slots = None
+
+    def _start(self):
+        # Created on first use so workers are only spawned if a job is run
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=int(
+                    bot_config.get("heavy_job_workers", DEFAULT_HEAVY_JOB_WORKERS)
+                )
+            )
+            self._slots = asyncio.Semaphore(
+                int(
+                    bot_config.get(
+                        "heavy_job_concurrency", DEFAULT_HEAVY_JOB_CONCURRENCY
+                    )
+                )
+            )
+
+    def is_full(self):
+        return self._slots is not None and self._slots.locked()
+
+    async def run(self, kind, snapshot, on_progress):
+        """Run job `kind` over the users in `snapshot` and return the merged result
+
+        Raises asyncio.TimeoutError after heavy_job_timeout seconds; chunks that
+        haven't started yet are cancelled.
+        """
+        self._start()
+        map_chunk, merge, initial = report_jobs.JOBS[kind]
+        timeout = float(bot_config.get("heavy_job_timeout", DEFAULT_HEAVY_JOB_TIMEOUT))
+
+        async with self._slots:
+            # Serialized only once the job has a slot, and off the bot loop;
+            # a queued job holds nothing but its snapshot
+            rows = await asyncio.to_thread(serialize_user_rows, snapshot)
+            chunks = [
+                rows[start : start + HEAVY_JOB_CHUNK_USERS]
+                for start in range(0, len(rows), HEAVY_JOB_CHUNK_USERS)
+            ]
+            loop = asyncio.get_running_loop()
+            futures = [
+                loop.run_in_executor(self._executor, map_chunk, chunk)
+                for chunk in chunks
+            ]
+
+            async def collect():
+                result = initial()
+                for done, future in enumerate(asyncio.as_completed(futures), 1):
+                    result = merge(result, await future)
+                    await on_progress(done, len(chunks))
+                return result
+
+            try:
+                return await asyncio.wait_for(collect(), timeout)
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+heavy_jobs = HeavyJobRunner()
+
+
+async def shutdown_heavy_jobs(application: Application) -> None:
+    heavy_jobs.shutdown()
+
+
+def format_income_months(result):
+    lines = ""
+    total_count = total_revenue = 0
+    for month in sorted(result):
+        count = sum(bucket[0] for bucket in result[month].values())
+        revenue = sum(bucket[1] for bucket in result[month].values())
+        total_count += count
+        total_revenue += revenue
+        lines += f"🔸 {month}: {count:,} فروش - {revenue:,} تومان\n"
+    return (
+        f"💰 *درآمد ماهانه (کل تاریخچه)*\n\n"
+        f"{lines or 'فروشی ثبت نشده است.'}\n"
+        f"📊 مجموع: {total_count:,} فروش - {total_revenue:,} تومان"
+    )
+
+
+def format_cohort_table(result):
+    lines = ""
+    for cohort in sorted(result)[-12:]:
+        size, *buyers = result[cohort]
+        shares = " ".join(f"{buyer * 100 // size:>3}" for buyer in buyers)
+        lines += f"`{cohort} {size:>6,} |{shares}`\n"
+    return (
+        f"📈 *جدول کوهورت*\n"
+        f"ماه عضویت، تعداد کاربران و درصد خریداران در ماه‌های +۰ تا "
+        f"+{report_jobs.COHORT_MAX_OFFSET}:\n\n"
+        f"{lines or 'داده‌ای موجود نیست.'}"
+    )
+
+
+def format_integrity_check(result):
+    issue_counts = {}
+    for _, issue, _ in result["issues"]:
+        issue_counts[issue] = issue_counts.get(issue, 0) + 1
+    duplicates = report_jobs.integrity_duplicates(result)
+
+    lines = "".join(
+        f"🔸 `{issue}`: {count:,}\n" for issue, count in sorted(issue_counts.items())
+    )
+    examples = "".join(
+        f"  - `{user_id}: {issue} ({detail})`\n"
+        for user_id, issue, detail in result["issues"][:10]
+    )
+    duplicate_lines = "".join(
+        f"  - `{address}`: {', '.join(owners)}\n"
+        for address, owners in list(duplicates.items())[:10]
+    )
+    if not issue_counts and not duplicates:
+        return "✅ *بررسی سلامت داده‌ها*\n\nمشکلی پیدا نشد."
+    return (
+        f"🩺 *بررسی سلامت داده‌ها*\n\n"
+        f"{lines}"
+        f"🔸 آدرس‌های تکراری: {len(duplicates):,}\n\n"
+        + (f"نمونه‌ها:\n{examples}\n" if examples else "")
+        + (f"آدرس‌های تکراری:\n{duplicate_lines}" if duplicate_lines else "")
+    )
+
+
+HEAVY_JOB_FORMATTERS = {
+    "income_months": format_income_months,
+    "cohorts": format_cohort_table,
+    "integrity": format_integrity_check,
+}
+
+
+async def heavy_report_command(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> None:
+    """Handle /heavy_report <income_months|cohorts|integrity>"""
+    if not is_admin(update.effective_user.id):
+        return
+    warm_up.ensure()
+
+    kind = context.args[0].lower() if context.args else None
+    if kind not in report_jobs.JOBS:
+        await update.message.reply_text(
+            "استفاده: /heavy_report <income_months|cohorts|integrity>"
+        )
+        return
+
+    title = HEAVY_JOB_TITLES[kind]
+    status_msg = await update.message.reply_text(
+        f"⏳ {title}: در صف اجرا..." if heavy_jobs.is_full() else f"⏳ {title}: در حال آماده‌سازی..."
+    )
+    snapshot = user_snapshots.snapshot()
+    started_at = time.monotonic()
+    last_edit = 0
+
+    async def on_progress(done, total):
+        nonlocal last_edit
+        now = time.monotonic()
+        if done < total and now - last_edit < HEAVY_JOB_PROGRESS_INTERVAL:
+            return
+        last_edit = now
+        try:
+            await status_msg.edit_text(
+                f"⏳ {title}: {done}/{total} بخش ({int(now - started_at)} ثانیه)"
+            )
+        except TelegramError as e:
+            logger.warning(f"Could not update heavy job progress: {e}")
+
+    try:
+        result = await heavy_jobs.run(kind, snapshot, on_progress)
+    except asyncio.TimeoutError:
+        logger.warning(f"Heavy report {kind} timed out")
+        await status_msg.edit_text(f"⌛️ {title}: زمان اجرا به پایان رسید و کار لغو شد.")
+        return
+    except Exception as e:
+        logger.error(f"Error running heavy report {kind}: {e}")
+        await status_msg.edit_text(f"❌ خطا در اجرای گزارش: {e}")
+        return
+
+    logger.info(
+        f"Heavy report {kind} finished in {time.monotonic() - started_at:.1f}s "
+        f"over {len(snapshot)} users"
+    )
+    await status_msg.edit_text(
+        HEAVY_JOB_FORMATTERS[kind](result), parse_mode="Markdown"
+    )
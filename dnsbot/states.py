@@ -0,0 +1,20 @@
+# Conversation states
+# Shared by the handlers of every module, so they live apart from all of them.
+(
+    MAIN_MENU,
+    WALLET,
+    BUY_DNS,
+    ADMIN_PANEL,
+    SELECT_LOCATION,
+    SELECT_IP_TYPE,
+    CONFIRM_PURCHASE,
+) = range(7)
+
+# تعریف حالت‌های جدید برای مدیریت کاربران
+ADMIN_USER_ID_INPUT, ADMIN_AMOUNT_INPUT, ADMIN_GIFT_AMOUNT_INPUT = range(7, 10)
+
+# States for payment receipt
+PAYMENT_RECEIPT, PAYMENT_AMOUNT = range(10, 12)
+
+# Add state for broadcast message
+ADMIN_BROADCAST_MESSAGE = 12
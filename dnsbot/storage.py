@@ -0,0 +1,305 @@
+# Storage backends
+# JsonStorage keeps the original layout: one JSON file per document, with the
+# users and the "pending_payments" bucket together in the user data file.
+# SqliteStorage keeps the same documents plus one row per user and per payment
+# in a single database file, so several worker processes can share it:
+# balances change through atomic UPDATEs, read-modify-write of a document is
+# wrapped in transaction(), and each worker only writes the users it owns.
+# Triggers stamp every inserted, changed or deleted user row with a sequence
+# number in user_changes, so a worker can fetch just the users that changed
+# since it last looked.
+import json
+import logging
+import os
+import sqlite3
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class JsonStorage:
+    shared = False  # only safe for a single process
+
+    def __init__(self, users_file):
+        self.users_file = users_file
+
+    def load_document(self, name, default):
+        try:
+            if os.path.exists(name):
+                with open(name, "r", encoding="utf-8") as file:
+                    return json.load(file)
+            return default
+        except Exception as e:
+            logger.error(f"Error loading data from {name}: {e}")
+            return default
+
+    def save_document(self, name, data):
+        try:
+            with open(name, "w", encoding="utf-8") as file:
+                json.dump(data, file, ensure_ascii=False, indent=4)
+            return True
+        except Exception as e:
+            logger.error(f"Error saving data to {name}: {e}")
+            return False
+
+    @contextmanager
+    def transaction(self):
+        yield
+
+    def load_users(self):
+        return self.load_document(self.users_file, {})
+
+    def load_changed_users(self):
+        return {}
+
+    def save_users(self, users, owns=None):
+        return self.save_document(self.users_file, users)
+
+    # The in-memory user_data is authoritative here, so these are no-ops;
+    # save_users writes everything.
+    def add_balance(self, user_id, delta):
+        return None
+
+    def get_balance(self, user_id):
+        return None
+
+    def delete_users(self, user_ids):
+        pass
+
+    def save_payment(self, payment_id, payment_info):
+        pass
+
+    def load_payments(self):
+        return None
+
+
+USER_QUERY_BATCH = 500  # user ids per "IN (...)" query, below SQLite's variable limit
+
+
+class SqliteStorage:
+    shared = True
+
+    def __init__(self, path, users_file):
+        self.path = path
+        self.users_file = users_file
+        self._depth = 0
+        self._change_cursor = 0  # last user_changes seq this process has loaded
+        # Autocommit; transaction() opens explicit write transactions
+        self._db = sqlite3.connect(path, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                name TEXT PRIMARY KEY,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS users (
+                user_id TEXT PRIMARY KEY,
+                balance INTEGER NOT NULL DEFAULT 0,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS payments (
+                payment_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS user_changes (
+                user_id TEXT PRIMARY KEY,
+                seq INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS user_changes_seq ON user_changes (seq);
+            CREATE TRIGGER IF NOT EXISTS user_inserted AFTER INSERT ON users BEGIN
+                INSERT INTO user_changes (user_id, seq)
+                VALUES (NEW.user_id, (SELECT COALESCE(MAX(seq), 0) + 1 FROM user_changes))
+                ON CONFLICT (user_id) DO UPDATE SET seq = excluded.seq;
+            END;
+            CREATE TRIGGER IF NOT EXISTS user_updated AFTER UPDATE ON users
+            WHEN OLD.balance IS NOT NEW.balance OR OLD.data IS NOT NEW.data BEGIN
+                INSERT INTO user_changes (user_id, seq)
+                VALUES (NEW.user_id, (SELECT COALESCE(MAX(seq), 0) + 1 FROM user_changes))
+                ON CONFLICT (user_id) DO UPDATE SET seq = excluded.seq;
+            END;
+            CREATE TRIGGER IF NOT EXISTS user_deleted AFTER DELETE ON users BEGIN
+                INSERT INTO user_changes (user_id, seq)
+                VALUES (OLD.user_id, (SELECT COALESCE(MAX(seq), 0) + 1 FROM user_changes))
+                ON CONFLICT (user_id) DO UPDATE SET seq = excluded.seq;
+            END;
+            """
+        )
+        self._import_json()
+
+    def _import_json(self):
+        """Seed an empty database from the JSON user data file, if there is one"""
+        if self._db.execute("SELECT 1 FROM users LIMIT 1").fetchone():
+            return
+        users = JsonStorage(self.users_file).load_users()
+        if not users:
+            return
+        with self.transaction():
+            for payment_id, payment_info in users.get("pending_payments", {}).items():
+                self.save_payment(payment_id, payment_info)
+            self._upsert_users(users, owns=None, with_balance=True)
+        logger.info(f"Imported {len(users)} user records from {self.users_file}")
+
+    @contextmanager
+    def transaction(self):
+        if self._depth == 0:
+            self._db.execute("BEGIN IMMEDIATE")
+        self._depth += 1
+        try:
+            yield
+        except BaseException:
+            self._depth -= 1
+            if self._depth == 0:
+                self._db.execute("ROLLBACK")
+            raise
+        self._depth -= 1
+        if self._depth == 0:
+            self._db.execute("COMMIT")
+
+    def load_document(self, name, default):
+        row = self._db.execute(
+            "SELECT data FROM documents WHERE name = ?", (name,)
+        ).fetchone()
+        if row is not None:
+            return json.loads(row[0])
+        # First run against this database: start from the JSON file if present
+        data = JsonStorage(self.users_file).load_document(name, default)
+        if data is not default:
+            self.save_document(name, data)
+        return data
+
+    def save_document(self, name, data):
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO documents (name, data) VALUES (?, ?)",
+                (name, json.dumps(data, ensure_ascii=False)),
+            )
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error saving document {name}: {e}")
+            return False
+
+    def _change_seq(self):
+        return self._db.execute("SELECT COALESCE(MAX(seq), 0) FROM user_changes").fetchone()[0]
+
+    def load_users(self):
+        users = {}
+        # Read first: a change made while loading is fetched again later
+        # rather than missed
+        self._change_cursor = self._change_seq()
+        for user_id, balance, data in self._db.execute(
+            "SELECT user_id, balance, data FROM users"
+        ):
+            user_info = json.loads(data)
+            user_info["balance"] = balance
+            users[user_id] = user_info
+        users["pending_payments"] = self.load_payments()
+        return users
+
+    def load_changed_users(self):
+        """Users changed by any process since the last load; deleted users map to None"""
+        # One read transaction, so the rows match the change numbers
+        self._db.execute("BEGIN")
+        try:
+            changes = self._db.execute(
+                "SELECT user_id, seq FROM user_changes WHERE seq > ? ORDER BY seq",
+                (self._change_cursor,),
+            ).fetchall()
+            users = {user_id: None for user_id, _ in changes}
+            user_ids = list(users)
+            for start in range(0, len(user_ids), USER_QUERY_BATCH):
+                batch = user_ids[start : start + USER_QUERY_BATCH]
+                for user_id, balance, data in self._db.execute(
+                    "SELECT user_id, balance, data FROM users WHERE user_id IN "
+                    f"({', '.join('?' * len(batch))})",
+                    batch,
+                ):
+                    user_info = json.loads(data)
+                    user_info["balance"] = balance
+                    users[user_id] = user_info
+        finally:
+            self._db.execute("COMMIT")
+        if changes:
+            self._change_cursor = changes[-1][1]
+        return users
+
+    def _upsert_users(self, users, owns, with_balance):
+        rows = []
+        for user_id, user_info in users.items():
+            if not user_id.isdigit() or (owns is not None and not owns(user_id)):
+                continue
+            data = {key: value for key, value in user_info.items() if key != "balance"}
+            rows.append(
+                (user_id, user_info.get("balance", 0), json.dumps(data, ensure_ascii=False))
+            )
+        # The balance is only set when the row is created; after that it
+        # changes through add_balance so concurrent deltas aren't overwritten.
+        # Unchanged rows are skipped so they don't show up as user changes.
+        if with_balance:
+            update = (
+                "data = excluded.data, balance = excluded.balance "
+                "WHERE data != excluded.data OR balance != excluded.balance"
+            )
+        else:
+            update = "data = excluded.data WHERE data != excluded.data"
+        self._db.executemany(
+            "INSERT INTO users (user_id, balance, data) VALUES (?, ?, ?) "
+            f"ON CONFLICT(user_id) DO UPDATE SET {update}",
+            rows,
+        )
+
+    def save_users(self, users, owns=None):
+        """Write the users `owns(user_id)` accepts; payments are saved one by one"""
+        try:
+            with self.transaction():
+                self._upsert_users(users, owns, with_balance=False)
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error saving users: {e}")
+            return False
+
+    def add_balance(self, user_id, delta):
+        """Atomically add `delta` and return the new balance, or None if the user has no row"""
+        # fetchall() steps the statement to completion so the write commits now
+        rows = self._db.execute(
+            "UPDATE users SET balance = balance + ? WHERE user_id = ? RETURNING balance",
+            (delta, str(user_id)),
+        ).fetchall()
+        return rows[0][0] if rows else None
+
+    def get_balance(self, user_id):
+        row = self._db.execute(
+            "SELECT balance FROM users WHERE user_id = ?", (str(user_id),)
+        ).fetchone()
+        return row[0] if row else None
+
+    def delete_users(self, user_ids):
+        with self.transaction():
+            self._db.executemany(
+                "DELETE FROM users WHERE user_id = ?", [(user_id,) for user_id in user_ids]
+            )
+
+    def save_payment(self, payment_id, payment_info):
+        self._db.execute(
+            "INSERT OR REPLACE INTO payments (payment_id, data) VALUES (?, ?)",
+            (payment_id, json.dumps(payment_info, ensure_ascii=False)),
+        )
+
+    def load_payments(self):
+        return {
+            payment_id: json.loads(data)
+            for payment_id, data in self._db.execute(
+                "SELECT payment_id, data FROM payments"
+            )
+        }
+
+
+def open_storage(url, users_file):
+    """Open the backend named by `url`, either json: (the default) or sqlite:<path>"""
+    scheme, _, path = (url or "json:").partition(":")
+    if scheme == "json":
+        return JsonStorage(users_file)
+    if scheme == "sqlite":
+        return SqliteStorage(path or "bot.db", users_file)
+    raise ValueError(f"Unknown storage backend: {url}")
@@ -0,0 +1,79 @@
+# Shared data sync
+# With sharded workers each process writes only its own users, while admins,
+# payments and settings can change on any worker. Balances are read from the
+# storage before every update of the sender; everything else other workers
+# changed is picked up here now and then: the storage hands back only the
+# users changed since the last sync, and the derived indexes are updated for
+# those users alone.
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from dnsbot import config, data
+from dnsbot.data import (
+    BOT_CONFIG_FILE,
+    SERVER_DATA_FILE,
+    aggregates,
+    apply_stored_user,
+    bot_config,
+    owns_user,
+    replace_user,
+    report_cache,
+    sales_rollups,
+    server_data,
+    user_data,
+    user_snapshots,
+    warm_up,
+)
+
+
+SHARED_SYNC_INTERVAL = 60  # seconds
+
+
+async def refresh_sender_balance(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> None:
+    user = update.effective_user
+    if user is None or str(user.id) not in user_data:
+        return
+    balance = data.storage.get_balance(user.id)
+    if balance is not None:
+        refresh_balance(str(user.id), balance)
+
+
+def refresh_balance(user_id, balance):
+    user_info = user_data[user_id]
+    if balance != user_info.get("balance", 0):
+        aggregates.on_balance_change(balance - user_info.get("balance", 0))
+        replace_user(user_id, {**user_info, "balance": balance})
+        report_cache.invalidate("balances")
+
+
+async def sync_shared_data(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """JobQueue callback that takes over what other workers changed"""
+    warm_up.ensure()
+    changed = data.storage.load_changed_users()
+    with user_snapshots.batch():
+        for user_id, user_info in changed.items():
+            if not owns_user(user_id) or user_id not in user_data:
+                apply_stored_user(user_id, user_info)
+            elif user_info is not None:
+                # Users this worker owns are written here; only the balance
+                # can change elsewhere
+                refresh_balance(user_id, user_info["balance"])
+    if changed:
+        sales_rollups.prune()
+        report_cache.invalidate("users", "balances", "purchases")
+    user_data["pending_payments"] = data.storage.load_payments()
+    report_cache.invalidate("payments")
+
+    # Replace the contents in place so no reference to the old dict is left stale
+    documents_changed = False
+    for name, document in ((SERVER_DATA_FILE, server_data), (BOT_CONFIG_FILE, bot_config)):
+        loaded = data.storage.load_document(name, None)
+        if loaded is not None and loaded != document:
+            document.clear()
+            document.update(loaded)
+            documents_changed = True
+    if documents_changed:
+        config.refresh()
+        report_cache.clear()
@@ -0,0 +1,233 @@
+# Wallet
+# Topping up the balance: choosing an amount, sending the receipt and
+# notifying the admins, who review it in the admin panel.
+import logging
+from datetime import datetime
+from telegram import (
+    Update,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+)
+from telegram.ext import ContextTypes
+
+from dnsbot import data
+from dnsbot.states import MAIN_MENU, PAYMENT_RECEIPT, WALLET
+from dnsbot.data import (
+    bot_config,
+    ensure_user_exists,
+    report_cache,
+    save_user_data,
+    user_data,
+)
+from dnsbot.outbound import LANE_TRANSACTIONAL, outbound
+from dnsbot.keyboards import keyboards
+
+logger = logging.getLogger(__name__)
+
+
+async def wallet_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
+    user_id = query.from_user.id
+    user_info = ensure_user_exists(user_id, query.from_user.username)
+
+    if query.data == "add_balance":
+        reply_markup = keyboards.get("wallet_amounts")
+
+        await query.edit_message_text(
+            "💰 لطفا مبلغ مورد نظر برای افزایش موجودی را انتخاب کنید:",
+            reply_markup=reply_markup,
+        )
+        return WALLET
+
+    elif query.data.startswith("payment_"):
+        try:
+            amount = int(query.data.split("_")[1])
+            if amount <= 0:
+                raise ValueError("Payment amount must be positive")
+
+            formatted_amount = f"{amount:,}"
+
+            # Store the payment amount in user_data
+            context.user_data["payment_amount"] = amount
+            logger.info(f"User {user_id} selected payment amount: {amount}")
+
+            await query.edit_message_text(
+                f"💳 برای افزایش موجودی به مبلغ {formatted_amount} تومان، لطفا به کارت زیر واریز کنید:\n\n"
+                f"```\n6219 8619 4308 4037\n```\n"
+                f"به نام: امیرحسین سیاهبالایی\n\n"
+                f"پس از واریز، تصویر رسید پرداخت را ارسال کنید یا شماره پیگیری را بنویسید:",
+                reply_markup=keyboards.back("back_to_wallet"),
+                parse_mode="Markdown",
+            )
+            return PAYMENT_RECEIPT
+
+        except (ValueError, IndexError) as e:
+            logger.error(f"Error processing payment amount: {e}")
+            await query.edit_message_text(
+                "❌ خطا در پردازش مبلغ پرداخت. لطفاً دوباره تلاش کنید.",
+                reply_markup=keyboards.back("back_to_wallet"),
+            )
+            return WALLET
+
+    elif query.data == "back_to_wallet":
+        reply_markup = keyboards.get("wallet")
+
+        await query.edit_message_text(
+            f"💰 موجودی کیف پول شما: {user_info['balance']:,} تومان",
+            reply_markup=reply_markup,
+        )
+        return WALLET
+
+    return MAIN_MENU
+
+
+async def payment_receipt_handler(
+    update: Update, context: ContextTypes.DEFAULT_TYPE
+) -> int:
+    user = update.effective_user
+    user_id = str(user.id)
+    payment_amount = context.user_data.get("payment_amount", 0)
+
+    if payment_amount == 0:
+        # Handle case where payment_amount wasn't properly set
+        await update.message.reply_text(
+            "❌ خطا: مبلغ پرداخت نامعتبر است. لطفاً دوباره از منوی اصلی فرایند افزایش موجودی را آغاز کنید.",
+            reply_markup=InlineKeyboardMarkup(
+                [
+                    [
+                        InlineKeyboardButton(
+                            "🔙 بازگشت به منوی اصلی", callback_data="back_to_main"
+                        )
+                    ]
+                ]
+            ),
+        )
+        return MAIN_MENU
+
+    # Check if user has sent a photo (receipt) or text (tracking number)
+    if update.message.photo:
+        # Get the photo file_id
+        photo_file_id = update.message.photo[-1].file_id
+        context.user_data["payment_receipt_photo"] = photo_file_id
+        receipt_type = "تصویر رسید"
+        receipt_data = photo_file_id
+    else:
+        # Assume it's a tracking number
+        tracking_number = update.message.text
+        context.user_data["payment_receipt_text"] = tracking_number
+        receipt_type = f"شماره پیگیری: {tracking_number}"
+        receipt_data = tracking_number
+
+    # Initialize pending_payments if it doesn't exist
+    if "pending_payments" not in user_data:
+        user_data["pending_payments"] = {}
+
+    # Create a unique payment ID
+    timestamp = datetime.now()
+    payment_id = f"pay_{timestamp.strftime('%Y%m%d%H%M%S')}_{user_id}"
+
+    # Store payment request in user_data
+    user_data["pending_payments"][payment_id] = {
+        "user_id": user_id,
+        "username": user.username or "بدون نام کاربری",
+        "amount": payment_amount,
+        "timestamp": timestamp.isoformat(),
+        "status": "pending",
+        "receipt_type": "photo" if update.message.photo else "text",
+        "receipt_data": receipt_data,
+    }
+    data.storage.save_payment(payment_id, user_data["pending_payments"][payment_id])
+    report_cache.invalidate("payments")
+
+    # Save the updated user_data
+    save_success = save_user_data()
+
+    if not save_success:
+        logger.error(f"Failed to save payment request for user {user_id}")
+        await update.message.reply_text(
+            "❌ خطا در ثبت درخواست پرداخت. لطفاً دوباره تلاش کنید.",
+            reply_markup=InlineKeyboardMarkup(
+                [
+                    [
+                        InlineKeyboardButton(
+                            "🔙 بازگشت به منوی اصلی", callback_data="back_to_main"
+                        )
+                    ]
+                ]
+            ),
+        )
+        return MAIN_MENU
+
+    # Notify user
+    await update.message.reply_text(
+        f"✅ درخواست افزایش موجودی شما به مبلغ {payment_amount:,} تومان با موفقیت ثبت شد.\n"
+        f"نوع رسید: {receipt_type}\n\n"
+        f"درخواست شما در صف بررسی توسط مدیران قرار گرفت. "
+        f"پس از تایید، موجودی کیف پول شما به‌روز خواهد شد.",
+        reply_markup=InlineKeyboardMarkup(
+            [
+                [
+                    InlineKeyboardButton(
+                        "🔙 بازگشت به منوی اصلی", callback_data="back_to_main"
+                    )
+                ]
+            ]
+        ),
+    )
+
+    # Forward receipt to all admins
+    for admin_id in bot_config.get("admins", []):
+        try:
+            # Send notification to admin
+            admin_message = (
+                f"🔔 *درخواست افزایش موجودی جدید*\n\n"
+                f"👤 کاربر: {user.full_name} (@{user.username or 'بدون نام کاربری'})\n"
+                f"🆔 شناسه کاربر: `{user_id}`\n"
+                f"💰 مبلغ: {payment_amount:,} تومان\n"
+                f"🕒 زمان: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+                f"🧾 نوع رسید: {receipt_type}\n"
+            )
+
+            # Create approve/reject buttons
+            keyboard = [
+                [
+                    InlineKeyboardButton(
+                        "✅ تایید", callback_data=f"approve_payment_{payment_id}"
+                    ),
+                    InlineKeyboardButton(
+                        "❌ رد", callback_data=f"reject_payment_{payment_id}"
+                    ),
+                ]
+            ]
+            reply_markup = InlineKeyboardMarkup(keyboard)
+
+            # Send text notification first
+            notification = await outbound.send_message(
+                context.bot,
+                chat_id=admin_id,
+                text=admin_message,
+                parse_mode="Markdown",
+                reply_markup=reply_markup,
+            )
+
+            # Then forward the receipt photo or text
+            if update.message.photo:
+                await outbound.submit(
+                    LANE_TRANSACTIONAL,
+                    admin_id,
+                    context.bot.send_photo,
+                    chat_id=admin_id,
+                    photo=photo_file_id,
+                    caption=f"🧾 رسید پرداخت کاربر {user.full_name} - {payment_amount:,} تومان",
+                    reply_to_message_id=notification.message_id,
+                )
+
+        except Exception as e:
+            logger.error(f"Error notifying admin {admin_id}: {e}")
+
+    # Clear the payment context once processed
+    if "payment_amount" in context.user_data:
+        del context.user_data["payment_amount"]
+
+    return MAIN_MENU
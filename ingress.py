@@ -0,0 +1,211 @@
+"""Webhook ingress for running the bot as several sharded worker processes
+
+Receives Telegram's webhook, and forwards each update to one of WORKERS
+main.py processes chosen by the id of the user who sent it, so a user's
+conversation state always lives in the same process. Updates without a user
+(e.g. channel posts) go to worker 0. Shared data goes through STORAGE_URL,
+which must be a backend several processes can use (sqlite:<path>).
+
+    WORKERS=4 WEBHOOK_URL=https://bot.example.com TELEGRAM_BOT_TOKEN=... python ingress.py
+
+Besides WORKERS (default 2), WORKER_BASE_PORT (default 9100) and STORAGE_URL
+(default sqlite:bot.db), the WEBHOOK_* and TELEGRAM_* settings are the same as
+for BOT_MODE=webhook in main.py, except that WEBHOOK_CERT is only used to
+serve TLS and is not uploaded to Telegram, so it must be from a public CA.
+Worker i keeps its local files in worker<i>/.
+"""
+import asyncio
+import json
+import logging
+import os
+import secrets
+import signal
+import subprocess
+import sys
+
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError, HTTPRequest
+from tornado.web import Application, RequestHandler
+
+from dnsbot.storage import open_storage
+
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    level=logging.INFO,
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger("ingress")
+
+MAIN_PY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+WORKER_RESTART_DELAY = 2  # seconds
+WORKER_CHECK_INTERVAL = 1  # seconds between checks for exited workers
+FORWARD_TIMEOUT = 10  # seconds
+
+
+def update_user_id(update):
+    """Id of the user an update comes from, or None"""
+    for key, value in update.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        user = value.get("from") or value.get("user")
+        if user:
+            return user["id"]
+    return None
+
+
+class Worker:
+    def __init__(self, index, count, port, secret, storage_url):
+        self.index = index
+        self.port = port
+        self.env = dict(
+            os.environ,
+            BOT_MODE="worker",
+            WORKER_INDEX=str(index),
+            WORKER_COUNT=str(count),
+            WORKER_PORT=str(port),
+            WORKER_SECRET=secret,
+            STORAGE_URL=storage_url,
+            BOT_LOCAL_DIR=f"worker{index}",
+        )
+        self.process = None
+
+    def start(self):
+        self.process = subprocess.Popen([sys.executable, MAIN_PY], env=self.env)
+        logger.info(f"Started worker {self.index} (pid {self.process.pid}, port {self.port})")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+class WebhookHandler(RequestHandler):
+    def initialize(self, ingress):
+        self.ingress = ingress
+
+    async def post(self):
+        token = self.request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not secrets.compare_digest(token, self.ingress.webhook_secret):
+            self.set_status(403)
+            return
+        try:
+            update = json.loads(self.request.body)
+        except ValueError:
+            self.set_status(400)
+            return
+        # Only answer 200 once the worker has the update, so Telegram retries
+        # it if the worker is down
+        if not await self.ingress.forward(update):
+            self.set_status(503)
+
+
+class Ingress:
+    def __init__(self):
+        self.worker_count = int(os.environ.get("WORKERS", "2"))
+        base_port = int(os.environ.get("WORKER_BASE_PORT", "9100"))
+        storage_url = os.environ.get("STORAGE_URL", "sqlite:bot.db")
+        # Opening it here creates (and on first use imports) the database
+        # once, before the workers race to do it
+        if not open_storage(storage_url, "user_data.json").shared:
+            raise RuntimeError("Sharded workers need a shared STORAGE_URL, e.g. sqlite:bot.db")
+        self.worker_secret = secrets.token_urlsafe(32)
+        self.webhook_secret = os.environ.get("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+        self.workers = [
+            Worker(index, self.worker_count, base_port + index, self.worker_secret, storage_url)
+            for index in range(self.worker_count)
+        ]
+        self.client = None
+
+    def worker_for(self, update):
+        user_id = update_user_id(update)
+        return self.workers[0 if user_id is None else user_id % self.worker_count]
+
+    async def forward(self, update):
+        worker = self.worker_for(update)
+        try:
+            await self.client.fetch(
+                HTTPRequest(
+                    f"http://127.0.0.1:{worker.port}/update",
+                    method="POST",
+                    headers={
+                        "Content-Type": "application/json",
+                        "X-Worker-Secret": self.worker_secret,
+                    },
+                    body=json.dumps(update),
+                    request_timeout=FORWARD_TIMEOUT,
+                )
+            )
+            return True
+        except (HTTPClientError, OSError) as e:
+            logger.error(f"Error forwarding update {update.get('update_id')} to worker {worker.index}: {e}")
+            return False
+
+    async def set_webhook(self, url):
+        token = os.environ["TELEGRAM_BOT_TOKEN"]
+        base_url = os.environ.get("TELEGRAM_BASE_URL", "https://api.telegram.org")
+        params = {"url": url, "secret_token": self.webhook_secret}
+        await self.client.fetch(
+            HTTPRequest(
+                f"{base_url}/bot{token}/setWebhook",
+                method="POST",
+                headers={"Content-Type": "application/json"},
+                body=json.dumps(params),
+            )
+        )
+
+    async def watch_workers(self):
+        """Restart workers that exited"""
+        while True:
+            await asyncio.sleep(WORKER_CHECK_INTERVAL)
+            for worker in self.workers:
+                code = worker.process.poll()
+                if code is not None:
+                    logger.error(f"Worker {worker.index} exited with code {code}, restarting")
+                    await asyncio.sleep(WORKER_RESTART_DELAY)
+                    worker.start()
+
+    async def run(self):
+        webhook_url = os.environ.get("WEBHOOK_URL")
+        if not webhook_url:
+            raise RuntimeError("ingress.py requires WEBHOOK_URL")
+        url_path = os.environ.get("WEBHOOK_PATH", "telegram").strip("/")
+        listen = os.environ.get("WEBHOOK_LISTEN", "0.0.0.0")
+        port = int(os.environ.get("WEBHOOK_PORT", "8443"))
+        cert = os.environ.get("WEBHOOK_CERT")
+        key = os.environ.get("WEBHOOK_KEY")
+        if bool(cert) != bool(key):
+            raise RuntimeError("WEBHOOK_CERT and WEBHOOK_KEY must be set together")
+
+        self.client = AsyncHTTPClient()
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+
+        for worker in self.workers:
+            worker.start()
+        server = Application(
+            [(f"/{url_path}", WebhookHandler, {"ingress": self})]
+        ).listen(
+            port,
+            address=listen,
+            ssl_options={"certfile": cert, "keyfile": key} if cert else None,
+        )
+        watcher = asyncio.create_task(self.watch_workers())
+        try:
+            await self.set_webhook(f"{webhook_url.rstrip('/')}/{url_path}")
+            logger.info(
+                f"Ingress on {listen}:{port}/{url_path}, {self.worker_count} workers"
+            )
+            await stop.wait()
+        finally:
+            watcher.cancel()
+            server.stop()
+            for worker in self.workers:
+                worker.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(Ingress().run())
@@ -0,0 +1,77 @@
+"""Compare Bot API client settings under concurrent outgoing calls
+
+Starts tools/fake_telegram.py in-process with a simulated round trip time
+and fires a burst of concurrent sendMessage calls, the way a broadcast or a
+round of admin notifications does, through a Bot using each HTTPXRequest
+configuration: a deliberately small pool, PTB's defaults and the settings
+the bot builds from bot_config and the environment (see build_requests).
+
+    python tools/bench_http.py --calls 500 --latency 0.05
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+from telegram import Bot
+from telegram.error import TimedOut
+from telegram.request import HTTPXRequest
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TOOLS_DIR)
+sys.path.insert(0, os.path.dirname(TOOLS_DIR))
+from fake_telegram import FakeTelegram  # noqa: E402
+
+
+def configured_request():
+    """The outgoing request the bot would build with the default bot_config"""
+    from dnsbot.app import build_requests
+
+    logging.getLogger().setLevel(logging.WARNING)
+    return build_requests()[0]
+
+
+async def measure(name, request, calls, api_port):
+    bot = Bot("1:fake", base_url=f"http://127.0.0.1:{api_port}/bot", request=request)
+    async with bot:
+
+        async def send(index):
+            try:
+                await bot.send_message(chat_id=100000 + index, text="bench")
+                return True
+            except TimedOut:
+                return False
+
+        started = time.monotonic()
+        results = await asyncio.gather(*(send(index) for index in range(calls)))
+        elapsed = time.monotonic() - started
+    print(
+        f"{name:12} ok={sum(results):<5} timed_out={calls - sum(results):<5} "
+        f"elapsed={elapsed:6.2f}s rate={sum(results) / elapsed:8.1f}/s"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--api-port", type=int, default=8081)
+    args = parser.parse_args()
+
+    fake = FakeTelegram(port=args.api_port, latency=args.latency)
+    await fake.start()
+    try:
+        for name, request in (
+            ("small pool", HTTPXRequest(connection_pool_size=4, pool_timeout=1.0)),
+            ("ptb default", HTTPXRequest()),
+            ("configured", configured_request()),
+        ):
+            await measure(name, request, args.calls, args.api_port)
+    finally:
+        await fake.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
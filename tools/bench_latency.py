@@ -0,0 +1,107 @@
+"""Compare end-to-end update latency between polling and webhook mode
+
+Starts tools/fake_telegram.py in-process, runs main.py against it in a
+scratch directory once per mode, sends /start from a series of new chats and
+measures the time from handing the update to the fake server until the bot's
+sendMessage reply for that chat arrives.
+
+    python tools/bench_latency.py --updates 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_telegram import FakeTelegram  # noqa: E402
+
+MAIN_PY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+
+async def wait_for_call(fake, method, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not any(call[1] == method for call in fake.calls):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Bot never called {method}")
+        await asyncio.sleep(0.05)
+
+
+async def measure(mode, updates, api_port, webhook_port):
+    fake = FakeTelegram(port=api_port)
+    await fake.start()
+    replies = {}  # chat_id -> future resolved on the bot's reply
+
+    def on_call(method, params):
+        if method != "sendmessage":
+            return
+        reply = replies.get(int(params.get("chat_id", 0)))
+        if reply is not None and not reply.done():
+            reply.set_result(time.monotonic())
+
+    fake.listeners.append(on_call)
+
+    env = dict(
+        os.environ,
+        TELEGRAM_BASE_URL=f"http://127.0.0.1:{api_port}",
+        TELEGRAM_BOT_TOKEN="1:fake",
+        BOT_MODE=mode,
+        WEBHOOK_URL=f"http://127.0.0.1:{webhook_port}",
+        WEBHOOK_LISTEN="127.0.0.1",
+        WEBHOOK_PORT=str(webhook_port),
+    )
+    with tempfile.TemporaryDirectory() as workdir:
+        bot = subprocess.Popen(
+            [sys.executable, MAIN_PY],
+            cwd=workdir,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            await wait_for_call(fake, "setwebhook" if mode == "webhook" else "getupdates")
+            if mode == "webhook":
+                await asyncio.sleep(0.5)  # let the HTTP server finish binding
+
+            latencies = []
+            loop = asyncio.get_running_loop()
+            for index in range(updates):
+                chat_id = 100000 + index
+                replies[chat_id] = loop.create_future()
+                sent_at = time.monotonic()
+                await fake.push_update(fake.make_message_update(chat_id, "/start"))
+                replied_at = await asyncio.wait_for(replies[chat_id], 10)
+                latencies.append((replied_at - sent_at) * 1000)
+        finally:
+            bot.terminate()
+            bot.wait(10)
+            await fake.stop()
+    return latencies
+
+
+def summarize(mode, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(
+        f"{mode:8} n={len(latencies):<5} mean={statistics.mean(latencies):7.2f}ms "
+        f"p50={statistics.median(latencies):7.2f}ms p95={p95:7.2f}ms "
+        f"max={latencies[-1]:7.2f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=100)
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--webhook-port", type=int, default=8443)
+    args = parser.parse_args()
+
+    for mode in ("polling", "webhook"):
+        summarize(mode, await measure(mode, args.updates, args.api_port, args.webhook_port))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,137 @@
+"""Track startup time and time-to-first-update as the user data grows
+
+For each size, writes a synthetic user_data.json to a scratch directory,
+queues a /start update on tools/fake_telegram.py and starts main.py; the
+time from spawning the process to the bot's reply is the time to first
+update. Each size is started twice: cold (no derived files yet, so warm-up
+has to rebuild rollups and revenue facts) and warm (files from the first
+run are read back). Warm-up is done when the bot logs that it finished.
+
+    python tools/bench_startup.py --sizes 1000 10000 100000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_telegram import FakeTelegram  # noqa: E402
+
+MAIN_PY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+WARM_UP_DONE_LOG = "Warm-up finished"
+FIRST_USER_ID = 1000000
+
+
+def make_user_data(users, seed=1):
+    """Users who joined over two years, each with zero to three services"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    data = {}
+    for index in range(users):
+        joined_at = now - timedelta(days=rng.randint(0, 700))
+        services = []
+        for number in range(rng.choice((0, 0, 1, 1, 2, 3))):
+            purchased = joined_at + timedelta(days=rng.randint(0, 300))
+            services.append(
+                {
+                    "location": rng.choice(("singapore", "germany")),
+                    "address": f"5.222.{number}.{index % 250}\n2a01:4ff:2f2::{index:x}:{number}",
+                    "purchase_date": purchased.isoformat(),
+                    "expiration_date": (purchased + timedelta(days=30)).isoformat(),
+                    "amount": 30000,
+                    "currency": "IRT",
+                }
+            )
+        data[str(FIRST_USER_ID + index)] = {
+            "username": f"user{index}",
+            "balance": rng.randint(0, 100000),
+            "services": services,
+            "joined_at": joined_at.isoformat(),
+        }
+    data["pending_payments"] = {}
+    return data
+
+
+async def first_update(main_py, workdir, api_port, wait_for_warm_up):
+    fake = FakeTelegram(port=api_port)
+    await fake.start()
+    replied = asyncio.get_running_loop().create_future()
+
+    def on_call(method, params):
+        if method == "sendmessage" and not replied.done():
+            replied.set_result(time.monotonic())
+
+    fake.listeners.append(on_call)
+    # An existing user: a new one would also time saving the whole user file
+    await fake.push_update(fake.make_message_update(FIRST_USER_ID, "/start"))
+    env = dict(
+        os.environ,
+        TELEGRAM_BASE_URL=f"http://127.0.0.1:{api_port}",
+        TELEGRAM_BOT_TOKEN="1:fake",
+        BOT_MODE="polling",
+    )
+    started = time.monotonic()
+    bot = subprocess.Popen(
+        [sys.executable, main_py],
+        cwd=workdir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    # The bot logs to stderr; watch it for the end of warm-up
+    loop = asyncio.get_running_loop()
+    warm_up_done = loop.create_future()
+
+    def read_log():
+        for line in bot.stderr:
+            if WARM_UP_DONE_LOG in line.decode(errors="replace") and not warm_up_done.done():
+                loop.call_soon_threadsafe(warm_up_done.set_result, time.monotonic())
+
+    log_reader = loop.run_in_executor(None, read_log)
+    try:
+        first_reply = await asyncio.wait_for(replied, 300) - started
+        warmed_up = (
+            await asyncio.wait_for(warm_up_done, 300) - started if wait_for_warm_up else None
+        )
+    finally:
+        bot.terminate()
+        bot.wait(30)
+        await log_reader
+        await fake.stop()
+    return first_reply, warmed_up
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument(
+        "--main", default=MAIN_PY, help="main.py to start, e.g. from an older checkout"
+    )
+    parser.add_argument(
+        "--no-warm-up", action="store_true", help="for versions without background warm-up"
+    )
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as workdir:
+            with open(os.path.join(workdir, "user_data.json"), "w", encoding="utf-8") as file:
+                json.dump(make_user_data(size), file)
+            for run in ("cold", "warm"):
+                first_reply, warmed_up = await first_update(
+                    args.main, workdir, args.api_port, not args.no_warm_up
+                )
+                line = f"{size:>8} users {run}: first update {first_reply:6.2f}s"
+                if warmed_up is not None:
+                    line += f", warm-up done {warmed_up:6.2f}s"
+                print(line)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,223 @@
+"""Minimal offline stand-in for the Telegram Bot API
+
+Serves just enough of the Bot API for the bot to start and answer messages,
+so polling and webhook modes can be exercised without network access:
+
+    python tools/fake_telegram.py --port 8081
+    TELEGRAM_BASE_URL=http://127.0.0.1:8081 TELEGRAM_BOT_TOKEN=1:fake python main.py
+
+Updates are queued with FakeTelegram.push_update(); they are handed out by
+getUpdates or, once the bot has called setWebhook, POSTed to the webhook with
+the secret token header. From outside the process, POST
+{"chat_id": ..., "text": ...} as JSON to /fake/message. Every outgoing call
+the bot makes is recorded in FakeTelegram.calls with its arrival time.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+BOT_USER = {
+    "id": 1,
+    "is_bot": True,
+    "first_name": "Fake",
+    "username": "fake_bot",
+    "can_join_groups": True,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": False,
+}
+
+
+class FakeTelegram:
+    def __init__(self, host="127.0.0.1", port=8081, latency=0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency  # seconds added to every call except getUpdates
+        self.calls = []  # (monotonic time, method, params)
+        self.webhook_url = None
+        self.webhook_secret = None
+        self._updates = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._new_update = asyncio.Event()
+        self._server = None
+        self.listeners = []  # callables(method, params) run on every call
+
+    async def start(self):
+        # A large backlog so bursts of new connections aren't refused and retried
+        self._server = await asyncio.start_server(
+            self._handle, self.host, self.port, backlog=1024
+        )
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    # Updates
+    def make_message_update(self, chat_id, text, user_id=None):
+        user = {"id": user_id or chat_id, "is_bot": False, "first_name": "User"}
+        return {
+            "update_id": next(self._update_ids),
+            "message": {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": user,
+                "text": text,
+                "entities": (
+                    [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+                    if text.startswith("/")
+                    else []
+                ),
+            },
+        }
+
+    async def push_update(self, update):
+        if self.webhook_url:
+            await self._post_webhook(update)
+        else:
+            self._updates.append(update)
+            self._new_update.set()
+
+    async def _post_webhook(self, update):
+        url = urlsplit(self.webhook_url)
+        body = json.dumps(update).encode()
+        reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+        headers = [
+            f"POST {url.path or '/'} HTTP/1.1",
+            f"Host: {url.netloc}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(body)}",
+            "Connection: close",
+        ]
+        if self.webhook_secret:
+            headers.append(f"X-Telegram-Bot-Api-Secret-Token: {self.webhook_secret}")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+        await reader.read()
+        writer.close()
+
+    # Bot API methods
+    async def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(
+                    self._new_update.wait(), float(params.get("timeout") or 0)
+                )
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[: int(params.get("limit") or 100)]
+
+    def _message(self, params):
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id") or 0), "type": "private"},
+            "from": BOT_USER,
+            "text": params.get("text", ""),
+        }
+
+    async def call(self, method, params):
+        method = method.lower()
+        self.calls.append((time.monotonic(), method, params))
+        for listener in self.listeners:
+            listener(method, params)
+        if method == "getme":
+            return BOT_USER
+        if method == "getupdates":
+            return await self._get_updates(params)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method == "setwebhook":
+            self.webhook_url = params.get("url")
+            self.webhook_secret = params.get("secret_token")
+            return True
+        if method == "deletewebhook":
+            self.webhook_url = self.webhook_secret = None
+            return True
+        if method in ("sendmessage", "editmessagetext", "senddocument", "sendphoto"):
+            return self._message(params)
+        return True
+
+    # HTTP
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, target, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode().strip()
+                    if not line:
+                        break
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                params = self._parse_params(headers.get("content-type", ""), body)
+                if target == "/fake/message":
+                    # Control endpoint: {"chat_id": ..., "text": ...} becomes an update
+                    update = self.make_message_update(params["chat_id"], params["text"])
+                    await self.push_update(update)
+                    result = update
+                else:
+                    method = target.rstrip("/").rsplit("/", 1)[-1]
+                    result = await self.call(method, params)
+                payload = json.dumps({"ok": True, "result": result}).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(payload)}\r\n\r\n".encode()
+                    + payload
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # Client went away, or the server is stopping mid long-poll
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _parse_params(content_type, body):
+        if not body:
+            return {}
+        if content_type.startswith("application/json"):
+            return json.loads(body)
+        if content_type.startswith("multipart/form-data"):
+            # Files aren't needed for the benchmark; keep the text fields only
+            boundary = content_type.split("boundary=", 1)[1].encode()
+            params = {}
+            for part in body.split(b"--" + boundary):
+                head, _, value = part.partition(b"\r\n\r\n")
+                if b'name="' in head and b"filename=" not in head:
+                    name = head.split(b'name="', 1)[1].split(b'"', 1)[0].decode()
+                    params[name] = value.rstrip(b"\r\n").decode(errors="replace")
+            return params
+        params = dict(parse_qsl(body.decode()))
+        for name, value in params.items():
+            try:
+                params[name] = json.loads(value)
+            except ValueError:
+                pass
+        return params
+
+
+async def serve(host, port, latency):
+    fake = FakeTelegram(host, port, latency)
+    await fake.start()
+    print(f"Fake Telegram listening on http://{host}:{port}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.latency))
@@ -0,0 +1,113 @@
+"""Run the sharded setup end to end against the fake Bot API
+
+Starts tools/fake_telegram.py in-process and ingress.py with a few workers
+in a scratch directory, sends /start from a series of new users through the
+webhook and checks that every user got a reply and was stored in the shared
+database, then reports the reply latency.
+
+    python tools/sharded_smoke.py --workers 3 --users 60
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_latency import wait_for_call  # noqa: E402
+from fake_telegram import FakeTelegram  # noqa: E402
+
+INGRESS_PY = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ingress.py"
+)
+
+
+async def run(workers, users, api_port, webhook_port):
+    fake = FakeTelegram(port=api_port)
+    await fake.start()
+    replies = {}  # chat_id -> future resolved on the bot's first reply
+
+    def on_call(method, params):
+        if method != "sendmessage":
+            return
+        reply = replies.get(int(params.get("chat_id", 0)))
+        if reply is not None and not reply.done():
+            reply.set_result(time.monotonic())
+
+    fake.listeners.append(on_call)
+
+    env = dict(
+        os.environ,
+        TELEGRAM_BASE_URL=f"http://127.0.0.1:{api_port}",
+        TELEGRAM_BOT_TOKEN="1:fake",
+        WEBHOOK_URL=f"http://127.0.0.1:{webhook_port}",
+        WEBHOOK_LISTEN="127.0.0.1",
+        WEBHOOK_PORT=str(webhook_port),
+        WORKERS=str(workers),
+        STORAGE_URL="sqlite:bot.db",
+    )
+    with tempfile.TemporaryDirectory() as workdir:
+        ingress = subprocess.Popen(
+            [sys.executable, INGRESS_PY],
+            cwd=workdir,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            await wait_for_call(fake, "setwebhook")
+            # Every worker calls getMe when it initializes
+            deadline = time.monotonic() + 30
+            while sum(call[1] == "getme" for call in fake.calls) < workers:
+                if time.monotonic() > deadline:
+                    raise TimeoutError("Workers did not start")
+                await asyncio.sleep(0.1)
+            await asyncio.sleep(1)  # let the last worker bind its port
+
+            latencies = []
+            loop = asyncio.get_running_loop()
+            for index in range(users):
+                chat_id = 200000 + index
+                replies[chat_id] = loop.create_future()
+                sent_at = time.monotonic()
+                await fake.push_update(fake.make_message_update(chat_id, "/start"))
+                replied_at = await asyncio.wait_for(replies[chat_id], 10)
+                latencies.append((replied_at - sent_at) * 1000)
+
+            with sqlite3.connect(os.path.join(workdir, "bot.db")) as db:
+                stored = {int(row[0]) for row in db.execute("SELECT user_id FROM users")}
+            missing = set(replies) - stored
+            if missing:
+                raise AssertionError(f"{len(missing)} users were not stored: {sorted(missing)[:5]}")
+            for index in range(workers):
+                local = os.path.join(workdir, f"worker{index}")
+                print(f"worker {index}: local files {sorted(os.listdir(local))}")
+        finally:
+            ingress.terminate()
+            ingress.wait(30)
+            await fake.stop()
+
+    latencies.sort()
+    print(
+        f"{users} users over {workers} workers, all replied and stored: "
+        f"p50={statistics.median(latencies):.2f}ms "
+        f"p95={latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]:.2f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--users", type=int, default=60)
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--webhook-port", type=int, default=8443)
+    args = parser.parse_args()
+    await run(args.workers, args.users, args.api_port, args.webhook_port)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())